@@ -30,6 +30,8 @@ class CrawlRequest(BaseModel):
     allowSubdomains: bool = Field(default=False)
     delay: int = Field(default=250)
     maxConcurrency: int = Field(default=5)
+    priorityPaths: Optional[Dict[str, float]] = Field(default=None)  # path regex -> crawl priority weight
+    workers: int = Field(default=1, ge=1, le=32)  # shard tasks the crawl is spread over across the worker fleet
     webhook: Optional[Dict[str, Any]] = Field(default=None)
     scrapeOptions: Optional[Dict[str, Any]] = Field(default=None)
 
@@ -68,7 +70,10 @@ async def start_crawl(
         ignore_query_params=request.ignoreQueryParameters,
         scrape_options=request.scrapeOptions,
         delay_ms=request.delay,
-        max_concurrency=request.maxConcurrency
+        max_concurrency=request.maxConcurrency,
+        priority_paths=request.priorityPaths,
+        workers=request.workers,
+        project_id=str(crawl_job.project_id) if crawl_job.project_id else None
     )
     
     return {
@@ -69,7 +69,7 @@ async def tools_list() -> Result:
                     },
                     "waitFor": {
                         "type": "number",
-                        "description": "Milliseconds to wait after page load"
+                        "description": "Maximum milliseconds to wait for the page to settle after load"
                     }
                 }
             }
@@ -24,7 +24,7 @@ class ScrapeRequest(BaseModel):
     includeTags: Optional[List[str]] = Field(default=None, description="HTML tags to include")
     excludeTags: Optional[List[str]] = Field(default=None, description="HTML tags to exclude")
     headers: Optional[Dict[str, str]] = Field(default=None, description="Custom headers")
-    waitFor: Optional[int] = Field(default=None, description="Wait time in milliseconds")
+    waitFor: Optional[int] = Field(default=None, description="Maximum milliseconds to wait for the page to settle after load")
     mobile: bool = Field(default=False, description="Use mobile viewport")
     timeout: int = Field(default=30000, description="Timeout in milliseconds")
     maxAge: int = Field(default=172800000, description="Cache max age in milliseconds")
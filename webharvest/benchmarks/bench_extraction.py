@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Extraction benchmarks
+Times ContentExtractor operations over the pinned HTML corpus and reports throughput and peak memory as JSON
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCHMARKS_DIR, "corpus")
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "worker"))
+
+from app.scraping.extractor import ContentExtractor, STREAMING_MARKDOWN_MIN_CHARS, extract_content
+
+# Bump when results stop being comparable with earlier runs
+RESULTS_VERSION = 1
+
+OPERATIONS: Dict[str, Callable[[str, str], Any]] = {
+    "extract_metadata": lambda html, url: ContentExtractor.extract_metadata(html, url),
+    "extract_main_content": lambda html, url: ContentExtractor.extract_main_content(html, url),
+    "html_to_markdown": lambda html, url: ContentExtractor.html_to_markdown(html, url),
+    "extract_links": lambda html, url: ContentExtractor.extract_links(html, url),
+    "extract_images": lambda html, url: ContentExtractor.extract_images(html, url),
+    # The whole scrape pipeline, sharing one parse between steps
+    "extract_content": lambda html, url: extract_content(html, url, ["markdown", "links", "images"]),
+}
+
+
+def load_corpus(names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Load corpus pages, checking each against its pinned hash
+    
+    Args:
+        names: Page names to load (all when omitted)
+        
+    Returns:
+        Manifest entries with the page HTML under "html"
+    """
+    with open(os.path.join(CORPUS_DIR, "manifest.json")) as f:
+        manifest = json.load(f)
+    
+    pages = []
+    for entry in manifest["pages"]:
+        if names and entry["name"] not in names:
+            continue
+        with open(os.path.join(CORPUS_DIR, entry["file"]), "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise SystemExit(f"Corpus page {entry['file']} does not match its pinned sha256")
+        pages.append({**entry, "html": data.decode("utf-8")})
+    return pages
+
+
+def corpus_digest() -> str:
+    """Hash of the manifest, identifying the corpus a result was measured on"""
+    with open(os.path.join(CORPUS_DIR, "manifest.json"), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def time_operation(operation: str, html: str, url: str, repeat: int, min_time: float) -> List[float]:
+    """
+    Time an operation on one page
+    
+    Runs at least repeat times, and until min_time seconds have been spent.
+    
+    Returns:
+        Wall time of each run in seconds
+    """
+    function = OPERATIONS[operation]
+    function(html, url)  # warm-up: imports, regex compilation, caches
+    
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or time.perf_counter() - started < min_time:
+        run_started = time.perf_counter()
+        function(html, url)
+        timings.append(time.perf_counter() - run_started)
+    return timings
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak resident set size for this process (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_kb(field: str) -> int:
+    """VmRSS (current) or VmHWM (peak) resident set size in kilobytes"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def measure_memory(operation: str, page_name: str) -> Dict[str, Optional[int]]:
+    """
+    Peak memory of one run of an operation, in a fresh process
+    
+    lxml allocates outside the Python heap, so growth of the resident set is
+    reported along with the tracemalloc peak. RSS growth needs Linux and is
+    None elsewhere.
+    """
+    page = load_corpus([page_name])[0]
+    html, url = page["html"], page["url"]
+    function = OPERATIONS[operation]
+    
+    rss_growth = None
+    if _reset_peak_rss():
+        baseline_rss = _rss_kb("VmRSS")
+        function(html, url)
+        rss_growth = _rss_kb("VmHWM") - baseline_rss
+    
+    tracemalloc.start()
+    function(html, url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {"peak_python_kb": peak // 1024, "peak_rss_growth_kb": rss_growth}
+
+
+def environment() -> Dict[str, Any]:
+    """Versions and settings that affect results"""
+    import lxml
+    from importlib.metadata import version
+    
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "lxml": lxml.__version__,
+        "readability-lxml": version("readability-lxml"),
+        "markdownify": version("markdownify"),
+        "commit": commit,
+        "streaming_markdown_min_chars": STREAMING_MARKDOWN_MIN_CHARS,
+    }
+
+
+def run(
+    pages: List[Dict[str, Any]],
+    operations: List[str],
+    repeat: int,
+    min_time: float,
+    memory: bool
+) -> List[Dict[str, Any]]:
+    """
+    Benchmark every operation on every page
+    
+    Returns:
+        One result per page and operation
+    """
+    results = []
+    pool = None
+    if memory:
+        # A process per measurement, so earlier runs don't hide this one's peak
+        pool = multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1)
+    
+    try:
+        for page in pages:
+            for operation in operations:
+                timings = time_operation(operation, page["html"], page["url"], repeat, min_time)
+                median = statistics.median(timings)
+                result = {
+                    "page": page["name"],
+                    "category": page["category"],
+                    "bytes": page["bytes"],
+                    "operation": operation,
+                    "runs": len(timings),
+                    "median_ms": round(median * 1000, 3),
+                    "min_ms": round(min(timings) * 1000, 3),
+                    "max_ms": round(max(timings) * 1000, 3),
+                    "mb_per_s": round(page["bytes"] / median / 1e6, 3) if median else None,
+                }
+                if pool:
+                    result.update(pool.apply(measure_memory, (operation, page["name"])))
+                results.append(result)
+                print(_format_row(result), file=sys.stderr)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    Compare results with an earlier run
+    
+    Args:
+        results: Results of this run
+        baseline: An earlier run's JSON output
+        max_regression: Allowed slowdown or memory growth as a fraction (0.25 = 25%)
+        
+    Returns:
+        Descriptions of the measurements that regressed beyond max_regression
+    """
+    previous = {(r["page"], r["operation"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["page"], result["operation"]))
+        if not before:
+            continue
+        for metric in ("median_ms", "peak_python_kb", "peak_rss_growth_kb"):
+            old, new = before.get(metric), result.get(metric)
+            # Tiny values are dominated by noise
+            if not old or new is None or old < 1:
+                continue
+            ratio = new / old
+            if ratio > 1 + max_regression:
+                regressions.append(
+                    f"{result['page']} {result['operation']} {metric}: {old} -> {new} ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def _format_row(result: Dict[str, Any]) -> str:
+    memory = ""
+    if "peak_python_kb" in result:
+        rss = result["peak_rss_growth_kb"]
+        memory = f"  py {result['peak_python_kb']:>8} KB  rss +{rss if rss is not None else '-':>7} KB"
+    return (
+        f"{result['page']:<20} {result['operation']:<22} {result['median_ms']:>10.2f} ms"
+        f"  {result['mb_per_s'] or 0:>8.2f} MB/s{memory}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ContentExtractor on the pinned HTML corpus")
+    parser.add_argument("--page", action="append", help="Corpus page to run (repeatable; default all)")
+    parser.add_argument("--operation", action="append", choices=sorted(OPERATIONS),
+                        help="Operation to run (repeatable; default all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Minimum timed runs per measurement")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds spent per measurement")
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory measurement")
+    parser.add_argument("--output", help="Write JSON results to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Fail when a measurement is this much worse than --compare (default 0.25)")
+    args = parser.parse_args(argv)
+    
+    pages = load_corpus(args.page)
+    if args.page and len(pages) != len(set(args.page)):
+        parser.error(f"unknown page; choose from the names in {os.path.join(CORPUS_DIR, 'manifest.json')}")
+    operations = args.operation or list(OPERATIONS)
+    
+    results = run(pages, operations, args.repeat, args.min_time, not args.no_memory)
+    report = {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "corpus": corpus_digest(),
+        "environment": environment(),
+        "settings": {"repeat": args.repeat, "min_time": args.min_time},
+        "results": results,
+    }
+    
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != report["corpus"]:
+            print("Warning: baseline was measured on a different corpus", file=sys.stderr)
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -46,6 +46,400 @@ class TestWebScraper:
             assert "markdown" in result["data"]
             assert result["data"]["metadata"]["statusCode"] == 200
 
+class TestBrowserPool:
+    """Test browser pool context reuse"""
+    
+    def test_context_key(self):
+        """Test contexts are shared only between equivalent options"""
+        from worker.app.scraping.browser import BrowserPool
+        
+        key = BrowserPool.context_key(headers={"X-A": "1", "X-B": "2"})
+        
+        # Header order doesn't matter
+        assert key == BrowserPool.context_key(headers={"X-B": "2", "X-A": "1"})
+        
+        # Different viewport or cookie jar gets its own context
+        assert key != BrowserPool.context_key(mobile=True, headers={"X-A": "1", "X-B": "2"})
+        assert key != BrowserPool.context_key(
+            headers={"X-A": "1", "X-B": "2"},
+            cookies=[{"name": "session", "value": "abc", "url": "https://example.com"}]
+        )
+    
+    def test_blocking_profiles(self):
+        """Test profile selection and the tracker blocklist"""
+        from worker.app.scraping.blocking import select_profile, is_tracker, ResourceBlocker
+        
+        assert select_profile(["markdown"]).name == "text-only"
+        assert select_profile(["markdown", "screenshot"]).name == "layout"
+        assert select_profile(["markdown"], profile="full").name == "full"
+        assert select_profile(["markdown"], block_resources=["image"]).resource_types == {"image"}
+        
+        assert is_tracker("https://www.google-analytics.com/g/collect")
+        assert not is_tracker("https://example.com/app.js")
+        
+        blocker = ResourceBlocker(select_profile(["markdown"]))
+        assert blocker.should_block("https://example.com/logo.png", "image") == (True, False)
+        assert blocker.should_block("https://connect.facebook.net/sdk.js", "script") == (True, True)
+        assert blocker.should_block("https://example.com/", "document") == (False, False)
+    
+    def test_asset_cache_freshness(self):
+        """Test Cache-Control handling for cached subresources"""
+        from worker.app.scraping.asset_cache import freshness_lifetime
+        
+        assert freshness_lifetime({"cache-control": "public, max-age=600"}) == 600
+        assert freshness_lifetime({"cache-control": "max-age=600, s-maxage=60"}) == 60
+        assert freshness_lifetime({"cache-control": "no-cache"}) == 0
+        assert freshness_lifetime({"cache-control": "no-store"}) is None
+        assert freshness_lifetime({"cache-control": "private, max-age=600"}) is None
+        assert freshness_lifetime({}) is None
+    
+    def test_asset_cache_skips_credentialed(self, tmp_path):
+        """Test responses to requests with credentials are only stored when explicitly public"""
+        from worker.app.scraping.asset_cache import AssetCache
+        
+        cache = AssetCache(directory=str(tmp_path))
+        url = "https://example.com/avatar.png"
+        headers = {"Cache-Control": "max-age=600"}
+        
+        assert cache._cacheable(url, 200, headers, 10, {"user-agent": "x"})
+        assert cache._cacheable(url, 200, headers, 10, {"Cookie": "session=abc"}) is None
+        assert cache._cacheable(url, 200, headers, 10, {"authorization": "Bearer t"}) is None
+        assert cache._cacheable(url, 200, {"Cache-Control": "public, max-age=600"}, 10, {"cookie": "a=b"})
+        assert cache._cacheable(url, 200, {"Cache-Control": "s-maxage=600"}, 10, {"cookie": "a=b"})
+    
+    def test_pooled_context_reset_clears_storage(self):
+        """Test a reused context starts with no storage from the origins the last scrape visited"""
+        from unittest.mock import AsyncMock, MagicMock
+        from worker.app.scraping.browser import PooledContext
+        
+        old_page, new_page = MagicMock(), MagicMock()
+        old_page.close = AsyncMock()
+        session = MagicMock(send=AsyncMock(), detach=AsyncMock())
+        context = MagicMock(pages=[old_page])
+        context.new_cdp_session = AsyncMock(return_value=session)
+        for method in ("clear_cookies", "clear_permissions", "add_cookies"):
+            setattr(context, method, AsyncMock())
+        browser = MagicMock()
+        browser.browser.browser_type.name = "chromium"
+        browser.create_page = AsyncMock(return_value=new_page)
+        
+        cookies = [{"name": "session", "value": "abc", "url": "https://example.com"}]
+        pooled = PooledContext(browser, context, old_page, (), cookies)
+        handlers = {call.args[0]: call.args[1] for call in old_page.on.call_args_list}
+        handlers["framenavigated"](MagicMock(url="https://example.com/login"))
+        handlers["framenavigated"](MagicMock(url="https://cdn.example.net:8443/frame"))
+        handlers["framenavigated"](MagicMock(url="about:blank"))
+        
+        assert asyncio.run(pooled.reset())
+        cleared = {call.args[1]["origin"] for call in session.send.call_args_list}
+        assert cleared == {"https://example.com", "https://cdn.example.net:8443"}
+        assert all(call.args[1]["storageTypes"] == "all" for call in session.send.call_args_list)
+        assert not pooled.origins
+        
+        # A new tab, so sessionStorage goes too; the caller's cookies are put back
+        old_page.close.assert_awaited()
+        assert pooled.page is new_page
+        context.add_cookies.assert_awaited_with(cookies)
+        
+        # Without CDP storage can't be cleared, so the context isn't reused
+        browser.browser.browser_type.name = "firefox"
+        assert not asyncio.run(pooled.reset())
+    
+    def test_browser_pool_health(self):
+        """Test only browser faults count towards recycling, and slot totals agree"""
+        from unittest.mock import AsyncMock, MagicMock
+        from worker.app.scraping.browser import BrowserPool, BrowserHealth, is_browser_fault
+        
+        assert is_browser_fault(Exception("Target page, context or browser has been closed"))
+        assert is_browser_fault(Exception("Protocol error (Page.navigate): Session closed"))
+        assert not is_browser_fault(Exception("page.click: Timeout 5000ms exceeded waiting for selector"))
+        
+        pool = BrowserPool(size=2, pages_per_browser=3)
+        browser = MagicMock()
+        pool.browsers.append(browser)
+        pool.leases[browser] = 1
+        pool.idle_contexts[browser] = []
+        pool.health[browser] = health = BrowserHealth()
+        pool.max_consecutive_failures = 2
+        pool._schedule_retire = MagicMock()
+        
+        # Slots are counted at the pool's full size everywhere, even while a browser is missing
+        assert pool.slots_total == pool.stats()["slots_total"] == 6
+        
+        def release(**kwargs):
+            pooled = MagicMock(browser=browser, crashed=False, pages_served=0)
+            pooled.close = AsyncMock()
+            pooled.reset = AsyncMock(return_value=True)
+            pool.leases[browser] += 1
+            asyncio.run(pool.release_context(pooled, **kwargs))
+            return pooled
+        
+        # A page-level error discards the context without counting against the browser
+        release(reusable=False).close.assert_awaited()
+        assert health.consecutive_failures == 0
+        
+        release(reusable=False, browser_fault=True)
+        release(reusable=True)
+        assert health.consecutive_failures == 0
+        pool._schedule_retire.assert_not_called()
+        
+        release(reusable=False, browser_fault=True)
+        release(reusable=False, browser_fault=True)
+        pool._schedule_retire.assert_called_once_with(browser, "2 consecutive failures")
+        assert health.pages_served == 5
+    
+    def test_browser_pool_acquire_without_browsers(self):
+        """Test acquire fails instead of waiting forever when no browser can be launched"""
+        from unittest.mock import AsyncMock, MagicMock
+        from worker.app.scraping.browser import BrowserPool, BrowserHealth
+        
+        pool = BrowserPool(size=1, pages_per_browser=1)
+        pool._started = True
+        pool._add_browser = AsyncMock(side_effect=RuntimeError("launch failed"))
+        
+        # The only browser is retiring and its replacement failed
+        retired = MagicMock()
+        pool.browsers.append(retired)
+        pool.leases[retired] = 0
+        pool.health[retired] = BrowserHealth()
+        pool.health[retired].retiring = True
+        
+        with pytest.raises(RuntimeError, match="launch failed"):
+            asyncio.run(pool.acquire())
+        
+        # A full pool gives up after acquire_timeout
+        pool.health[retired].retiring = False
+        pool.leases[retired] = 1
+        pool.acquire_timeout = 0.05
+        with pytest.raises(RuntimeError, match="No browser page slot free"):
+            asyncio.run(pool.acquire())
+    
+    def test_browser_pool_prewarm_failure(self):
+        """Test a browser whose prewarm context fails is closed and not left in the pool"""
+        from unittest.mock import AsyncMock, MagicMock
+        from worker.app.scraping import browser as browser_module
+        from worker.app.scraping.browser import BrowserPool
+        
+        launched = MagicMock(start=AsyncMock(), stop=AsyncMock())
+        pool = BrowserPool(size=1)
+        pool.prewarm_contexts = True
+        pool._create_pooled_context = AsyncMock(side_effect=RuntimeError("context failed"))
+        
+        with patch.object(browser_module, "BrowserManager", return_value=launched):
+            with pytest.raises(RuntimeError, match="context failed"):
+                asyncio.run(pool._add_browser())
+        
+        launched.stop.assert_awaited_once()
+        assert pool.browsers == [] and pool.health == {} and pool.idle_contexts == {} and pool.leases == {}
+    
+    class FakePage:
+        """Page stand-in whose DOM mutates for a while after load"""
+        
+        def __init__(self, busy_for: float):
+            self.listeners = {}
+            self.loaded_at = None
+            self.busy_for = busy_for
+        
+        def on(self, event, handler):
+            self.listeners[event] = handler
+        
+        def remove_listener(self, event, handler):
+            self.listeners.pop(event, None)
+        
+        async def goto(self, url, wait_until=None, timeout=None):
+            import time
+            self.loaded_at = time.monotonic()
+            return "response"
+        
+        async def evaluate(self, script):
+            import time
+            elapsed_ms = (time.monotonic() - self.loaded_at) * 1000
+            # Mutating until busy_for, quiet since then
+            return {"readyState": "complete", "quietFor": max(0.0, elapsed_ms - self.busy_for * 1000)}
+    
+    def test_readiness_settles_before_cap(self):
+        """Test a page that goes quiet is ready well before the wait cap"""
+        from worker.app.scraping.readiness import PageReadiness
+        
+        readiness = PageReadiness(quiet_ms=50, max_wait_ms=2000, poll_ms=10)
+        result = asyncio.run(readiness.goto(self.FakePage(busy_for=0.1), "https://example.com/"))
+        assert result["response"] == "response"
+        assert result["settled"]
+        assert 140 <= result["timings"]["readiness"] < 1000
+    
+    def test_readiness_wait_cap(self):
+        """Test a page that never goes quiet is given up on at the cap, and waitFor lowers the cap"""
+        from worker.app.scraping.readiness import PageReadiness
+        
+        readiness = PageReadiness(quiet_ms=50, max_wait_ms=300, poll_ms=10)
+        result = asyncio.run(readiness.goto(self.FakePage(busy_for=60), "https://example.com/"))
+        assert not result["settled"]
+        assert 300 <= result["timings"]["readiness"] < 600
+        
+        # waitFor is an upper bound on settling, not a fixed sleep
+        result = asyncio.run(readiness.goto(self.FakePage(busy_for=60), "https://example.com/", max_wait_ms=100))
+        assert not result["settled"]
+        assert 100 <= result["timings"]["readiness"] < 300
+        result = asyncio.run(readiness.goto(self.FakePage(busy_for=0), "https://example.com/", max_wait_ms=5000))
+        assert result["settled"]
+        assert result["timings"]["readiness"] < 1000
+    
+    def test_readiness_waits_for_requests(self):
+        """Test in-flight requests hold readiness, except beacons and long-polls"""
+        from unittest.mock import MagicMock
+        from worker.app.scraping.readiness import PageReadiness, RequestTracker
+        
+        page = self.FakePage(busy_for=0)
+        tracker = RequestTracker(page, long_request_ms=200)
+        with tracker:
+            api = MagicMock(resource_type="fetch", url="https://example.com/api/items")
+            page.listeners["request"](api)
+            page.listeners["request"](MagicMock(resource_type="xhr", url="https://www.google-analytics.com/g/collect"))
+            page.listeners["request"](MagicMock(resource_type="websocket", url="wss://example.com/live"))
+            assert tracker.active() == 1
+            page.listeners["requestfinished"](api)
+            assert tracker.active() == 0
+        assert page.listeners == {}
+        
+        # An API call started during load keeps the page unsettled until it finishes
+        page = self.FakePage(busy_for=0)
+        request = MagicMock(resource_type="fetch", url="https://example.com/api/items")
+        load = page.goto
+        
+        async def goto(url, wait_until=None, timeout=None):
+            response = await load(url, wait_until, timeout)
+            page.listeners["request"](request)
+            asyncio.get_running_loop().call_later(0.3, page.listeners["requestfinished"], request)
+            return response
+        
+        page.goto = goto
+        readiness = PageReadiness(quiet_ms=50, max_wait_ms=2000, long_request_ms=5000, poll_ms=10)
+        result = asyncio.run(readiness.goto(page, "https://example.com/"))
+        assert result["settled"]
+        assert result["timings"]["readiness"] >= 300
+
+class TestFetchEscalation:
+    """Test HTTP-first fetch escalation heuristics"""
+    
+    def test_static_page_stays_on_http(self):
+        """Test a complete static page doesn't need the browser"""
+        from worker.app.scraping.fetcher import needs_browser
+        
+        html = "<html><body><main><p>" + "Static documentation text. " * 20 + "</p></main></body></html>"
+        assert needs_browser(html, 200, "text/html; charset=utf-8") is None
+    
+    def test_js_pages_escalate(self):
+        """Test pages that render with JavaScript are escalated"""
+        from worker.app.scraping.fetcher import needs_browser
+        
+        spa = '<html><body><div id="root"></div><script src="/app.js"></script></body></html>'
+        assert needs_browser(spa) == "spa_root"
+        
+        wall = "<html><body><noscript>You need to enable JavaScript to run this app.</noscript></body></html>"
+        assert needs_browser(wall) == "noscript_wall"
+        
+        assert needs_browser("") == "empty_body"
+        assert needs_browser("<html></html>", 403) == "status_403"
+    
+    def test_error_pages_stay_on_http(self):
+        """Test dead links and rate limits aren't retried in a browser, unlike challenges"""
+        from worker.app.scraping.fetcher import needs_browser
+        
+        assert needs_browser("<html><body>Not found</body></html>", 404) is None
+        assert needs_browser("", 410) is None
+        assert needs_browser("<html><body>Slow down</body></html>", 429) is None
+        assert needs_browser("<html></html>", 503) is None
+        assert needs_browser("<html><title>Just a moment...</title></html>", 503) == "challenge"
+    
+    def test_documents_skip_browser(self):
+        """Test PDFs, text, JSON and feeds are converted directly"""
+        from worker.app.scraping.documents import document_kind, extract_document
+        
+        assert document_kind("application/pdf") == "pdf"
+        assert document_kind("application/rss+xml; charset=utf-8") == "xml"
+        assert document_kind("application/octet-stream", "https://example.com/manual.pdf") == "pdf"
+        assert document_kind(None, "https://example.com/docs/") is None
+        assert document_kind("text/html; charset=utf-8") is None
+        
+        feed = (
+            b'<?xml version="1.0"?><rss version="2.0"><channel><title>Blog</title>'
+            b'<item><title>First post</title><link>/posts/1</link><description>&lt;p&gt;Hello&lt;/p&gt;</description></item>'
+            b'</channel></rss>'
+        )
+        data = extract_document(feed, "xml", "https://example.com/feed", ["markdown", "links"])
+        assert data["metadata"]["title"] == "Blog"
+        assert data["links"] == ["https://example.com/posts/1"]
+        assert "## [First post](https://example.com/posts/1)" in data["markdown"]
+        
+        data = extract_document(b'{"id": 1}', "json", "https://example.com/api", ["markdown"])
+        assert data["markdown"] == '```json\n{\n  "id": 1\n}\n```'
+        assert data["metadata"]["documentType"] == "json"
+    
+    def test_content_preflight(self):
+        """Test binaries and oversized responses are skipped, and verdicts learned per extension"""
+        from worker.app.scraping.preflight import ContentPreflight, content_policy
+        
+        assert content_policy("https://example.com/", "text/html", 5000, 1000) == "too_large"
+        assert content_policy("https://example.com/v", "video/mp4", None, 1000) == "content_type"
+        assert content_policy("https://example.com/doc.pdf", "application/octet-stream", 500, 1000) is None
+        assert content_policy("https://example.com/", None, None, 1000) is None
+        
+        preflight = ContentPreflight(http_fetcher=None, max_bytes=1000, pattern_threshold=2)
+        assert preflight.cached("https://example.com/setup.exe") == "extension"
+        assert preflight.record("https://example.com/a.dat", "application/x-custom", 10) == "content_type"
+        assert preflight.cached("https://example.com/a.dat") == "content_type"
+        assert preflight.cached("https://example.com/b.dat") is None
+        preflight.record("https://example.com/b.dat", "application/x-custom", 10)
+        # Two of a host's .dat files were binaries, so the rest are skipped without a request
+        assert preflight.cached("https://example.com/c.dat") == "extension"
+        assert preflight.cached("https://other.example.com/c.dat") is None
+    
+    def test_render_tier_learning(self):
+        """Test tiers are learned from content escalations only, and a domain follows most of its pages"""
+        from unittest.mock import AsyncMock, MagicMock
+        from worker.app.scraping.fetcher import FetchResult
+        from worker.app.scraping.render_tiers import majority_tier
+        
+        assert majority_tier({}) is None
+        assert majority_tier({"http": 5, "js": 1}) == "http"
+        assert majority_tier({"http": 1, "static": 3, "js": 2}) == "static"
+        assert majority_tier({"static": 2, "js": 2}) == "static"
+        
+        page = "<html><body><main><p>" + "Static documentation text. " * 20 + "</p></main></body></html>"
+        spa = '<html><body><div id="root"></div><script src="/app.js"></script></body></html>'
+        tier_cache = MagicMock(get=AsyncMock(return_value=None), record=AsyncMock())
+        preflight = MagicMock(check=AsyncMock(return_value=None))
+        scraper = WebScraper(http_fetcher=MagicMock(), tier_cache=tier_cache, preflight=preflight)
+        options = {"formats": ["markdown"]}
+        
+        async def fetch(responses):
+            async def fetch_tier(tier, url, options):
+                response = responses[tier]
+                if isinstance(response, Exception):
+                    raise response
+                html, status_code = response if isinstance(response, tuple) else (response, 200)
+                return FetchResult(url, html, status_code, tier, "text/html")
+            with patch.object(scraper, "_fetch_tier", fetch_tier):
+                return await scraper._fetch("https://example.com/app", None, options)
+        
+        # An HTTP timeout doesn't teach the site to skip HTTP
+        _, tier, escalation = asyncio.run(fetch({"http": TimeoutError("timed out"), "static": page}))
+        assert (tier, escalation) == ("static", "http_error")
+        tier_cache.record.assert_not_awaited()
+        
+        # An empty app shell does
+        _, tier, escalation = asyncio.run(fetch({"http": spa, "static": spa, "js": page}))
+        assert (tier, escalation) == ("js", "spa_root")
+        tier_cache.record.assert_awaited_once_with("https://example.com/app", "js")
+        tier_cache.record.reset_mock()
+        
+        # Dead links and status escalations say nothing about rendering
+        fetched, tier, escalation = asyncio.run(fetch({"http": ("<html><body>Not found</body></html>", 404)}))
+        assert (fetched.status_code, tier, escalation) == (404, "http", None)
+        _, tier, escalation = asyncio.run(fetch({"http": ("", 403), "static": ("", 403), "js": page}))
+        assert (tier, escalation) == ("js", "status_403")
+        tier_cache.record.assert_not_awaited()
+
 class TestContentExtractor:
     """Test content extraction functionality"""
     
@@ -110,6 +504,158 @@ class TestContentExtractor:
         assert "https://example.com/style.css" in links
         assert "mailto:test@example.com" not in links
     
+    def test_parsed_document(self):
+        """Test one parsed document serves every extraction step"""
+        html = """
+        <html lang="en">
+        <head><title>Docs</title><link rel="icon" href="/favicon.ico"></head>
+        <body>
+            <nav><a href="/home">Home</a></nav>
+            <p>Text with <a href="/page">a link</a></p>
+            <img src="/logo.png" srcset="/logo-2x.png 2x">
+        </body>
+        </html>
+        """
+        
+        document = ContentExtractor.parse(html, "https://example.com/docs/")
+        
+        assert document.metadata["title"] == "Docs"
+        assert document.metadata["language"] == "en"
+        assert document.metadata["favicon"] == "https://example.com/favicon.ico"
+        assert document.links == [
+            "https://example.com/favicon.ico", "https://example.com/home", "https://example.com/page"
+        ]
+        assert document.images == ["https://example.com/logo.png", "https://example.com/logo-2x.png"]
+        
+        # Filtering works on a copy of the shared tree
+        assert "Home" not in document.filtered_html(exclude_tags=["nav"])
+        assert ContentExtractor.extract_links(document) == document.links
+    
+    def test_extraction_memo_key(self):
+        """Test memo keys change with the HTML and extraction options only"""
+        from worker.app.scraping.extraction_memo import ExtractionMemo
+        
+        html = "<html><body><p>Hello</p></body></html>"
+        key = ExtractionMemo.key(html, "https://example.com", ["markdown"])
+        
+        assert key == ExtractionMemo.key(html, "https://example.com", ["markdown", "screenshot"])
+        assert key != ExtractionMemo.key(html + " ", "https://example.com", ["markdown"])
+        assert key != ExtractionMemo.key(html, "https://example.com", ["markdown", "links"])
+        assert key != ExtractionMemo.key(html, "https://example.com", ["markdown"], only_main_content=False)
+        assert key != ExtractionMemo.key(html, "https://example.com", ["markdown"], exclude_tags=["nav"])
+    
+    def test_streaming_markdown(self):
+        """Test the streaming converter matches markdownify on well-formed HTML"""
+        from worker.app.scraping.markdown_stream import stream_html_to_markdown
+        
+        block = """
+        <h2>Release <em>notes</em></h2>
+        <p>See <a href="/docs/guide">the guide</a> and <a href="https://example.com/x">https://example.com/x</a>.<br>
+        Values like snake_case and 2*3 are escaped.</p>
+        <ol start="3">
+            <li>Third <strong>item</strong></li>
+            <li>Fourth
+                <ul>
+                    <li>Nested <img src="a.png" alt="icon"></li>
+                </ul>
+            </li>
+        </ol>
+        <table>
+            <tr><th>Name</th><th>Value</th></tr>
+            <tr><td>a</td><td><code>1</code></td></tr>
+        </table>
+        <pre><code>def f():
+            return 1</code></pre>
+        <blockquote><p>Quoted</p></blockquote>
+        <hr>
+        """
+        html = f"<html><body>{block}</body></html>"
+        expected = ContentExtractor.html_to_markdown(html, "https://example.com/a/")
+        
+        assert stream_html_to_markdown(html, "https://example.com/a/") == expected
+        assert "[the guide](https://example.com/docs/guide)" in expected
+        assert "1. Third **item**" not in expected and "3. Third **item**" in expected
+        
+        # Large enough to cross the writer's flush boundaries
+        html = f"<html><body>{block * 200}</body></html>"
+        with patch("worker.app.scraping.extractor.STREAMING_MARKDOWN_MIN_CHARS", 10 ** 9):
+            expected = ContentExtractor.html_to_markdown(html, "https://example.com/a/")
+        
+        assert stream_html_to_markdown(html, "https://example.com/a/") == expected
+    
+    def test_boilerplate_template(self):
+        """Test crawl boilerplate is learned from repeated blocks and stripped"""
+        from worker.app.scraping.boilerplate import BoilerplateModel
+        from worker.app.scraping.extractor import extract_content
+        
+        def page(n):
+            return f"""<html><body>
+            <nav><ul><li><a href="/">Home</a></li><li><a href="/blog">Blog archive</a></li></ul></nav>
+            <article><h1>Post {n}</h1><p>{"Unique words for post number %d. " % n * 20}</p></article>
+            <footer><div>Copyright Example Corp, all rights reserved</div></footer>
+            </body></html>"""
+        
+        model = BoilerplateModel(min_pages=3, min_ratio=0.5)
+        for n in range(3):
+            url = f"https://example.com/post/{n}"
+            data = extract_content(page(n), url, ["markdown"], boilerplate=model.template(url))
+            assert data["metadata"]["contentExtraction"] == "readability"
+            model.observe(url, data["blockFingerprints"])
+        
+        # A duplicate page is not counted again
+        model.observe("https://example.com/copy", data["blockFingerprints"])
+        assert model.hosts["example.com"].pages == 3
+        
+        template = model.template("https://example.com/post/3")
+        assert template
+        assert model.template("https://other.example.org/") == frozenset()
+        
+        data = extract_content(page(3), "https://example.com/post/3", ["markdown"], boilerplate=template)
+        assert data["metadata"]["contentExtraction"] == "template"
+        assert "Unique words for post number 3" in data["markdown"]
+        assert "Blog archive" not in data["markdown"]
+        assert "Copyright" not in data["markdown"]
+    
+    def test_near_duplicates(self):
+        """Test near-duplicate pages are found by MinHash within a crawl"""
+        from worker.app.scraping.near_duplicates import NearDuplicateIndex, minhash, similarity
+        
+        words = [f"word{n}" for n in range(300)]
+        original = minhash(" ".join(words))
+        print_view = minhash(" ".join(words[:150] + ["Printed", "on", "Monday"] + words[150:]))
+        other = minhash(" ".join(reversed(words)))
+        
+        assert similarity(original, print_view) >= 0.8
+        assert similarity(original, other) < 0.2
+        assert minhash("Too short to compare") is None
+        
+        index = NearDuplicateIndex(threshold=0.8)
+        assert asyncio.run(index.check("https://example.com/a", original)) is None
+        assert asyncio.run(index.check("https://example.com/a?print=1", print_view)) == "https://example.com/a"
+        assert asyncio.run(index.check("https://example.com/b", other)) is None
+        # A page seen again at the same URL is not its own duplicate
+        assert asyncio.run(index.check("https://example.com/a", original)) is None
+    
+    def test_format_plan(self):
+        """Test only the stages requested outputs need are planned and run"""
+        from worker.app.scraping.format_plan import FormatPlan
+        from worker.app.scraping.extractor import extract_content
+        
+        # Metadata comes from the walk links need, or else from the head alone
+        assert FormatPlan(["links"]).order == ["parse", "walk"]
+        assert FormatPlan(["markdown"]).order == ["parse", "head", "content", "markdown", "contentHash"]
+        assert not FormatPlan(["markdown", "images"]).needs("head")
+        
+        # Raw HTML converts to Markdown without a parse; nothing is left for rawHtml alone
+        assert FormatPlan(["markdown"], only_main_content=False, metadata_fields=[]).order == ["content", "markdown", "contentHash"]
+        assert FormatPlan(["rawHtml", "screenshot"], metadata_fields=[]).order == []
+        
+        html = "<html><head><title>Plan</title><meta name='author' content='A'></head><body><a href='/x'>x</a></body></html>"
+        data = extract_content(html, "https://example.com/", ["links"], metadata_fields=["title"])
+        assert data["metadata"] == {"sourceURL": "https://example.com/", "title": "Plan"}
+        assert data["links"] == ["https://example.com/x"]
+        assert set(data["stageTimings"]) == {"parse", "walk"}
+    
     def test_content_hash(self):
         """Test content hash calculation"""
         extractor = ContentExtractor()
@@ -124,6 +670,68 @@ class TestContentExtractor:
         assert hash1 == hash1_again  # Same content produces same hash
         assert hash1 != hash2  # Different content produces different hash
         assert len(hash1) == 64  # SHA256 produces 64 character hex string
+    
+    def test_extraction_executor_process_pool(self):
+        """Test results and exceptions come back from the extraction process pool"""
+        import math
+        from worker.app.scraping.executor import ExtractionExecutor
+        
+        executor = ExtractionExecutor(workers=1, max_queue=1)
+        
+        async def run():
+            result, timings = await executor.run(math.factorial, 10)
+            with pytest.raises(ValueError):
+                await executor.run(int, "not a number")
+            # The pool survives a job raising
+            again, _ = await executor.run(math.factorial, 5)
+            return result, timings, again
+        
+        try:
+            result, timings, again = asyncio.run(run())
+        finally:
+            executor.shutdown()
+        
+        assert result == 3628800 and again == 120
+        assert set(timings) == {"extractionQueue", "extractionCpu"}
+        assert executor.workers == 1 and executor.pending == 0
+    
+    def test_extraction_executor_thread_fallback(self):
+        """Test extraction runs in threads when no process pool can be started"""
+        import worker.app.scraping.executor as executor_module
+        
+        executor = executor_module.ExtractionExecutor(workers=2, max_queue=1)
+        with patch.object(executor_module, "ProcessPoolExecutor", side_effect=OSError("no semaphores")):
+            result, timings = asyncio.run(executor.run(sorted, [3, 1, 2]))
+        
+        assert result == [1, 2, 3]
+        assert executor.workers == 0 and executor._pool is None
+        assert set(timings) == {"extractionQueue", "extractionCpu"}
+        
+        with pytest.raises(ValueError):
+            asyncio.run(executor.run(int, "not a number"))
+        assert executor.pending == 0
+    
+    def test_extraction_executor_backpressure(self):
+        """Test at most workers + max_queue jobs are in flight and the rest wait"""
+        import time
+        from worker.app.scraping.executor import ExtractionExecutor
+        
+        executor = ExtractionExecutor(workers=0, max_queue=1)
+        in_flight = []
+        
+        async def run():
+            jobs = [asyncio.ensure_future(executor.run(time.sleep, 0.1)) for _ in range(6)]
+            while not all(job.done() for job in jobs):
+                in_flight.append(executor.pending)
+                await asyncio.sleep(0.01)
+            return [job.result()[1] for job in jobs]
+        
+        timings = asyncio.run(run())
+        
+        # One worker slot plus one queued slot
+        assert max(in_flight) == 2
+        # Jobs beyond the bound waited for a slot before starting
+        assert max(t["extractionQueue"] for t in timings) >= 150
 
 class TestURLNormalizer:
     """Test URL normalization"""
@@ -239,6 +847,323 @@ class TestWebCrawler:
             
             # Should not crawl - doesn't match include pattern
             assert await crawler._should_crawl("https://example.com/blog/post") == False
+    
+    def test_crawl_engine(self):
+        """Test the engine keeps max_concurrency pages in flight within depth and page limits"""
+        from worker.app.scraping.crawl_engine import CrawlEngine
+        
+        async def crawl(max_depth, max_pages):
+            crawled = []
+            crawler = WebCrawler(
+                seed_url="https://example.com/0",
+                max_depth=max_depth,
+                max_pages=max_pages,
+                respect_robots_txt=False,
+                sitemap_mode="ignore"
+            )
+            
+            async def handle_page(url):
+                crawled.append(url)
+                await asyncio.sleep(0.01)
+                page = int(url.rsplit("/", 1)[1])
+                return [f"https://example.com/{page * 3 + i}" for i in (1, 2, 3)]
+            
+            engine = CrawlEngine(crawler, handle_page, concurrency=5)
+            return await engine.run(), crawler, crawled
+        
+        stats, crawler, crawled = asyncio.run(crawl(max_depth=10, max_pages=30))
+        assert stats["pages"] == 30
+        assert stats["peak_in_flight"] == 5
+        
+        # Depth 2 of a tree with three links per page
+        stats, crawler, crawled = asyncio.run(crawl(max_depth=2, max_pages=100))
+        assert stats["pages"] == 13
+        assert max(crawler.urls.depth(url) for url in crawled) == 2
+        assert crawler.urls.visited_count == 13
+    
+    def test_crawl_engine_checks_robots_outside_lock(self):
+        """Test slow robots.txt fetches for new hosts don't serialize the workers"""
+        from worker.app.scraping.crawl_engine import CrawlEngine
+        
+        async def crawl():
+            crawler = WebCrawler(
+                seed_url="https://seed.com/",
+                max_depth=1,
+                max_pages=20,
+                allow_external_links=True,
+                sitemap_mode="ignore"
+            )
+            
+            async def slow_robots(url):
+                await asyncio.sleep(0.2)
+                return None
+            crawler.robots_parser.fetch_robots_txt = slow_robots
+            
+            async def handle_page(url):
+                return [f"https://host{i}.com/" for i in range(10)] if "seed" in url else []
+            
+            engine = CrawlEngine(crawler, handle_page, concurrency=10)
+            started = asyncio.get_running_loop().time()
+            stats = await engine.run()
+            return stats, asyncio.get_running_loop().time() - started
+        
+        stats, elapsed = asyncio.run(crawl())
+        assert stats["pages"] == 11
+        # The ten new hosts' robots.txt fetches overlap instead of taking 2s in turn
+        assert elapsed < 1.0
+    
+    def test_crawl_engine_claims_outside_lock(self):
+        """Test slow frontier claims, like a shared frontier's Redis round trips, overlap"""
+        from worker.app.scraping.crawl_engine import CrawlEngine
+        
+        async def crawl():
+            crawler = WebCrawler(
+                seed_url="https://seed.com/",
+                max_depth=1,
+                max_pages=30,
+                allow_external_links=True,
+                respect_robots_txt=False,
+                sitemap_mode="ignore"
+            )
+            
+            next_candidate = crawler.next_candidate
+            async def slow_claim():
+                await asyncio.sleep(0.05)
+                return await next_candidate()
+            crawler.next_candidate = slow_claim
+            
+            async def handle_page(url):
+                await asyncio.sleep(0.05)
+                return [f"https://host{i}.com/" for i in range(20)] if "seed" in url else []
+            
+            engine = CrawlEngine(crawler, handle_page, concurrency=10)
+            started = asyncio.get_running_loop().time()
+            stats = await engine.run()
+            return stats, asyncio.get_running_loop().time() - started
+        
+        stats, elapsed = asyncio.run(crawl())
+        assert stats["pages"] == 21
+        assert stats["peak_in_flight"] == 10
+        # 21 claims one at a time would take over a second
+        assert elapsed < 0.6
+    
+    def test_host_frontier(self):
+        """Test hosts take turns and a delayed host doesn't hold up the others"""
+        from worker.app.scraping.frontier import HostFrontier
+        
+        frontier = HostFrontier(delay_ms=1000)
+        for url in ["https://a.com/1", "https://a.com/2", "https://a.com/3", "https://b.com/1", "https://c.com/1"]:
+            frontier.push(url)
+        
+        dispatched = []
+        while True:
+            url = frontier.pop(now=0.0)
+            if url is None:
+                break
+            frontier.dispatched(url, now=0.0)
+            dispatched.append(url)
+        
+        # One URL per host, then a.com waits out its delay
+        assert dispatched == ["https://a.com/1", "https://b.com/1", "https://c.com/1"]
+        assert frontier.ready_in(now=0.0) == 1.0
+        assert frontier.pop(now=1.0) == "https://a.com/2"
+        
+        frontier.set_crawl_delay("a.com", 5)
+        frontier.dispatched("https://a.com/2", now=1.0)
+        assert frontier.pop(now=3.0) is None
+        assert frontier.pop(now=6.0) == "https://a.com/3"
+    
+    def test_priority_frontier(self):
+        """Test URLs come out best first, in-links count, and spilled URLs come back in order"""
+        from worker.app.scraping.frontier import HostFrontier
+        from worker.app.scraping.url_priority import UrlScorer
+        
+        scorer = UrlScorer({r"^/docs/": 3.0})
+        assert scorer.score("https://a.com/docs/intro", 2) > scorer.score("https://a.com/about", 1)
+        assert scorer.score("https://a.com/tag/news", 1) < scorer.score("https://a.com/news", 1)
+        assert scorer.score("https://a.com/x", 0, 1.0) > scorer.score("https://a.com/y", 0, 0.1)
+        
+        frontier = HostFrontier(memory_limit=8)
+        try:
+            for i in range(40):
+                frontier.push(f"https://a.com/{i}", float(i % 10))
+            frontier.push("https://b.com/top", 20.0)
+            assert frontier.spill is not None
+            assert len(frontier.entries) <= 8
+            assert len(frontier) == 41
+            
+            # A link to a spilled URL lifts it above the others of its score
+            assert frontier.add_inlink("https://a.com/0")
+            assert not frontier.add_inlink("https://a.com/missing")
+            
+            order = []
+            while True:
+                url = frontier.pop(now=0.0)
+                if url is None:
+                    break
+                frontier.dispatched(url, now=0.0)
+                order.append(url)
+            
+            assert order[0] == "https://b.com/top"
+            assert len(order) == 41 and len(set(order)) == 41
+            scores = [int(url.rsplit("/", 1)[1]) % 10 for url in order[1:]]
+            assert scores[:4] == [9, 9, 9, 9]
+            assert order.index("https://a.com/0") < order.index("https://a.com/10")
+            assert len(frontier) == 0
+        finally:
+            frontier.close()
+    
+    def test_url_state_store(self):
+        """Test the compact URL store tracks depth and visits across table growth"""
+        from worker.app.scraping.url_store import UrlStateStore
+        
+        store = UrlStateStore(capacity=16)
+        for i in range(1000):
+            assert store.add(f"https://example.com/{i}", i % 4)
+        assert not store.add("https://example.com/5", 3)
+        
+        store.mark_visited("https://example.com/5")
+        store.mark_visited("https://example.com/5")
+        store.mark_visited("https://example.com/new", 2)
+        
+        assert len(store) == 1001
+        assert store.visited_count == 2
+        assert store.depth("https://example.com/5") == 1
+        assert store.depth("https://example.com/new") == 2
+        assert store.is_visited("https://example.com/new")
+        assert not store.is_visited("https://example.com/6")
+        assert "https://example.com/999" in store
+        assert "https://example.com/1000" not in store
+        assert store.depth("https://example.com/1000", 0) == 0
+        assert store.memory_bytes() < 1001 * 30
+    
+    def test_distributed_crawler_shard(self):
+        """Test a crawl shard keys its frontier by job and backs off hosts like HostFrontier"""
+        from worker.app.scraping.distributed_crawl import DistributedCrawler
+        
+        crawler = DistributedCrawler(
+            "job-1", "2", seed_url="https://example.com/", max_pages=50, delay_ms=500
+        )
+        frontier = crawler.frontier
+        assert frontier.prefix == "crawl:job-1"
+        assert frontier.max_pages == 50 and frontier.delay_ms == 500
+        assert frontier.ready_in() is None
+        assert not crawler.exhausted
+        
+        # Responses are only kept for URLs this shard holds a lease on
+        frontier.record_response("https://example.com/a", 429)
+        assert frontier.responses == {}
+        frontier.leased["https://example.com/a"] = "example.com"
+        frontier.record_response("https://example.com/a", 429)
+        assert frontier.responses["https://example.com/a"] == (429, None)
+        
+        assert frontier._backoff("example.com", 429, None) == 2000
+        assert frontier._backoff("example.com", 429, None) == 6000
+        assert frontier._backoff("example.com", 503, 30) == 30000
+        assert frontier._backoff("example.com", 200, None) == 0
+        assert frontier._backoff("example.com", 404, None) == -1
+        assert frontier._backoff("example.com", None, None) == -1
+    
+    def test_redis_frontier_scripts(self):
+        """Test the frontier scripts dedup pushes, requeue expired leases and count acks"""
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        from fakeredis import aioredis as fake_aioredis
+        from worker.app.scraping import distributed_crawl
+        from worker.app.scraping.distributed_crawl import RedisFrontier
+        
+        server = fakeredis.FakeServer()
+        clock = {"now": 1_000_000}
+        
+        async def from_url(url):
+            return fake_aioredis.FakeRedis(server=server)
+        
+        async def run():
+            a = RedisFrontier("job-1", "a", max_pages=3, lease_seconds=10)
+            b = RedisFrontier("job-1", "b", max_pages=3, lease_seconds=10)
+            await a.connect()
+            await b.connect()
+            
+            # Pushing a queued URL again adds an in-link instead of a second entry
+            assert await a.push([("https://a.com/1", 1, 1.0), ("https://a.com/2", 1, 2.0)]) == 2
+            assert await b.push([("https://a.com/1", 2, 1.0)]) == 0
+            assert await a.depth("https://a.com/1") == 1
+            queued = await a.redis_client.zrange("crawl:job-1:q:a.com", 0, -1, withscores=True)
+            assert dict(queued)[b"https://a.com/1"] > 1.0
+            
+            # A lease that isn't renewed expires and the URL goes to the next claim
+            first = await a.claim()
+            assert first in ("https://a.com/1", "https://a.com/2")
+            clock["now"] += 11_000
+            assert await b.claim() == first
+            assert not await a.ack(first)
+            assert await b.ack(first)
+            
+            # Filtered URLs give their page back to the budget; fetched ones don't
+            second = await a.claim()
+            assert await a.ack(second, counted=False)
+            assert (await a.stats())["claimed"] == 1
+            assert await a.push([("https://a.com/3", 1, 1.0), ("https://a.com/4", 1, 1.0)]) == 2
+            await a.ack(await a.claim())
+            await a.ack(await a.claim())
+            assert await a.claim() is None
+            assert a.exhausted
+            
+            await a.disconnect()
+            await b.disconnect()
+        
+        with patch.object(distributed_crawl.redis, "from_url", from_url), \
+                patch.object(distributed_crawl, "_now_ms", lambda: clock["now"]):
+            asyncio.run(run())
+    
+    def test_distributed_crawl_finish(self):
+        """Test only the last shard completes a crawl, and shards started after it don't rejoin"""
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        from fakeredis import aioredis as fake_aioredis
+        from worker.app.scraping import distributed_crawl
+        from worker.app.scraping.distributed_crawl import DistributedCrawler
+        
+        server = fakeredis.FakeServer()
+        options = {"seed_url": "https://example.com/", "max_pages": 10, "respect_robots_txt": False}
+        
+        async def from_url(url):
+            return fake_aioredis.FakeRedis(server=server)
+        
+        async def run():
+            # Never connected: finishing neither raises nor completes the job
+            assert await DistributedCrawler("job-2", "9", **options).finish() is None
+            
+            coordinator = DistributedCrawler("job-2", "0", seed=True, **options)
+            await coordinator.start(["1"])
+            assert await coordinator.next_candidate() == "https://example.com/"
+            assert await coordinator.admit("https://example.com/")
+            await coordinator.frontier.count("discovered")
+            await coordinator.page_done("https://example.com/", [])
+            
+            # Shard 1 is registered but hasn't started, so shard 0 isn't last
+            assert await coordinator.finish() is None
+            
+            shard = DistributedCrawler("job-2", "1", **options)
+            await shard.start()
+            assert await shard.next_candidate() is None
+            totals = await shard.finish()
+            assert totals["discovered"] == 1 and totals["claimed"] == 1
+            
+            # A shard started after the crawl finished exits without counters
+            late = DistributedCrawler("job-2", "2", **options)
+            await late.start()
+            assert late.finished
+            assert await late.next_candidate() is None
+            assert await late.finish() is None
+            
+            client = fake_aioredis.FakeRedis(server=server)
+            assert await client.keys("crawl:job-2:*") == []
+            assert await client.exists("crawl-finished:job-2")
+            await client.close()
+        
+        with patch.object(distributed_crawl.redis, "from_url", from_url):
+            asyncio.run(run())
 
 class TestRateLimiter:
     """Test rate limiting functionality"""
@@ -289,6 +1214,32 @@ class TestRateLimiter:
             backoff = await limiter.get_backoff_time("example.com")
             assert backoff > 0
             assert backoff == 2 ** 3  # Exponential backoff
+    
+    def test_shared_backoff_rules(self):
+        """Test the crawl frontiers back off with DomainRateLimiter's rules and honor Retry-After"""
+        import time
+        from email.utils import formatdate
+        from worker.app.scraping.frontier import HostFrontier
+        from worker.app.utils.rate_limiter import backoff_for, parse_retry_after
+        
+        assert backoff_for(429) == 2000
+        assert backoff_for(503, 2000) == 6000
+        assert backoff_for(429, 2000, retry_after=120) == 120000
+        assert backoff_for(502) == 5000
+        assert backoff_for(200, 6000) == 0
+        assert backoff_for(404, 6000) is None
+        
+        assert parse_retry_after("120") == 120
+        assert 50 <= parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+        
+        frontier = HostFrontier()
+        frontier.record_response("https://a.com/1", 429, retry_after=120)
+        assert frontier.backoffs["a.com"] == 120000
+        assert frontier.next_allowed["a.com"] >= time.monotonic() + 119
+        frontier.record_response("https://a.com/2", 200)
+        assert "a.com" not in frontier.backoffs
 
 class TestCeleryTasks:
     """Test Celery task execution"""
@@ -315,6 +1266,34 @@ class TestCeleryTasks:
         
         # Task should be registered with correct name
         assert crawl_site_task.name == 'scraping.crawl_site'
+    
+    def test_runtime_reuses_loop(self):
+        """Test every task runs on the same process event loop"""
+        import worker.app.utils.runtime as runtime
+        
+        async def current_loop():
+            return asyncio.get_running_loop()
+        
+        with patch.object(runtime, "_loop", None):
+            try:
+                first = runtime.run_async(current_loop())
+                second = runtime.run_async(current_loop())
+                assert first is second
+                assert not first.is_closed() and first is runtime.get_event_loop()
+            finally:
+                runtime._loop.close()
+    
+    def test_runtime_shares_scraper(self):
+        """Test the scraper, browser pool and HTTP client are created once per process"""
+        import worker.app.utils.runtime as runtime
+        
+        with patch.object(runtime, "_scraper", None), \
+                patch.object(runtime, "_browser_pool", None), \
+                patch.object(runtime, "_http_fetcher", None):
+            scraper = runtime.get_scraper()
+            assert runtime.get_scraper() is scraper
+            assert scraper.browser_pool is runtime.get_browser_pool()
+            assert scraper.http_fetcher is runtime.get_http_fetcher()
 
 class TestOpenWebUIConnector:
     """Test OpenWebUI integration"""
@@ -0,0 +1,392 @@
+"""
+Disk cache for static subresources
+Serves stylesheets, scripts, fonts and images to browser renders via route.fulfill
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import logging
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional
+
+from playwright.async_api import Route, Request
+
+from app.utils.metrics import asset_cache_requests, asset_cache_served_bytes, asset_cache_size_bytes
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_RESOURCE_TYPES = {"stylesheet", "script", "font", "image"}
+
+# Not replayed from the cache; bodies are stored decoded
+DROPPED_HEADERS = {
+    "connection", "keep-alive", "transfer-encoding", "content-encoding",
+    "content-length", "set-cookie", "age", "date"
+}
+
+# A shared cache must not store responses to requests carrying these unless
+# the response explicitly allows it (RFC 9111 3.5)
+CREDENTIAL_HEADERS = {"authorization", "cookie"}
+
+# Heuristic freshness for responses with only Last-Modified (RFC 9111 4.2.2)
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 86400
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into a directive dict"""
+    directives = {}
+    for part in (value or "").split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition('=')
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Dict[str, str], now: Optional[float] = None) -> Optional[float]:
+    """
+    How long a response may be served without revalidation
+    
+    Args:
+        headers: Response headers with lower-case names
+        now: Current time as a UNIX timestamp
+        
+    Returns:
+        Lifetime in seconds (0 means revalidate on every use), or None if the
+        response must not be stored
+    """
+    now = now or time.time()
+    cache_control = parse_cache_control(headers.get("cache-control"))
+    
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    
+    # A shared cache prefers s-maxage
+    for directive in ("s-maxage", "max-age"):
+        if cache_control.get(directive):
+            try:
+                return max(0, int(cache_control[directive]))
+            except ValueError:
+                return 0
+    
+    expires = _parse_http_date(headers.get("expires"))
+    if expires is not None:
+        date = _parse_http_date(headers.get("date")) or now
+        return max(0, expires - date)
+    
+    last_modified = _parse_http_date(headers.get("last-modified"))
+    if last_modified is not None:
+        return min(HEURISTIC_MAX_SECONDS, max(0, (now - last_modified) * HEURISTIC_FRACTION))
+    
+    return None
+
+
+class CachedAsset:
+    """Metadata for one cached subresource"""
+    
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        size: int,
+        expires_at: float
+    ):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.size = size
+        self.expires_at = expires_at
+    
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("etag")
+    
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("last-modified")
+    
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "status": self.status,
+            "headers": self.headers,
+            "size": self.size,
+            "expires_at": self.expires_at
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CachedAsset":
+        return cls(data["url"], data["status"], data["headers"], data["size"], data["expires_at"])
+
+
+class AssetCache:
+    """
+    LRU disk cache of static subresources, shared by every page the worker renders
+    
+    Entries are keyed by URL and revalidated with their ETag/Last-Modified
+    once stale. Worker processes share the directory; each process bounds the
+    entries it knows about to max_bytes.
+    """
+    
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        max_entry_bytes: Optional[int] = None
+    ):
+        self.directory = directory or os.getenv("ASSET_CACHE_DIR", "/tmp/webharvest-assets")
+        self.max_bytes = max_bytes or int(os.getenv("ASSET_CACHE_MAX_MB", "512")) * 1024 * 1024
+        self.max_entry_bytes = max_entry_bytes or int(os.getenv("ASSET_CACHE_MAX_ENTRY_MB", "5")) * 1024 * 1024
+        self.entries: "OrderedDict[str, CachedAsset]" = OrderedDict()
+        self.total_bytes = 0
+        
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+    
+    def _load(self):
+        """Index entries left on disk, least recently written first"""
+        metas = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                metas.append((os.path.getmtime(path), name[:-5]))
+            except OSError:
+                continue
+        
+        for _, key in sorted(metas):
+            asset = self._read_meta(key)
+            if asset:
+                self.entries[key] = asset
+                self.total_bytes += asset.size
+        
+        for key in self._evict():
+            self._delete_files(key)
+        asset_cache_size_bytes.set(self.total_bytes)
+    
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+    
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}.{suffix}")
+    
+    def _read_meta(self, key: str) -> Optional[CachedAsset]:
+        try:
+            with open(self._path(key, "json")) as f:
+                return CachedAsset.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _read_body(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key, "body"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _write(self, key: str, asset: CachedAsset, body: Optional[bytes]):
+        """Write body and metadata atomically, so other processes never see partial files"""
+        if body is not None:
+            tmp = self._path(key, f"body.{os.getpid()}")
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, self._path(key, "body"))
+        
+        tmp = self._path(key, f"json.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(asset.to_dict(), f)
+        os.replace(tmp, self._path(key, "json"))
+    
+    def _forget(self, key: str):
+        asset = self.entries.pop(key, None)
+        if asset:
+            self.total_bytes -= asset.size
+    
+    def _delete_files(self, key: str):
+        for suffix in ("body", "json"):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+    
+    async def _remove(self, key: str):
+        self._forget(key)
+        await asyncio.to_thread(self._delete_files, key)
+    
+    def _evict(self) -> List[str]:
+        """Drop least recently used entries from the index until under max_bytes; returns their keys"""
+        evicted = []
+        while self.total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self._forget(key)
+            evicted.append(key)
+        return evicted
+    
+    async def _lookup(self, key: str) -> Optional[CachedAsset]:
+        """Find an entry, including ones stored by other worker processes"""
+        asset = self.entries.get(key)
+        if asset is None:
+            asset = await asyncio.to_thread(self._read_meta, key)
+            if asset is None:
+                return None
+            self.entries[key] = asset
+            self.total_bytes += asset.size
+        self.entries.move_to_end(key)
+        return asset
+    
+    async def _index(self, key: str, asset: CachedAsset):
+        """Add a freshly written entry to the LRU"""
+        self._forget(key)
+        self.entries[key] = asset
+        self.total_bytes += asset.size
+        evicted = self._evict()
+        asset_cache_size_bytes.set(self.total_bytes)
+        for evicted_key in evicted:
+            await asyncio.to_thread(self._delete_files, evicted_key)
+    
+    def handles(self, request: Request) -> bool:
+        """Whether a request is for a cacheable static subresource"""
+        return (
+            request.method == "GET"
+            and request.resource_type in CACHEABLE_RESOURCE_TYPES
+            and request.url.startswith(("http://", "https://"))
+        )
+    
+    def _cacheable(
+        self,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        size: int,
+        request_headers: Optional[Dict[str, str]] = None
+    ) -> Optional[CachedAsset]:
+        """Build a cache entry for a response, or None if it must not be stored"""
+        if status != 200 or size > self.max_entry_bytes:
+            return None
+        
+        headers = {name.lower(): value for name, value in headers.items()}
+        
+        # The cache is shared by every render in the worker, whoever's
+        # credentials a request carried; personalized responses stay out
+        credentialed = any(name.lower() in CREDENTIAL_HEADERS for name in (request_headers or {}))
+        if credentialed:
+            cache_control = parse_cache_control(headers.get("cache-control"))
+            if "public" not in cache_control and "s-maxage" not in cache_control:
+                return None
+        vary = {v.strip().lower() for v in headers.get("vary", "").split(',') if v.strip()}
+        if vary - {"accept-encoding", "origin"}:
+            return None
+        
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None:
+            return None
+        if lifetime == 0 and not (headers.get("etag") or headers.get("last-modified")):
+            return None
+        
+        stored_headers = {k: v for k, v in headers.items() if k not in DROPPED_HEADERS}
+        return CachedAsset(url, status, stored_headers, size, time.time() + lifetime)
+    
+    async def handle(self, route: Route) -> int:
+        """
+        Answer a subresource request from the cache, fetching and storing it on a miss
+        
+        Args:
+            route: Intercepted request (must satisfy handles())
+            
+        Returns:
+            Bytes served from the cache, 0 on a miss
+        """
+        request = route.request
+        key = self.key(request.url)
+        asset = await self._lookup(key)
+        
+        if asset and asset.fresh:
+            body = await asyncio.to_thread(self._read_body, key)
+            if body is not None:
+                asset_cache_requests.labels(result="hit").inc()
+                asset_cache_served_bytes.inc(len(body))
+                await route.fulfill(status=asset.status, headers=asset.headers, body=body)
+                return len(body)
+            await self._remove(key)
+            asset = None
+        
+        # Stale: revalidate with the stored validators
+        headers = dict(request.headers)
+        if asset and asset.etag:
+            headers["if-none-match"] = asset.etag
+        if asset and asset.last_modified:
+            headers["if-modified-since"] = asset.last_modified
+        
+        response = await route.fetch(headers=headers)
+        
+        if asset and response.status == 304:
+            body = await asyncio.to_thread(self._read_body, key)
+            if body is not None:
+                refreshed = {name.lower(): value for name, value in response.headers.items()}
+                lifetime = freshness_lifetime({**asset.headers, **refreshed}) or 0
+                asset.expires_at = time.time() + lifetime
+                await asyncio.to_thread(self._write, key, asset, None)
+                
+                asset_cache_requests.labels(result="revalidated").inc()
+                asset_cache_served_bytes.inc(len(body))
+                await route.fulfill(status=asset.status, headers=asset.headers, body=body)
+                return len(body)
+            
+            # Body vanished (evicted by another process); fetch it again
+            await self._remove(key)
+            response = await route.fetch()
+        
+        body = await response.body()
+        fresh_asset = self._cacheable(
+            request.url, response.status, response.headers, len(body), request.headers
+        )
+        if fresh_asset:
+            try:
+                await asyncio.to_thread(self._write, key, fresh_asset, body)
+                await self._index(key, fresh_asset)
+            except OSError as e:
+                logger.warning(f"Failed to cache {request.url}: {e}")
+        
+        asset_cache_requests.labels(result="miss").inc()
+        await route.fulfill(response=response, body=body)
+        return 0
+
+
+# Global instance
+_asset_cache = None
+_asset_cache_disabled = os.getenv("ASSET_CACHE_ENABLED", "true").lower() != "true"
+
+
+def get_asset_cache() -> Optional[AssetCache]:
+    """Get the process asset cache, or None if disabled"""
+    global _asset_cache, _asset_cache_disabled
+    if _asset_cache is None and not _asset_cache_disabled:
+        try:
+            _asset_cache = AssetCache()
+        except OSError as e:
+            logger.warning(f"Asset cache disabled: {e}")
+            _asset_cache_disabled = True
+    return _asset_cache
@@ -0,0 +1,242 @@
+"""
+Resource blocking for browser renders
+Named profiles picked from the requested formats, plus a third-party tracker blocklist
+"""
+
+import os
+import logging
+from typing import Dict, Any, List, Optional, Set, FrozenSet, Tuple
+from urllib.parse import urlsplit
+
+from playwright.async_api import Route
+
+from app.scraping.asset_cache import AssetCache, get_asset_cache
+
+logger = logging.getLogger(__name__)
+
+# Ad, analytics and tracking hosts; subdomains match too
+TRACKER_HOSTS = {
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com",
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com",
+    "adservice.google.com", "analytics.google.com", "stats.g.doubleclick.net",
+    "facebook.net", "connect.facebook.net", "ads-twitter.com", "analytics.twitter.com",
+    "static.ads-twitter.com", "ads.linkedin.com", "snap.licdn.com", "px.ads.linkedin.com",
+    "bat.bing.com", "clarity.ms", "hotjar.com", "hotjar.io", "mouseflow.com",
+    "fullstory.com", "crazyegg.com", "luckyorange.com", "inspectlet.com",
+    "segment.com", "segment.io", "mixpanel.com", "amplitude.com", "heap.io",
+    "heapanalytics.com", "kissmetrics.com", "chartbeat.com", "chartbeat.net",
+    "quantserve.com", "scorecardresearch.com", "comscore.com", "newrelic.com",
+    "nr-data.net", "taboola.com", "outbrain.com", "criteo.com", "criteo.net",
+    "adnxs.com", "rubiconproject.com", "pubmatic.com", "openx.net", "casalemedia.com",
+    "advertising.com", "amazon-adsystem.com", "moatads.com", "adsafeprotected.com",
+    "doubleverify.com", "serving-sys.com", "media.net", "yieldmo.com", "sharethrough.com",
+    "bidswitch.net", "demdex.net", "omtrdc.net", "everesttech.net", "krxd.net",
+    "bluekai.com", "exelator.com", "tapad.com", "rlcdn.com", "adsrvr.org",
+    "zemanta.com", "optimizely.com", "hs-analytics.net", "hs-scripts.com",
+    "intercomcdn.com", "drift.com", "onesignal.com", "pushcrew.com", "quora.com/_/ad",
+    "tiktok.com/i18n/pixel", "analytics.tiktok.com", "yandex.ru/metrika", "mc.yandex.ru",
+    "cdn.mxpnl.com", "sentry-cdn.com", "browser.sentry-cdn.com", "trackjs.com",
+}
+
+# Typical transfer sizes, used to estimate bandwidth saved by aborted requests
+ESTIMATED_BYTES = {
+    "image": 60_000,
+    "media": 500_000,
+    "font": 40_000,
+    "stylesheet": 25_000,
+    "script": 40_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+
+
+def load_blocklist(path: Optional[str] = None) -> FrozenSet[str]:
+    """
+    Build the tracker host set, extended from a hosts-style file if configured
+    
+    Args:
+        path: File with one host per line (hosts-file format also accepted)
+        
+    Returns:
+        Frozen set of blocked hosts
+    """
+    hosts = set(host for host in TRACKER_HOSTS if '/' not in host)
+    path = path or os.getenv("TRACKER_BLOCKLIST_FILE")
+    
+    if path:
+        try:
+            with open(path) as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if not line:
+                        continue
+                    # "0.0.0.0 host" or just "host"
+                    host = line.split()[-1].lower()
+                    if '.' in host:
+                        hosts.add(host)
+        except OSError as e:
+            logger.warning(f"Failed to load tracker blocklist {path}: {e}")
+    
+    return frozenset(hosts)
+
+
+BLOCKED_HOSTS = load_blocklist()
+
+
+def is_tracker(url: str, blocked_hosts: FrozenSet[str] = BLOCKED_HOSTS) -> bool:
+    """Check a URL's host and its parent domains against the blocklist"""
+    host = urlsplit(url).hostname
+    if not host:
+        return False
+    
+    # a.b.example.com -> a.b.example.com, b.example.com, example.com
+    while '.' in host:
+        if host in blocked_hosts:
+            return True
+        host = host.split('.', 1)[1]
+    return False
+
+
+class BlockingProfile:
+    """Named set of resource types to abort during a render"""
+    
+    def __init__(self, name: str, resource_types: Set[str], block_trackers: bool = True):
+        self.name = name
+        self.resource_types = frozenset(resource_types)
+        self.block_trackers = block_trackers
+    
+    @property
+    def key(self) -> Tuple:
+        """Identity used when pooling contexts"""
+        return (self.name, tuple(sorted(self.resource_types)), self.block_trackers)
+    
+    @property
+    def blocks_anything(self) -> bool:
+        return bool(self.resource_types) or self.block_trackers
+
+
+BLOCKING_PROFILES = {
+    # Text extraction only: nothing visual is needed
+    "text-only": BlockingProfile("text-only", {"image", "media", "font"}),
+    # Screenshots and interactions: keep what affects layout
+    "layout": BlockingProfile("layout", {"media"}),
+    # Everything loads, trackers included
+    "full": BlockingProfile("full", set(), block_trackers=False),
+}
+
+
+def select_profile(
+    formats: List[str],
+    actions: Optional[List[Dict[str, Any]]] = None,
+    profile: Optional[str] = None,
+    block_resources: Optional[List[str]] = None
+) -> BlockingProfile:
+    """
+    Pick a blocking profile for a render
+    
+    Args:
+        formats: Requested output formats
+        actions: Browser actions to execute
+        profile: Explicitly requested profile name
+        block_resources: Explicit resource types to block (overrides the profile's)
+        
+    Returns:
+        BlockingProfile to apply
+    """
+    if profile and profile not in BLOCKING_PROFILES:
+        logger.warning(f"Unknown blocking profile {profile}, choosing automatically")
+        profile = None
+    
+    if not profile:
+        profile = "layout" if "screenshot" in formats or actions else "text-only"
+    
+    selected = BLOCKING_PROFILES[profile]
+    if block_resources is not None:
+        return BlockingProfile("custom", set(block_resources), selected.block_trackers)
+    return selected
+
+
+class BlockingStats:
+    """Requests blocked during one scrape"""
+    
+    def __init__(self, profile: str):
+        self.profile = profile
+        self.blocked_requests = 0
+        self.blocked_trackers = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.estimated_bytes_saved = 0
+        self.cache_hits = 0
+        self.cache_bytes = 0
+    
+    def record_cache_hit(self, size: int):
+        self.cache_hits += 1
+        self.cache_bytes += size
+    
+    def record(self, resource_type: str, tracker: bool):
+        self.blocked_requests += 1
+        self.blocked_trackers += int(tracker)
+        self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+        self.estimated_bytes_saved += ESTIMATED_BYTES.get(resource_type, 0)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "profile": self.profile,
+            "blockedRequests": self.blocked_requests,
+            "blockedTrackers": self.blocked_trackers,
+            "blockedByType": dict(self.blocked_by_type),
+            "estimatedBytesSaved": self.estimated_bytes_saved,
+            "assetCacheHits": self.cache_hits,
+            "assetCacheBytes": self.cache_bytes
+        }
+
+
+class ResourceBlocker:
+    """Route handler applying a blocking profile to a page, serving static assets from the cache"""
+    
+    def __init__(self, profile: BlockingProfile, asset_cache: Optional[AssetCache] = None):
+        self.profile = profile
+        self.asset_cache = asset_cache or get_asset_cache()
+        self.stats = BlockingStats(profile.name)
+    
+    @property
+    def intercepts(self) -> bool:
+        """Whether the page needs a route handler at all"""
+        return self.profile.blocks_anything or self.asset_cache is not None
+    
+    def reset_stats(self):
+        """Start counting for a new scrape on a reused page"""
+        self.stats = BlockingStats(self.profile.name)
+    
+    def should_block(self, url: str, resource_type: str) -> Tuple[bool, bool]:
+        """Return (block, is_tracker) for a request"""
+        if resource_type == "document":
+            return False, False
+        if resource_type in self.profile.resource_types:
+            return True, False
+        if self.profile.block_trackers and is_tracker(url):
+            return True, True
+        return False, False
+    
+    async def handle(self, route: Route):
+        request = route.request
+        block, tracker = self.should_block(request.url, request.resource_type)
+        if block:
+            self.stats.record(request.resource_type, tracker)
+            await route.abort()
+            return
+        
+        if self.asset_cache and self.asset_cache.handles(request):
+            try:
+                served = await self.asset_cache.handle(route)
+                if served:
+                    self.stats.record_cache_hit(served)
+                return
+            except Exception as e:
+                # Let the browser load it itself
+                logger.debug(f"Asset cache failed for {request.url}: {e}")
+        
+        try:
+            await route.continue_()
+        except Exception as e:
+            # Page closed or the route was already handled
+            logger.debug(f"Failed to continue {request.url}: {e}")
@@ -0,0 +1,178 @@
+"""
+Boilerplate templates learned while crawling a site
+Blocks repeated across a site's pages are stripped by fingerprint instead of running readability on every page
+"""
+
+import hashlib
+import os
+import logging
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+from readability.readability import REGEXES
+
+logger = logging.getLogger(__name__)
+
+# Containers page templates are built from (headers, menus, sidebars, footers)
+BLOCK_TAGS = ("div", "section", "header", "footer", "nav", "aside", "ul", "ol", "dl", "table", "form", "menu")
+_BLOCK_TAGS = set(BLOCK_TAGS)
+
+# Blocks with less text than this are too generic to identify
+MIN_BLOCK_CHARS = 10
+
+# Fingerprints tracked per host; blocks seen only once are forgotten first
+MAX_FINGERPRINTS = 100000
+
+
+def _fingerprint(element) -> Optional[str]:
+    """Fingerprint of a block's tag and whitespace-normalized text"""
+    text = ' '.join(element.text_content().split())
+    if len(text) < MIN_BLOCK_CHARS:
+        return None
+    digest = hashlib.blake2b(f"{element.tag}\x00{text}".encode('utf-8', 'replace'), digest_size=8)
+    return digest.hexdigest()
+
+
+def block_fingerprints(tree) -> List[str]:
+    """
+    Fingerprint every template-sized block of a document
+    
+    Args:
+        tree: lxml element
+        
+    Returns:
+        Unique fingerprints in document order
+    """
+    fingerprints = {}
+    # The body makes the set unique per page, so duplicate pages can be recognized
+    for element in tree.iter("body", *BLOCK_TAGS):
+        fingerprint = _fingerprint(element)
+        if fingerprint:
+            fingerprints[fingerprint] = None
+    return list(fingerprints)
+
+
+def strip_blocks(tree, boilerplate: FrozenSet[str]) -> int:
+    """
+    Remove blocks whose fingerprint is known boilerplate
+    
+    Args:
+        tree: lxml element, modified in place
+        boilerplate: Fingerprints to remove
+        
+    Returns:
+        Number of blocks removed
+    """
+    removed = 0
+    stack = [tree]
+    while stack:
+        for child in list(stack.pop()):
+            if not isinstance(child.tag, str):
+                continue
+            if child.tag in _BLOCK_TAGS and _fingerprint(child) in boilerplate:
+                child.drop_tree()
+                removed += 1
+            else:
+                stack.append(child)
+    return removed
+
+
+def strip_unlikely_candidates(tree):
+    """Drop elements readability would never consider content (comments, share bars, ...)"""
+    for element in tree.xpath('.//*[@class or @id]'):
+        if element.tag in ("html", "body"):
+            continue
+        names = f"{element.get('class', '')} {element.get('id', '')}"
+        if (
+            REGEXES["unlikelyCandidatesRe"].search(names)
+            and not REGEXES["okMaybeItsACandidateRe"].search(names)
+            and element.getparent() is not None
+        ):
+            element.drop_tree()
+
+
+class _HostTemplate:
+    """Block counts for one host"""
+    
+    def __init__(self):
+        self.pages = 0
+        self.counts: Dict[str, int] = {}
+        # Blocks seen on at least min_pages pages
+        self.candidates: Set[str] = set()
+        # Pages already counted, so duplicates don't turn content into boilerplate
+        self.signatures: Set[int] = set()
+        self.template: Optional[FrozenSet[str]] = None
+
+
+class BoilerplateModel:
+    """
+    Blocks seen repeatedly across the pages of one crawl, per host
+    
+    A block is boilerplate once it has appeared on at least min_pages
+    distinct pages and on at least min_ratio of the host's pages so far.
+    Lives for a single crawl; nothing is shared between crawls.
+    """
+    
+    def __init__(self, min_pages: Optional[int] = None, min_ratio: Optional[float] = None):
+        self.min_pages = min_pages or int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+        self.min_ratio = min_ratio if min_ratio is not None else float(os.getenv("BOILERPLATE_MIN_RATIO", "0.5"))
+        self.hosts: Dict[str, _HostTemplate] = {}
+    
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).netloc.lower()
+    
+    def template(self, url: str) -> FrozenSet[str]:
+        """
+        Boilerplate fingerprints learned for a URL's host
+        
+        Args:
+            url: Page URL
+            
+        Returns:
+            Fingerprints to strip, empty until enough pages have been seen
+        """
+        host = self.hosts.get(self._host(url))
+        if host is None or host.pages < self.min_pages:
+            return frozenset()
+        
+        if host.template is None:
+            needed = max(self.min_pages, self.min_ratio * host.pages)
+            host.template = frozenset(
+                fingerprint for fingerprint in host.candidates
+                if host.counts[fingerprint] >= needed
+            )
+        return host.template
+    
+    def observe(self, url: str, fingerprints: Iterable[str]):
+        """
+        Count the blocks of a scraped page
+        
+        Args:
+            url: Page URL
+            fingerprints: block_fingerprints() of the page
+        """
+        fingerprints = frozenset(fingerprints)
+        if not fingerprints:
+            return
+        
+        host = self.hosts.setdefault(self._host(url), _HostTemplate())
+        signature = hash(fingerprints)
+        if signature in host.signatures:
+            return
+        host.signatures.add(signature)
+        host.pages += 1
+        
+        counts = host.counts
+        for fingerprint in fingerprints:
+            count = counts.get(fingerprint, 0) + 1
+            counts[fingerprint] = count
+            if count >= self.min_pages:
+                host.candidates.add(fingerprint)
+        
+        if len(counts) > MAX_FINGERPRINTS:
+            host.counts = {fingerprint: count for fingerprint, count in counts.items() if count > 1}
+            host.candidates.intersection_update(host.counts)
+            logger.debug(f"Boilerplate model for {self._host(url)} pruned to {len(host.counts)} blocks")
+        
+        host.template = None
@@ -3,20 +3,96 @@ Browser management for web scraping with Playwright
 """
 
 import asyncio
-from typing import Optional, Dict, Any, List
-from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from typing import Optional, Dict, Any, List, Tuple
+from playwright.async_api import async_playwright, Playwright, Browser, BrowserContext, Page
+import hashlib
+import json
 import random
 import os
 import logging
+import time
+import uuid
+from urllib.parse import urlparse
+
+from app.scraping.blocking import BLOCKING_PROFILES, BlockingProfile, ResourceBlocker
+from app.scraping.readiness import READINESS_SCRIPT
 
 logger = logging.getLogger(__name__)
 
+# Playwright error messages that mean the browser or context broke, not the page
+BROWSER_FAULT_MARKERS = (
+    "target closed",
+    "target page, context or browser has been closed",
+    "browser has been closed",
+    "browser has disconnected",
+    "connection closed",
+    "protocol error",
+    "crashed",
+)
+
+
+def is_browser_fault(error: Exception) -> bool:
+    """Whether a scrape error came from the browser or its context rather than the site or page"""
+    message = str(error).lower()
+    return any(marker in message for marker in BROWSER_FAULT_MARKERS)
+
+
+def process_tree_rss(marker: str) -> Optional[int]:
+    """
+    Resident memory of a browser process and all its children
+    
+    Args:
+        marker: Command-line argument unique to the browser process
+        
+    Returns:
+        RSS in bytes, or None if the process can't be found (e.g. not Linux)
+    """
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    root = None
+    page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+    
+    try:
+        pids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+    
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                # Fields after the parenthesised command name
+                fields = f.read().rsplit(b")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(pid)
+            rss[pid] = int(fields[21]) * page_size
+            
+            if root is None:
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    if marker.encode() in f.read():
+                        root = pid
+        except (OSError, IndexError, ValueError):
+            continue
+    
+    if root is None:
+        return None
+    
+    total = 0
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total
+
+
 class BrowserManager:
     """Manages browser instances and contexts for scraping"""
     
     def __init__(self):
         self.playwright = None
         self.browser = None
+        self._owns_playwright = False
+        self.instance_id = uuid.uuid4().hex
+        self.launched = False
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -32,13 +108,45 @@ class BrowserManager:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.stop()
     
-    async def start(self):
-        """Start Playwright and browser"""
-        self.playwright = await async_playwright().start()
+    async def start(
+        self,
+        playwright: Optional[Playwright] = None,
+        ws_endpoint: Optional[str] = None,
+        cdp_url: Optional[str] = None
+    ):
+        """
+        Start Playwright and browser
+        
+        Args:
+            playwright: Running Playwright driver to launch from; a private
+                driver is started (and stopped with the browser) if omitted
+            ws_endpoint: Connect to a Playwright browser server instead of launching
+            cdp_url: Connect to a Chromium instance over CDP instead of launching
+        """
+        if playwright:
+            self.playwright = playwright
+            self._owns_playwright = False
+        else:
+            self.playwright = await async_playwright().start()
+            self._owns_playwright = True
         
         # Choose browser based on environment
         browser_type = os.getenv("BROWSER_TYPE", "chromium").lower()
         
+        ws_endpoint = ws_endpoint or os.getenv("BROWSER_WS_ENDPOINT")
+        cdp_url = cdp_url or os.getenv("BROWSER_CDP_URL")
+        
+        # Shared long-lived browser server, e.g. one Chromium fleet per host
+        if ws_endpoint:
+            launcher = getattr(self.playwright, browser_type, self.playwright.chromium)
+            self.browser = await launcher.connect(ws_endpoint)
+            logger.info(f"Connected to browser server: {ws_endpoint}")
+            return
+        if cdp_url:
+            self.browser = await self.playwright.chromium.connect_over_cdp(cdp_url)
+            logger.info(f"Connected to browser over CDP: {cdp_url}")
+            return
+        
         launch_options = {
             "headless": os.getenv("HEADLESS", "true").lower() == "true",
             "args": [
@@ -57,26 +165,46 @@ class BrowserManager:
         elif browser_type == "webkit":
             self.browser = await self.playwright.webkit.launch(**launch_options)
         else:
+            # Chromium ignores unknown switches; used to find the process tree
+            launch_options["args"].append(f"--webharvest-browser-id={self.instance_id}")
             self.browser = await self.playwright.chromium.launch(**launch_options)
         
+        self.launched = True
+        
         logger.info(f"Browser started: {browser_type}")
     
     async def stop(self):
         """Stop browser and Playwright"""
         if self.browser:
-            await self.browser.close()
+            try:
+                await self.browser.close()
+            except Exception as e:
+                # Already crashed or disconnected
+                logger.debug(f"Error closing browser: {e}")
             self.browser = None
         if self.playwright:
-            await self.playwright.stop()
+            if self._owns_playwright:
+                await self.playwright.stop()
             self.playwright = None
         logger.info("Browser stopped")
     
+    def is_connected(self) -> bool:
+        """Whether the browser is still alive"""
+        return self.browser is not None and self.browser.is_connected()
+    
+    def memory_usage(self) -> Optional[int]:
+        """RSS of the browser process tree in bytes, None for remote browsers"""
+        if not self.launched:
+            return None
+        return process_tree_rss(f"--webharvest-browser-id={self.instance_id}")
+    
     async def create_context(
         self,
         mobile: bool = False,
         headers: Optional[Dict[str, str]] = None,
         cookies: Optional[List[Dict[str, Any]]] = None,
-        proxy: Optional[Dict[str, str]] = None
+        proxy: Optional[Dict[str, str]] = None,
+        javascript_enabled: bool = True
     ) -> BrowserContext:
         """Create a new browser context with specified options"""
         
@@ -90,7 +218,8 @@ class BrowserManager:
             "device_scale_factor": 2 if mobile else 1,
             "is_mobile": mobile,
             "has_touch": mobile,
-            "ignore_https_errors": True
+            "ignore_https_errors": True,
+            "java_script_enabled": javascript_enabled
         }
         
         # Add custom headers
@@ -108,6 +237,9 @@ class BrowserManager:
         if cookies:
             await context.add_cookies(cookies)
         
+        # DOM mutation observer used for readiness detection
+        await context.add_init_script(READINESS_SCRIPT)
+        
         # Set additional settings
         await context.set_extra_http_headers({
             "Accept-Language": "en-US,en;q=0.9",
@@ -120,21 +252,20 @@ class BrowserManager:
     async def create_page(
         self,
         context: BrowserContext,
-        block_resources: Optional[List[str]] = None
+        block_resources: Optional[List[str]] = None,
+        blocker: Optional[ResourceBlocker] = None
     ) -> Page:
         """Create a new page with optional resource blocking"""
         
         page = await context.new_page()
         
-        # Block specific resource types if requested
-        if block_resources:
-            async def block_route(route):
-                if route.request.resource_type in block_resources:
-                    await route.abort()
-                else:
-                    await route.continue_()
-            
-            await page.route("**/*", block_route)
+        # Plain resource type list, without the tracker blocklist
+        if blocker is None and block_resources:
+            blocker = ResourceBlocker(BlockingProfile("custom", set(block_resources), block_trackers=False))
+        
+        # Routing adds a round trip per request, so only install it when needed
+        if blocker and blocker.intercepts:
+            await page.route("**/*", blocker.handle)
         
         # Set default timeouts
         page.set_default_timeout(30000)  # 30 seconds
@@ -204,15 +335,161 @@ class BrowserManager:
                 logger.error(f"Error executing action {action_type}: {e}")
                 continue
 
+class PooledContext:
+    """A browser context and page kept warm between scrapes"""
+    
+    def __init__(
+        self,
+        browser: BrowserManager,
+        context: BrowserContext,
+        page: Page,
+        key: Tuple,
+        cookies: Optional[List[Dict[str, Any]]] = None,
+        blocker: Optional[ResourceBlocker] = None
+    ):
+        self.browser = browser
+        self.context = context
+        self.page = page
+        self.key = key
+        self.cookies = cookies
+        self.blocker = blocker
+        self.pages_served = 0
+        self.crashed = False
+        # Origins whose documents ran in the context since the last reset
+        self.origins: set = set()
+        self._watch(page)
+        # Popups and tabs opened by a scrape
+        context.on("page", self._watch)
+    
+    def _watch(self, page: Page):
+        page.on("crash", self._on_crash)
+        page.on("framenavigated", self._on_navigated)
+    
+    def _on_crash(self, page: Page):
+        self.crashed = True
+    
+    def _on_navigated(self, frame):
+        parsed = urlparse(frame.url)
+        if parsed.scheme in ("http", "https"):
+            self.origins.add(f"{parsed.scheme}://{parsed.netloc}")
+    
+    async def reset(self) -> bool:
+        """
+        Clear per-scrape state while keeping DNS, TLS sessions and HTTP cache
+        
+        Storage written by the visited origins (localStorage, IndexedDB,
+        service workers, Cache Storage) is cleared over CDP, so only
+        Chromium contexts can be reused.
+        
+        Returns:
+            Whether the context is clean for another scrape
+        """
+        browser = self.browser.browser
+        if browser is None or browser.browser_type.name != "chromium":
+            return False
+        
+        session = await self.context.new_cdp_session(self.page)
+        try:
+            for origin in self.origins:
+                await session.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+        finally:
+            await session.detach()
+        self.origins.clear()
+        
+        await self.context.clear_cookies()
+        await self.context.clear_permissions()
+        if self.cookies:
+            await self.context.add_cookies(self.cookies)
+        
+        # A new tab drops the previous scrape's sessionStorage; popups go with the old tabs
+        for page in self.context.pages:
+            await page.close()
+        self.page = await self.browser.create_page(self.context, blocker=self.blocker)
+        return True
+    
+    async def close(self):
+        """Close the underlying context"""
+        try:
+            await self.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled context: {e}")
+
+
+class BrowserHealth:
+    """Health counters for one browser in the pool"""
+    
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.pages_served = 0
+        self.consecutive_failures = 0
+        self.crashes = 0
+        self.disconnects = 0
+        self.rss_bytes: Optional[int] = None
+        self.retiring = False
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "uptime": round(time.monotonic() - self.started_at, 1),
+            "pages_served": self.pages_served,
+            "consecutive_failures": self.consecutive_failures,
+            "crashes": self.crashes,
+            "disconnects": self.disconnects,
+            "rss_bytes": self.rss_bytes,
+            "retiring": self.retiring
+        }
+
+
 class BrowserPool:
-    """Pool of browser instances for concurrent scraping"""
+    """
+    Pool of browser instances for concurrent scraping
+    
+    Each browser serves up to pages_per_browser scrapes at once; acquire
+    leases a page slot on the least-loaded browser rather than a whole browser.
+    
+    Browsers that crash, disconnect, keep failing, or grow past the page or
+    memory limits are retired: a replacement is launched in the background,
+    the old browser takes no new leases and is closed once its in-flight
+    scrapes finish.
+    """
     
-    def __init__(self, size: int = 3):
+    def __init__(
+        self,
+        size: int = 3,
+        max_pages_per_context: Optional[int] = None,
+        max_idle_contexts: Optional[int] = None,
+        pages_per_browser: Optional[int] = None
+    ):
         self.size = size
         self.browsers: List[BrowserManager] = []
-        self.available: asyncio.Queue = asyncio.Queue()
         self.lock = asyncio.Lock()
         self._started = False
+        self.playwright: Optional[Playwright] = None
+        
+        # Page slots leased per browser
+        self.pages_per_browser = pages_per_browser or int(os.getenv("BROWSER_PAGES_PER_BROWSER", "10"))
+        self.leases: Dict[BrowserManager, int] = {}
+        self.slot_available = asyncio.Condition()
+        
+        # Warm contexts per browser, most recently used last
+        self.max_pages_per_context = max_pages_per_context or int(os.getenv("CONTEXT_MAX_PAGES", "50"))
+        self.max_idle_contexts = max_idle_contexts or int(
+            os.getenv("CONTEXT_POOL_SIZE", str(self.pages_per_browser))
+        )
+        self.prewarm_contexts = os.getenv("CONTEXT_PREWARM", "true").lower() == "true"
+        self.idle_contexts: Dict[BrowserManager, List[PooledContext]] = {}
+        
+        # Health tracking and recycling thresholds
+        self.health: Dict[BrowserManager, BrowserHealth] = {}
+        self.max_pages_per_browser = int(os.getenv("BROWSER_MAX_PAGES", "2000"))
+        self.max_rss_bytes = int(os.getenv("BROWSER_MAX_RSS_MB", "1500")) * 1024 * 1024
+        self.max_consecutive_failures = int(os.getenv("BROWSER_MAX_CONSECUTIVE_FAILURES", "5"))
+        self.health_interval = float(os.getenv("BROWSER_HEALTH_INTERVAL", "30"))
+        self.drain_timeout = float(os.getenv("BROWSER_DRAIN_TIMEOUT", "120"))
+        self.acquire_timeout = float(os.getenv("BROWSER_ACQUIRE_TIMEOUT", "120"))
+        # Browsers being launched to replace retired ones
+        self.launching = 0
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._background_tasks: set = set()
     
     async def start(self):
         """Initialize the browser pool"""
@@ -220,14 +497,18 @@ class BrowserPool:
             if self._started:
                 return
             
+            # One driver process for every browser in the pool
+            self.playwright = await async_playwright().start()
+            
             for i in range(self.size):
-                browser = BrowserManager()
-                await browser.start()
-                self.browsers.append(browser)
-                await self.available.put(browser)
+                await self._add_browser()
             
+            self._monitor_task = asyncio.create_task(self._monitor())
             self._started = True
-            logger.info(f"Browser pool started with {self.size} browsers")
+            logger.info(
+                f"Browser pool started with {self.size} browsers, "
+                f"{self.pages_per_browser} page slots each"
+            )
     
     async def stop(self):
         """Stop all browsers in the pool"""
@@ -235,26 +516,391 @@ class BrowserPool:
             if not self._started:
                 return
             
+            # Browsers closing below must not be treated as crashes
+            self._started = False
+            
+            if self._monitor_task:
+                self._monitor_task.cancel()
+                self._monitor_task = None
+            for task in list(self._background_tasks):
+                task.cancel()
+            
             for browser in self.browsers:
                 await browser.stop()
             
+            if self.playwright:
+                await self.playwright.stop()
+                self.playwright = None
+            
             self.browsers.clear()
-            # Clear the queue
-            while not self.available.empty():
-                await self.available.get()
+            self.idle_contexts.clear()
+            self.leases.clear()
+            self.health.clear()
             
-            self._started = False
             logger.info("Browser pool stopped")
     
+    async def _add_browser(self) -> BrowserManager:
+        """Launch a browser into the pool"""
+        browser = BrowserManager()
+        await browser.start(self.playwright)
+        
+        health = BrowserHealth()
+        self.health[browser] = health
+        self.idle_contexts[browser] = []
+        if self.prewarm_contexts:
+            # Default desktop text-only context, ready for the first scrape
+            blocking = BLOCKING_PROFILES["text-only"]
+            try:
+                pooled = await self._create_pooled_context(
+                    browser, self.context_key(blocking=blocking), blocking=blocking
+                )
+            except Exception:
+                # Don't leave a browser process behind that the pool doesn't track
+                self.health.pop(browser, None)
+                self.idle_contexts.pop(browser, None)
+                await browser.stop()
+                raise
+            self.idle_contexts[browser].append(pooled)
+        
+        def on_disconnected(_):
+            health.disconnects += 1
+            self._schedule_retire(browser, "disconnected")
+        
+        if browser.browser:
+            browser.browser.on("disconnected", on_disconnected)
+        
+        self.leases[browser] = 0
+        self.browsers.append(browser)
+        return browser
+    
+    def _retire_reason(self, browser: BrowserManager) -> Optional[str]:
+        """Why a browser should be replaced, or None if it is healthy"""
+        health = self.health.get(browser)
+        if health is None or health.retiring:
+            return None
+        if not browser.is_connected():
+            return "disconnected"
+        if health.consecutive_failures >= self.max_consecutive_failures:
+            return f"{health.consecutive_failures} consecutive failures"
+        if health.pages_served >= self.max_pages_per_browser:
+            return f"served {health.pages_served} pages"
+        if health.rss_bytes and health.rss_bytes >= self.max_rss_bytes:
+            return f"RSS {health.rss_bytes // (1024 * 1024)}MB"
+        return None
+    
+    def _schedule_retire(self, browser: BrowserManager, reason: str):
+        """Start replacing a browser without blocking the caller"""
+        health = self.health.get(browser)
+        if not self._started or health is None or health.retiring:
+            return
+        health.retiring = True
+        
+        task = asyncio.create_task(self._replace(browser, reason))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _replace(self, browser: BrowserManager, reason: str):
+        """Launch a replacement, then drain and close the retired browser"""
+        logger.warning(f"Recycling browser {browser.instance_id[:8]}: {reason}")
+        
+        self.launching += 1
+        try:
+            async with self.lock:
+                await self._add_browser()
+        except Exception as e:
+            logger.error(f"Failed to launch replacement browser: {e}", exc_info=True)
+        finally:
+            self.launching -= 1
+        
+        # Wakes waiters for the new browser's slots, or to give up if there is none
+        async with self.slot_available:
+            self.slot_available.notify_all()
+        
+        # Let in-flight scrapes finish on the old browser
+        deadline = time.monotonic() + self.drain_timeout
+        while self.leases.get(browser, 0) > 0 and time.monotonic() < deadline:
+            if not browser.is_connected():
+                break
+            await asyncio.sleep(0.5)
+        
+        for pooled in self.idle_contexts.pop(browser, []):
+            await pooled.close()
+        if browser in self.browsers:
+            self.browsers.remove(browser)
+        self.leases.pop(browser, None)
+        self.health.pop(browser, None)
+        await browser.stop()
+    
+    async def _monitor(self):
+        """Periodically sample browser memory and retire unhealthy browsers"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                for browser in list(self.browsers):
+                    health = self.health.get(browser)
+                    if health is None or health.retiring:
+                        continue
+                    health.rss_bytes = await asyncio.to_thread(browser.memory_usage)
+                    reason = self._retire_reason(browser)
+                    if reason:
+                        self._schedule_retire(browser, reason)
+            except Exception as e:
+                logger.error(f"Browser health check failed: {e}")
+    
+    def _least_loaded(self) -> Optional[BrowserManager]:
+        """Browser with the fewest leased slots, or None if all are full"""
+        best = None
+        for browser in self.browsers:
+            health = self.health.get(browser)
+            if health and health.retiring:
+                continue
+            in_use = self.leases.get(browser, 0)
+            if in_use < self.pages_per_browser and (
+                best is None or in_use < self.leases[best]
+            ):
+                best = browser
+        return best
+    
+    def _serving(self) -> bool:
+        """Whether any browser takes new leases or is being launched"""
+        return self.launching > 0 or any(
+            not self.health[browser].retiring
+            for browser in self.browsers
+            if browser in self.health
+        )
+    
+    async def _relaunch(self):
+        """Launch a browser when every browser was retired and none could be replaced"""
+        async with self.lock:
+            if self._serving():
+                return
+            logger.warning("No browsers left in the pool, launching one")
+            self.launching += 1
+            try:
+                await self._add_browser()
+            finally:
+                self.launching -= 1
+    
     async def acquire(self) -> BrowserManager:
-        """Get an available browser from the pool"""
+        """
+        Lease a page slot on the least-loaded browser
+        
+        Raises RuntimeError when no slot frees up within acquire_timeout, or
+        when the pool has no browsers left and none can be launched.
+        """
         if not self._started:
             await self.start()
-        return await self.available.get()
+        if not self._serving():
+            await self._relaunch()
+        
+        deadline = time.monotonic() + self.acquire_timeout
+        async with self.slot_available:
+            browser = self._least_loaded()
+            while browser is None:
+                if not self._serving():
+                    raise RuntimeError("No browsers left in the pool")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError(f"No browser page slot free after {self.acquire_timeout:.0f}s")
+                try:
+                    await asyncio.wait_for(self.slot_available.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                browser = self._least_loaded()
+            
+            self.leases[browser] += 1
+            return browser
     
     async def release(self, browser: BrowserManager):
-        """Return a browser to the pool"""
-        await self.available.put(browser)
+        """Return a page slot to the pool"""
+        async with self.slot_available:
+            if browser in self.leases:
+                self.leases[browser] = max(0, self.leases[browser] - 1)
+            self.slot_available.notify()
+    
+    @property
+    def slots_total(self) -> int:
+        """Page slots of the pool at full size; retired browsers are replaced to keep it there"""
+        return self.size * self.pages_per_browser
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report page slot usage and browser health
+        
+        Returns:
+            Dictionary with pool-wide and per-browser slot counts
+        """
+        per_browser = [self.leases.get(browser, 0) for browser in self.browsers]
+        return {
+            "browsers": len(self.browsers),
+            "slots_per_browser": self.pages_per_browser,
+            "slots_total": self.slots_total,
+            "slots_in_use": sum(per_browser),
+            "slots_in_use_per_browser": per_browser,
+            "idle_contexts": sum(len(idle) for idle in self.idle_contexts.values()),
+            "health": [
+                self.health[browser].to_dict()
+                for browser in self.browsers
+                if browser in self.health
+            ]
+        }
+    
+    @staticmethod
+    def context_key(
+        mobile: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[List[Dict[str, Any]]] = None,
+        proxy: Optional[Dict[str, str]] = None,
+        blocking: Optional[BlockingProfile] = None,
+        javascript_enabled: bool = True
+    ) -> Tuple:
+        """Build the key under which equivalent contexts are shared"""
+        cookie_jar = None
+        if cookies:
+            cookie_jar = hashlib.sha1(
+                json.dumps(cookies, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+        
+        return (
+            mobile,
+            tuple(sorted((headers or {}).items())),
+            tuple(sorted((proxy or {}).items())),
+            cookie_jar,
+            blocking.key if blocking else None,
+            javascript_enabled
+        )
+    
+    async def _create_pooled_context(
+        self,
+        browser: BrowserManager,
+        key: Tuple,
+        mobile: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[List[Dict[str, Any]]] = None,
+        proxy: Optional[Dict[str, str]] = None,
+        blocking: Optional[BlockingProfile] = None,
+        javascript_enabled: bool = True
+    ) -> PooledContext:
+        """Create a context and page on a browser for the context pool"""
+        context = await browser.create_context(
+            mobile=mobile,
+            headers=headers,
+            cookies=cookies,
+            proxy=proxy,
+            javascript_enabled=javascript_enabled
+        )
+        blocker = ResourceBlocker(blocking) if blocking else None
+        page = await browser.create_page(context, blocker=blocker)
+        return PooledContext(browser, context, page, key, cookies, blocker)
+    
+    async def acquire_context(
+        self,
+        mobile: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[List[Dict[str, Any]]] = None,
+        proxy: Optional[Dict[str, str]] = None,
+        blocking: Optional[BlockingProfile] = None,
+        javascript_enabled: bool = True
+    ) -> PooledContext:
+        """
+        Get a warm context and page for a scrape
+        
+        Reuses an idle context with the same options when one exists on the
+        acquired browser, otherwise creates a new one.
+        
+        Args:
+            mobile: Use mobile viewport
+            headers: Custom HTTP headers
+            cookies: Browser cookies
+            proxy: Proxy configuration
+            blocking: Resource blocking profile
+            javascript_enabled: Run page scripts
+            
+        Returns:
+            PooledContext that must be returned with release_context
+        """
+        browser = await self.acquire()
+        key = self.context_key(mobile, headers, cookies, proxy, blocking, javascript_enabled)
+        
+        try:
+            pooled = None
+            idle = self.idle_contexts.setdefault(browser, [])
+            for i in range(len(idle) - 1, -1, -1):
+                if idle[i].key == key:
+                    pooled = idle.pop(i)
+                    break
+            
+            if pooled is None:
+                pooled = await self._create_pooled_context(
+                    browser, key, mobile, headers, cookies, proxy, blocking, javascript_enabled
+                )
+            
+            # Blocking counters are reported per scrape
+            if pooled.blocker:
+                pooled.blocker.reset_stats()
+            return pooled
+        except Exception:
+            await self.release(browser)
+            raise
+    
+    async def release_context(self, pooled: PooledContext, reusable: bool = True, browser_fault: bool = False):
+        """
+        Return a context to the pool
+        
+        The context is reset for the next scrape, or closed when it has
+        served max_pages_per_context pages or is no longer usable.
+        
+        Args:
+            pooled: Context obtained from acquire_context
+            reusable: False to discard the context (e.g. after an unexpected error)
+            browser_fault: The scrape failed because the browser or context
+                broke; counts towards retiring the browser
+        """
+        browser = pooled.browser
+        pooled.pages_served += 1
+        
+        health = self.health.get(browser)
+        if pooled.crashed:
+            reusable = False
+            browser_fault = True
+        if browser_fault:
+            reusable = False
+        if health:
+            health.pages_served += 1
+            health.crashes += int(pooled.crashed)
+            if browser_fault:
+                health.consecutive_failures += 1
+            elif reusable:
+                health.consecutive_failures = 0
+            reason = self._retire_reason(browser)
+            if reason:
+                self._schedule_retire(browser, reason)
+        
+        try:
+            if not reusable or pooled.pages_served >= self.max_pages_per_context:
+                await pooled.close()
+                return
+            
+            try:
+                clean = await pooled.reset()
+            except Exception as e:
+                logger.warning(f"Failed to reset pooled context, discarding: {e}")
+                clean = False
+            if not clean:
+                await pooled.close()
+                return
+            
+            idle = self.idle_contexts.get(browser)
+            if idle is None:
+                # Browser left the pool while the context was in use
+                await pooled.close()
+                return
+            
+            idle.append(pooled)
+            while len(idle) > self.max_idle_contexts:
+                await idle.pop(0).close()
+        finally:
+            await self.release(browser)
     
     async def __aenter__(self):
         await self.start()
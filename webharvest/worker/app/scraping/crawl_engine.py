@@ -0,0 +1,156 @@
+"""
+Concurrent crawl engine
+Runs a pool of async workers over a WebCrawler frontier, feeding discovered links back as pages finish
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.scraping.crawler import WebCrawler
+
+logger = logging.getLogger(__name__)
+
+# Scrapes one URL and returns the links to follow from it
+PageHandler = Callable[[str], Awaitable[Optional[List[str]]]]
+
+
+class CrawlEngine:
+    """
+    Crawl a frontier with up to `concurrency` pages in flight
+    
+    Workers take URLs from the crawler, so depth limits, max_pages, URL
+    filters and per-host politeness (see HostFrontier) apply as before. A
+    page's links join the frontier when it finishes. A worker that finds no
+    host ready waits for the next one to become ready or for pages in
+    flight to add links, rather than ending the crawl.
+    """
+    
+    def __init__(
+        self,
+        crawler: WebCrawler,
+        handle_page: PageHandler,
+        concurrency: int = 5
+    ):
+        """
+        Set up an engine
+        
+        Args:
+            crawler: Frontier, filters and limits of the crawl
+            handle_page: Coroutine that scrapes a URL and returns the links to follow
+            concurrency: Workers, i.e. the most pages in flight at once
+        """
+        self.crawler = crawler
+        self.handle_page = handle_page
+        self.concurrency = max(1, concurrency)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.pages = 0
+        self.errors = 0
+        # Bumped whenever a finished or rejected page may have made URLs ready
+        self._generation = 0
+        self._changed: Optional[asyncio.Condition] = None
+    
+    async def run(self) -> Dict[str, int]:
+        """
+        Crawl until the frontier is empty and nothing is in flight, or the page budget is spent
+        
+        Returns:
+            Pages handled, handler errors and the most pages that were in flight at once
+        """
+        self._changed = asyncio.Condition()
+        await self.crawler.start()
+        
+        await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        
+        return {"pages": self.pages, "errors": self.errors, "peak_in_flight": self.peak_in_flight}
+    
+    async def _take(self) -> Optional[str]:
+        """Next URL to crawl, waiting while pages in flight may still add links"""
+        while True:
+            url = await self._candidate()
+            if url is None:
+                return None
+            
+            # robots.txt may need fetching for a new host; the other workers
+            # keep taking URLs and finishing pages meanwhile
+            try:
+                admitted = await self.crawler.admit(url)
+            except Exception as e:
+                admitted = False
+                logger.error(f"Error checking {url}: {e}", exc_info=True)
+            
+            async with self._changed:
+                if admitted:
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                else:
+                    self.in_flight -= 1
+                # Either way the URL's host may be taken again
+                self._generation += 1
+                self._changed.notify_all()
+            if admitted:
+                return url
+    
+    async def _candidate(self) -> Optional[str]:
+        """Pop a URL to check, counted as in flight, or None when the crawl is done"""
+        while True:
+            # A claim in progress counts as in flight, so other workers don't
+            # end the crawl while it may still return a URL
+            async with self._changed:
+                self.in_flight += 1
+                generation = self._generation
+            
+            # Outside the lock: a shared frontier claims over the network
+            try:
+                url = await self.crawler.next_candidate()
+            except Exception:
+                async with self._changed:
+                    self.in_flight -= 1
+                    # Workers waiting on this claim would otherwise never wake
+                    self._changed.notify_all()
+                raise
+            if url is not None:
+                return url
+            
+            async with self._changed:
+                self.in_flight -= 1
+                # Claim again once pages finished (adding links, or handing
+                # back budget a rejected URL reserved) or a host is ready;
+                # finished pages during the claim count too
+                while self._generation == generation:
+                    ready_in = self.crawler.frontier.ready_in()
+                    if self.in_flight == 0 and (self.crawler.exhausted or ready_in is None):
+                        # Wake the other waiting workers so they finish too
+                        self._changed.notify_all()
+                        return None
+                    
+                    try:
+                        await asyncio.wait_for(
+                            self._changed.wait(), None if self.crawler.exhausted else ready_in
+                        )
+                    except asyncio.TimeoutError:
+                        break
+    
+    async def _worker(self):
+        while True:
+            url = await self._take()
+            if url is None:
+                return
+            
+            links = None
+            try:
+                links = await self.handle_page(url)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error crawling {url}: {e}", exc_info=True)
+            finally:
+                # Outside the lock: a shared frontier queues links over the network
+                try:
+                    await self.crawler.page_done(url, links)
+                except Exception as e:
+                    logger.error(f"Error queueing links from {url}: {e}", exc_info=True)
+                async with self._changed:
+                    self.in_flight -= 1
+                    self.pages += 1
+                    self._generation += 1
+                    self._changed.notify_all()
@@ -5,14 +5,16 @@ Web crawler module for discovering and crawling websites
 import asyncio
 import re
 import logging
-from typing import Set, Dict, Any, List, Optional, AsyncIterator
+from typing import Set, Dict, Any, List, Optional, AsyncIterator, Tuple
 from urllib.parse import urlparse, urljoin, urlunparse
-from collections import deque
 import xml.etree.ElementTree as ET
 import httpx
 
 from app.scraping.scraper import WebScraper, ScraperPool
 from app.scraping.extractor import ContentExtractor
+from app.scraping.frontier import HostFrontier
+from app.scraping.url_priority import UrlScorer, parse_lastmod
+from app.scraping.url_store import UrlStateStore
 
 logger = logging.getLogger(__name__)
 
@@ -101,7 +103,8 @@ class RobotsTxtParser:
     """Parse and check robots.txt rules"""
     
     def __init__(self):
-        self.rules_cache: Dict[str, Dict[str, Any]] = {}
+        # robots.txt URL -> content (None when the site has none)
+        self.rules_cache: Dict[str, Optional[str]] = {}
     
     async def fetch_robots_txt(self, url: str) -> Optional[str]:
         """Fetch robots.txt for a domain"""
@@ -111,15 +114,18 @@ class RobotsTxtParser:
         if robots_url in self.rules_cache:
             return self.rules_cache[robots_url]
         
+        content = None
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.get(robots_url, timeout=5.0)
                 if response.status_code == 200:
-                    return response.text
+                    content = response.text
         except Exception as e:
             logger.debug(f"Failed to fetch robots.txt from {robots_url}: {e}")
         
-        return None
+        # Once per site per crawl, not once per URL
+        self.rules_cache[robots_url] = content
+        return content
     
     def parse_robots_txt(self, content: str, user_agent: str = "*") -> Dict[str, Any]:
         """Parse robots.txt content"""
@@ -198,6 +204,14 @@ class RobotsTxtParser:
         
         return True
     
+    def crawl_delay(self, url: str, user_agent: str = "*") -> float:
+        """Crawl-delay in seconds from an already fetched robots.txt (0 when unknown)"""
+        parsed = urlparse(url)
+        content = self.rules_cache.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+        if not content:
+            return 0.0
+        return self.parse_robots_txt(content, user_agent)["crawl_delay"]
+    
     def _matches_pattern(self, path: str, pattern: str) -> bool:
         """Check if path matches robots.txt pattern"""
         # Convert robots.txt pattern to regex
@@ -225,6 +239,11 @@ class SitemapParser:
     @staticmethod
     def parse_sitemap(content: str) -> List[str]:
         """Parse sitemap XML and extract URLs"""
+        return [entry["loc"] for entry in SitemapParser.parse_sitemap_entries(content)]
+    
+    @staticmethod
+    def parse_sitemap_entries(content: str) -> List[Dict[str, Any]]:
+        """Parse sitemap XML into loc, priority (None when absent) and lastmod entries"""
         urls = []
         
         try:
@@ -244,7 +263,16 @@ class SitemapParser:
             for url_elem in root.findall('.//url'):
                 loc = url_elem.find('loc')
                 if loc is not None and loc.text:
-                    urls.append(loc.text)
+                    priority = url_elem.findtext('priority')
+                    try:
+                        priority = float(priority) if priority else None
+                    except ValueError:
+                        priority = None
+                    urls.append({
+                        "loc": loc.text.strip(),
+                        "priority": priority,
+                        "lastmod": url_elem.findtext('lastmod')
+                    })
         
         except Exception as e:
             logger.error(f"Failed to parse sitemap: {e}")
@@ -291,7 +319,9 @@ class WebCrawler:
         allow_subdomains: bool = False,
         ignore_query_params: bool = False,
         respect_robots_txt: bool = True,
-        sitemap_mode: str = "include"  # include, ignore, only
+        sitemap_mode: str = "include",  # include, ignore, only
+        delay_ms: int = 0,
+        priority_paths: Optional[Dict[str, float]] = None
     ):
         self.seed_url = URLNormalizer.normalize(seed_url)
         self.max_depth = max_depth
@@ -306,9 +336,12 @@ class WebCrawler:
         
         self.normalizer = URLNormalizer()
         self.robots_parser = RobotsTxtParser()
-        self.visited: Set[str] = set()
-        self.to_visit: deque = deque()
-        self.depth_map: Dict[str, int] = {}
+        # Per-host queues, best first; delay_ms apart per host, longer if robots.txt or backoff says so
+        self.frontier = HostFrontier(delay_ms)
+        self.scorer = UrlScorer(priority_paths)
+        self.delay_hosts: Set[str] = set()
+        # Every URL seen, with its depth and whether it was crawled, as 64-bit fingerprints
+        self.urls = UrlStateStore()
         self.discovered_count = 0
     
     async def discover_urls(self) -> AsyncIterator[str]:
@@ -318,62 +351,118 @@ class WebCrawler:
         Yields:
             Normalized URLs to crawl
         """
-        # Start with seed URL
-        self.to_visit.append(self.seed_url)
-        self.depth_map[self.seed_url] = 0
+        await self.start()
+        
+        while True:
+            url = await self.next_url()
+            if url is None:
+                wait = self.frontier.ready_in()
+                if wait is None or self.exhausted:
+                    return
+                await asyncio.sleep(wait)
+                continue
+            yield url
+    
+    async def start(self):
+        """Queue the seed URL and, unless sitemaps are ignored, the sitemap URLs"""
+        # The seed goes first whatever the sitemaps rank highest
+        self.frontier.push(self.seed_url, float("inf"))
+        self.urls.add(self.seed_url, 0)
         
-        # Process sitemap if needed
         if self.sitemap_mode in ["include", "only"]:
             await self._process_sitemaps()
+    
+    @property
+    def exhausted(self) -> bool:
+        """Whether the page budget is spent"""
+        return self.discovered_count >= self.max_pages
+    
+    async def next_url(self) -> Optional[str]:
+        """
+        Take the next URL to crawl off the frontier
         
-        if self.sitemap_mode == "only":
-            # Only use sitemap URLs
-            while self.to_visit and self.discovered_count < self.max_pages:
-                url = self.to_visit.popleft()
-                if await self._should_crawl(url):
-                    self.visited.add(url)
-                    self.discovered_count += 1
-                    yield url
-            return
+        Returns:
+            Normalized URL, marked visited, or None when no host is ready
+            (see frontier.ready_in()), the frontier is empty for now (pages
+            still being scraped may add links) or the page budget is spent
+        """
+        while True:
+            url = await self.next_candidate()
+            if url is None:
+                return None
+            if await self.admit(url):
+                return url
+    
+    async def next_candidate(self) -> Optional[str]:
+        """
+        Pop the next unvisited URL, reserving a page of the budget for it
+        
+        No I/O happens here; pass the URL to admit() afterwards, which may
+        fetch robots.txt.
         
-        # Regular crawling with discovery
-        while self.to_visit and self.discovered_count < self.max_pages:
-            current_url = self.to_visit.popleft()
-            current_depth = self.depth_map.get(current_url, 0)
+        Returns:
+            Normalized URL, or None as for next_url()
+        """
+        while not self.exhausted:
+            url = self.frontier.pop()
+            if url is None:
+                return None
             
             # Skip if already visited
-            if current_url in self.visited:
-                continue
-            
-            # Check if should crawl
-            if not await self._should_crawl(current_url):
+            if self.urls.is_visited(url):
+                self.frontier.release(url)
                 continue
             
-            # Mark as visited and yield
-            self.visited.add(current_url)
             self.discovered_count += 1
-            yield current_url
-            
-            # Discover new URLs if not at max depth
-            if current_depth < self.max_depth:
-                # This would normally extract links from the page
-                # For now, we'll use a placeholder
-                # In real implementation, this would scrape the page and extract links
-                pass
+            return url
+        return None
+    
+    async def admit(self, url: str) -> bool:
+        """
+        Check a URL from next_candidate() against the crawl rules and robots.txt
+        
+        Returns:
+            Whether to crawl it; a rejected URL gives its page of the budget back
+        """
+        if not await self._should_crawl(url):
+            self.discovered_count -= 1
+            self.frontier.release(url)
+            return False
+        
+        # The site's Crawl-delay is known once its robots.txt has been read
+        host = self.frontier.host(url)
+        if self.respect_robots_txt and host not in self.delay_hosts:
+            self.delay_hosts.add(host)
+            self.frontier.set_crawl_delay(host, self.robots_parser.crawl_delay(url))
+        
+        self.frontier.dispatched(url)
+        self.urls.mark_visited(url)
+        return True
     
     async def _process_sitemaps(self):
         """Process sitemaps and add URLs to queue"""
+        for normalized, score in await self._sitemap_entries():
+            # Sitemap URLs start at depth 0
+            if self.urls.add(normalized, 0):
+                self.frontier.push(normalized, score)
+    
+    async def _sitemap_entries(self) -> List[Tuple[str, float]]:
+        """Normalized URLs of the site's sitemaps, scored with their priority and lastmod"""
+        entries = []
         sitemaps = await SitemapParser.discover_sitemaps(self.seed_url)
         
         for sitemap_url in sitemaps:
             content = await SitemapParser.fetch_sitemap(sitemap_url)
             if content:
-                urls = SitemapParser.parse_sitemap(content)
-                for url in urls:
-                    normalized = self.normalizer.normalize(url, self.ignore_query_params)
-                    if normalized not in self.visited and normalized not in self.depth_map:
-                        self.to_visit.append(normalized)
-                        self.depth_map[normalized] = 0  # Sitemap URLs start at depth 0
+                for entry in SitemapParser.parse_sitemap_entries(content):
+                    normalized = self.normalizer.normalize(entry["loc"], self.ignore_query_params)
+                    # An absent <priority> means the default 0.5
+                    priority = entry["priority"] if entry["priority"] is not None else 0.5
+                    entries.append((
+                        normalized,
+                        self.scorer.score(normalized, 0, priority, parse_lastmod(entry["lastmod"]))
+                    ))
+        return entries
     
     async def _should_crawl(self, url: str) -> bool:
         """Check if URL should be crawled based on rules"""
@@ -408,13 +497,26 @@ class WebCrawler:
     
     def add_discovered_urls(self, urls: List[str], source_depth: int):
         """Add newly discovered URLs to the queue"""
-        for url in urls:
-            normalized = self.normalizer.normalize(url, self.ignore_query_params)
-            
-            # Skip if already seen
-            if normalized in self.visited or normalized in self.depth_map:
-                continue
-            
-            # Add to queue with incremented depth
-            self.to_visit.append(normalized)
-            self.depth_map[normalized] = source_depth + 1
\ No newline at end of file
+        # Only sitemap URLs are crawled in sitemap-only mode
+        if self.sitemap_mode == "only" or source_depth >= self.max_depth:
+            return
+        
+        # A page linking to a URL twice is one in-link
+        normalized_urls = {self.normalizer.normalize(url, self.ignore_query_params): None for url in urls}
+        
+        for normalized in normalized_urls:
+            # Add to queue with incremented depth; another link to a queued URL raises its priority
+            depth = source_depth + 1
+            if self.urls.add(normalized, depth):
+                self.frontier.push(normalized, self.scorer.score(normalized, depth))
+            elif not self.urls.is_visited(normalized):
+                self.frontier.add_inlink(normalized)
+    
+    async def page_done(self, url: str, links: Optional[List[str]]):
+        """Queue the links of a crawled page"""
+        if links:
+            self.add_discovered_urls(links, self.urls.depth(url, 0))
+    
+    def close(self):
+        """Release the frontier's on-disk spill"""
+        self.frontier.close()
\ No newline at end of file
@@ -0,0 +1,554 @@
+"""
+Distributed crawl frontier
+Queues, dedup set and URL leases of one crawl job in Redis, so shard tasks on many workers can crawl it together
+"""
+
+import asyncio
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.scraping.crawler import WebCrawler
+from app.scraping.frontier import MAX_CRAWL_DELAY, HostFrontier
+from app.scraping.url_priority import INLINK_WEIGHT, MAX_INLINKS
+from app.scraping.url_store import fingerprint
+from app.utils.rate_limiter import BACKOFF_STATUS_CODES, backoff_for
+
+logger = logging.getLogger(__name__)
+
+# Keys, under crawl:<job id>:
+#   seen      hash  URL fingerprint -> depth (the dedup set)
+#   inlinks   hash  URL fingerprint -> links found to it
+#   q:<host>  zset  queued URLs -> priority
+#   hosts     zset  hosts with queued URLs -> time (ms) they may next be fetched
+#   next      hash  host -> time (ms) it may next be fetched
+#   delays    hash  host -> delay (ms) between fetches
+#   backoffs  hash  host -> backoff (ms) after 429/5xx responses
+#   leases    zset  claimed URLs -> lease expiry (ms)
+#   claims    hash  claimed URL -> "<host> <priority> <shard>", to requeue it
+#   workers   zset  shard -> heartbeat expiry (ms)
+#   stats     hash  claimed (page budget spent), discovered, completed, failed
+# and crawl-finished:<job id>, set by the last shard to leave, outlives the others
+# so shards started after the crawl finished don't recreate or complete it
+
+# Seconds the finished marker is kept after the crawl's other keys are deleted
+FINISHED_TTL_SECONDS = 86400
+
+# ARGV: prefix, default delay ms, inlink weight, max inlinks, then (fingerprint, host, url, depth, priority) per URL
+PUSH_SCRIPT = """
+local prefix = ARGV[1]
+local added = 0
+for i = 5, #ARGV, 5 do
+    local fp, host, url = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    local queue = prefix .. ':q:' .. host
+    if redis.call('HSETNX', prefix .. ':seen', fp, ARGV[i + 3]) == 1 then
+        redis.call('ZADD', queue, ARGV[i + 4], url)
+        local ready = redis.call('HGET', prefix .. ':next', host) or '0'
+        redis.call('ZADD', prefix .. ':hosts', 'NX', ready, host)
+        redis.call('HSETNX', prefix .. ':delays', host, ARGV[2])
+        added = added + 1
+    elseif redis.call('ZSCORE', queue, url) then
+        -- Another link to a URL still queued raises its priority
+        if redis.call('HINCRBY', prefix .. ':inlinks', fp, 1) <= tonumber(ARGV[4]) then
+            redis.call('ZINCRBY', queue, ARGV[3], url)
+        end
+    end
+end
+return added
+"""
+
+# ARGV: prefix, now ms, lease ms, max pages, shard, poll ms
+CLAIM_SCRIPT = """
+local prefix = ARGV[1]
+local now = tonumber(ARGV[2])
+local leases, claims, hosts, stats = prefix .. ':leases', prefix .. ':claims', prefix .. ':hosts', prefix .. ':stats'
+redis.call('ZADD', prefix .. ':workers', now + tonumber(ARGV[3]), ARGV[5])
+
+-- URLs of workers that stopped renewing their leases go back on their host's queue
+for _, url in ipairs(redis.call('ZRANGEBYSCORE', leases, '-inf', now, 'LIMIT', 0, 100)) do
+    local claim = redis.call('HGET', claims, url)
+    if claim then
+        local host, score = string.match(claim, '^(%S+) (%S+) ')
+        redis.call('ZADD', prefix .. ':q:' .. host, score, url)
+        redis.call('ZADD', hosts, 'NX', redis.call('HGET', prefix .. ':next', host) or '0', host)
+        redis.call('HDEL', claims, url)
+        redis.call('HINCRBY', stats, 'claimed', -1)
+    end
+    redis.call('ZREM', leases, url)
+end
+
+if tonumber(redis.call('HGET', stats, 'claimed') or '0') >= tonumber(ARGV[4]) then
+    return {'exhausted'}
+end
+
+local ready = redis.call('ZRANGEBYSCORE', hosts, '-inf', now, 'LIMIT', 0, 1)
+if #ready == 0 then
+    local first = redis.call('ZRANGE', hosts, 0, 0, 'WITHSCORES')
+    if #first > 0 then
+        return {'wait', first[2]}
+    end
+    -- Pages in flight elsewhere may still add links, or their leases may expire
+    local lease = redis.call('ZRANGE', leases, 0, 0, 'WITHSCORES')
+    if #lease > 0 then
+        return {'wait', tostring(math.min(tonumber(lease[2]), now + tonumber(ARGV[6])))}
+    end
+    return {'empty'}
+end
+
+local host = ready[1]
+local queue = prefix .. ':q:' .. host
+local popped = redis.call('ZPOPMAX', queue)
+if #popped == 0 then
+    redis.call('ZREM', hosts, host)
+    return {'wait', tostring(now)}
+end
+
+local delay = tonumber(redis.call('HGET', prefix .. ':delays', host) or '0')
+    + tonumber(redis.call('HGET', prefix .. ':backoffs', host) or '0')
+redis.call('HSET', prefix .. ':next', host, now + delay)
+if redis.call('ZCARD', queue) > 0 then
+    redis.call('ZADD', hosts, now + delay, host)
+else
+    redis.call('ZREM', hosts, host)
+end
+
+redis.call('HINCRBY', stats, 'claimed', 1)
+redis.call('ZADD', leases, now + tonumber(ARGV[3]), popped[1])
+redis.call('HSET', claims, popped[1], host .. ' ' .. popped[2] .. ' ' .. ARGV[5])
+return {'url', popped[1]}
+"""
+
+# ARGV: prefix, now ms, url, host, counted (1/0), backoff ms (-1 keeps it, 0 clears it), shard
+ACK_SCRIPT = """
+local prefix = ARGV[1]
+local claim = redis.call('HGET', prefix .. ':claims', ARGV[3])
+if not claim or string.match(claim, '(%S+)$') ~= ARGV[7] then
+    -- The lease expired and the URL went back on the queue; leave it to its new claim
+    return 0
+end
+redis.call('ZREM', prefix .. ':leases', ARGV[3])
+redis.call('HDEL', prefix .. ':claims', ARGV[3])
+if ARGV[5] == '0' then
+    redis.call('HINCRBY', prefix .. ':stats', 'claimed', -1)
+end
+
+local host, backoff = ARGV[4], tonumber(ARGV[6])
+if backoff == 0 then
+    redis.call('HDEL', prefix .. ':backoffs', host)
+elseif backoff > 0 then
+    redis.call('HSET', prefix .. ':backoffs', host, backoff)
+    local ready = tonumber(ARGV[2]) + backoff
+    if ready > tonumber(redis.call('HGET', prefix .. ':next', host) or '0') then
+        redis.call('HSET', prefix .. ':next', host, ready)
+        redis.call('ZADD', prefix .. ':hosts', 'XX', ready, host)
+    end
+end
+return 1
+"""
+
+# ARGV: prefix, finished key, heartbeat expiry ms, then shard names; returns 0 when the crawl already finished
+JOIN_SCRIPT = """
+if redis.call('EXISTS', ARGV[2]) == 1 then
+    return 0
+end
+for i = 4, #ARGV do
+    redis.call('ZADD', ARGV[1] .. ':workers', ARGV[3], ARGV[i])
+end
+return 1
+"""
+
+# ARGV: prefix, now ms, shard, finished key, finished TTL s
+# Returns the shards still running, or -1 when another shard already finished the crawl
+LEAVE_SCRIPT = """
+local workers = ARGV[1] .. ':workers'
+redis.call('ZREM', workers, ARGV[3])
+if redis.call('EXISTS', ARGV[4]) == 1 then
+    return -1
+end
+redis.call('ZREMRANGEBYSCORE', workers, '-inf', ARGV[2])
+local running = redis.call('ZCARD', workers)
+if running == 0 then
+    redis.call('SET', ARGV[4], ARGV[2], 'EX', ARGV[5])
+end
+return running
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class RedisFrontier:
+    """
+    A crawl job's frontier and dedup set, shared by every shard of the crawl
+    
+    Shards claim the best URL of a host whose delay has passed, so per-host
+    politeness holds across all workers. A claimed URL is leased; a shard
+    acks it once the page is stored, and a shard that dies without acking
+    loses its leases, which puts its URLs back on their queues for the
+    other shards. Lua scripts make claim, ack and push atomic.
+    """
+    
+    def __init__(
+        self,
+        crawl_job_id: str,
+        shard: str,
+        max_pages: int,
+        delay_ms: int = 0,
+        redis_url: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ):
+        """
+        Set up a shard's view of a crawl's frontier
+        
+        Args:
+            crawl_job_id: Crawl job the frontier belongs to
+            shard: Name of this shard, unique within the crawl
+            max_pages: Page budget of the whole crawl
+            delay_ms: Minimum delay between requests to the same host
+            redis_url: Redis to keep the frontier in
+            lease_seconds: How long a claimed URL stays with a shard that isn't heard from
+        """
+        self.prefix = f"crawl:{crawl_job_id}"
+        self.finished_key = f"crawl-finished:{crawl_job_id}"
+        self.shard = shard
+        self.max_pages = max_pages
+        self.delay_ms = max(0, delay_ms)
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.lease_ms = (lease_seconds or int(os.getenv("CRAWL_LEASE_SECONDS", "300"))) * 1000
+        self.poll_ms = int(os.getenv("CRAWL_SHARD_POLL_MS", "1000"))
+        self.redis_client = None
+        self.scripts = {}
+        # Claimed by this shard and not yet acked
+        self.leased: Dict[str, str] = {}
+        # URL -> (status code, Retry-After) reported for a leased URL, applied on ack
+        self.responses: Dict[str, Tuple[int, Optional[int]]] = {}
+        self.backoffs: Dict[str, float] = {}
+        self.exhausted = False
+        self._ready_at: Optional[float] = None
+    
+    @staticmethod
+    def host(url: str) -> str:
+        return HostFrontier.host(url)
+    
+    async def connect(self):
+        """Connect to Redis and load the scripts"""
+        if not self.redis_client:
+            self.redis_client = await redis.from_url(self.redis_url)
+            self.scripts = {
+                name: self.redis_client.register_script(script)
+                for name, script in (
+                    ("push", PUSH_SCRIPT),
+                    ("claim", CLAIM_SCRIPT),
+                    ("ack", ACK_SCRIPT),
+                    ("join", JOIN_SCRIPT),
+                    ("leave", LEAVE_SCRIPT),
+                )
+            }
+    
+    async def disconnect(self):
+        """Disconnect from Redis"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+    
+    async def push(self, entries: List[Tuple[str, int, float]]) -> int:
+        """
+        Queue URLs the crawl hasn't seen; a URL already queued gets an in-link instead
+        
+        Args:
+            entries: (normalized URL, depth, priority) per URL
+            
+        Returns:
+            URLs queued
+        """
+        if not entries:
+            return 0
+        args = [self.prefix, self.delay_ms, INLINK_WEIGHT, MAX_INLINKS]
+        for url, depth, score in entries:
+            args.extend((f"{fingerprint(url):016x}", self.host(url), url, depth, score))
+        return await self.scripts["push"](args=args)
+    
+    async def claim(self) -> Optional[str]:
+        """
+        Lease the best URL of a host that may be fetched now
+        
+        Returns:
+            URL, or None when none is ready (see ready_in()) or the page budget is spent (see exhausted)
+        """
+        now = _now_ms()
+        result = await self.scripts["claim"](
+            args=[self.prefix, now, self.lease_ms, self.max_pages, self.shard, self.poll_ms]
+        )
+        kind = result[0].decode()
+        self._ready_at = None
+        if kind == "url":
+            url = result[1].decode()
+            self.leased[url] = self.host(url)
+            return url
+        if kind == "exhausted":
+            self.exhausted = True
+        elif kind == "wait":
+            self._ready_at = time.monotonic() + max(0, float(result[1]) - now) / 1000
+        return None
+    
+    def ready_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until the last claim said a URL may be ready, or None when the crawl's frontier was empty"""
+        if self._ready_at is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._ready_at - now)
+    
+    def record_response(self, url: str, status_code: int, retry_after: Optional[int] = None):
+        """Remember a leased URL's response; its host's backoff is updated when the URL is acked"""
+        if url in self.leased:
+            self.responses[url] = (status_code, retry_after)
+    
+    def _backoff(self, host: str, status_code: Optional[int], retry_after: Optional[int]) -> int:
+        """Backoff for the host in ms, using DomainRateLimiter's rules: -1 to keep it, 0 to clear it"""
+        if status_code is None:
+            return -1
+        backoff_ms = backoff_for(status_code, self.backoffs.get(host, 0.0), retry_after)
+        if backoff_ms is None:
+            return -1
+        if backoff_ms == 0:
+            self.backoffs.pop(host, None)
+            return 0
+        if status_code in BACKOFF_STATUS_CODES:
+            logger.warning(f"Rate limited on {host}, backoff: {backoff_ms}ms")
+        self.backoffs[host] = backoff_ms
+        return int(backoff_ms)
+    
+    async def ack(self, url: str, counted: bool = True) -> bool:
+        """
+        Finish a leased URL
+        
+        Args:
+            url: URL returned by claim()
+            counted: Whether it counts against the page budget (False for URLs filtered out after claiming)
+            
+        Returns:
+            Whether the lease was still held
+        """
+        host = self.leased.pop(url, self.host(url))
+        status_code, retry_after = self.responses.pop(url, (None, None))
+        return bool(await self.scripts["ack"](args=[
+            self.prefix, _now_ms(), url, host, 1 if counted else 0,
+            self._backoff(host, status_code, retry_after), self.shard
+        ]))
+    
+    async def renew(self):
+        """Extend this shard's heartbeat and the leases of the URLs it is still working on"""
+        expiry = _now_ms() + self.lease_ms
+        pipe = self.redis_client.pipeline()
+        pipe.zadd(f"{self.prefix}:workers", {self.shard: expiry})
+        if self.leased:
+            pipe.zadd(f"{self.prefix}:leases", {url: expiry for url in self.leased}, xx=True)
+        await pipe.execute()
+    
+    async def depth(self, url: str) -> int:
+        """Link depth a URL was queued at"""
+        depth = await self.redis_client.hget(f"{self.prefix}:seen", f"{fingerprint(url):016x}")
+        return int(depth) if depth is not None else 0
+    
+    async def set_crawl_delay(self, host: str, seconds: float):
+        """Honor a robots.txt Crawl-delay for a host, for every shard"""
+        if seconds > 0:
+            delay_ms = int(max(self.delay_ms, min(seconds, MAX_CRAWL_DELAY) * 1000))
+            await self.redis_client.hset(f"{self.prefix}:delays", host, delay_ms)
+    
+    async def count(self, field: str) -> int:
+        """Add one to a crawl-wide counter (discovered, completed, failed) and return the total"""
+        return await self.redis_client.hincrby(f"{self.prefix}:stats", field, 1)
+    
+    async def stats(self) -> Dict[str, int]:
+        """Crawl-wide counters"""
+        stats = await self.redis_client.hgetall(f"{self.prefix}:stats")
+        return {key.decode(): int(value) for key, value in stats.items()}
+    
+    async def join(self, shards: Optional[List[str]] = None) -> bool:
+        """
+        Register this shard as running
+        
+        Args:
+            shards: Other shards to register with it, before their tasks are
+                dispatched, so the crawl can't finish before they start; a
+                shard that never starts drops out when its lease expires
+                
+        Returns:
+            Whether the crawl is still running; False once its last shard has left
+        """
+        args = [self.prefix, self.finished_key, _now_ms() + self.lease_ms, self.shard]
+        args.extend(shard for shard in shards or [] if shard != self.shard)
+        return bool(await self.scripts["join"](args=args))
+    
+    async def leave(self) -> bool:
+        """
+        Unregister this shard
+        
+        Returns:
+            Whether it was the last shard running, which then finishes the job;
+            only ever True for one shard of a crawl
+        """
+        if not self.scripts:
+            return False
+        return await self.scripts["leave"](
+            args=[self.prefix, _now_ms(), self.shard, self.finished_key, FINISHED_TTL_SECONDS]
+        ) == 0
+    
+    async def delete(self):
+        """Drop the crawl's keys"""
+        keys = [key async for key in self.redis_client.scan_iter(match=f"{self.prefix}:*", count=1000)]
+        for i in range(0, len(keys), 1000):
+            await self.redis_client.delete(*keys[i:i + 1000])
+
+
+class DistributedCrawler(WebCrawler):
+    """
+    WebCrawler whose frontier and dedup set live in Redis
+    
+    URL filters, robots.txt and scoring work as in WebCrawler, in each
+    shard; the queue, the URLs seen and the page budget are shared by all
+    of the crawl's shards. Only the coordinating shard seeds the frontier.
+    """
+    
+    def __init__(self, crawl_job_id: str, shard: str, seed: bool = False, **options):
+        """
+        Set up one shard of a crawl
+        
+        Args:
+            crawl_job_id: Crawl job the shard works on
+            shard: Name of this shard, unique within the crawl
+            seed: Queue the seed URL and sitemap URLs (the coordinating shard)
+            **options: WebCrawler options, the same for every shard
+        """
+        super().__init__(**options)
+        self.frontier = RedisFrontier(
+            crawl_job_id, shard, self.max_pages, delay_ms=options.get("delay_ms", 0)
+        )
+        self.seed = seed
+        self.joined = False
+        # Set when the crawl had already finished when this shard started
+        self.finished = False
+        self._keepalive: Optional[asyncio.Task] = None
+    
+    async def start(self, shards: Optional[List[str]] = None):
+        """
+        Join the crawl and, on the coordinating shard, queue the seed and sitemap URLs
+        
+        Args:
+            shards: The crawl's other shards, registered by the coordinating shard before dispatching them
+        """
+        # The coordinating shard starts before dispatching the others, then again in its engine
+        if self.joined or self.finished:
+            return
+        await self.frontier.connect()
+        if not await self.frontier.join(shards):
+            logger.info(f"Crawl {self.frontier.prefix} already finished; shard {self.frontier.shard} not joining")
+            self.finished = True
+            return
+        self.joined = True
+        self._keepalive = asyncio.create_task(self._renew_leases())
+        
+        if self.seed:
+            # The seed goes first whatever the sitemaps rank highest
+            await self.frontier.push([(self.seed_url, 0, float("inf"))])
+            if self.sitemap_mode in ["include", "only"]:
+                await self._process_sitemaps()
+    
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.frontier.lease_ms / 3000)
+            try:
+                await self.frontier.renew()
+            except Exception as e:
+                logger.warning(f"Failed to renew crawl leases: {e}")
+    
+    @property
+    def exhausted(self) -> bool:
+        """Whether the crawl's page budget is spent"""
+        return self.frontier.exhausted
+    
+    async def next_candidate(self) -> Optional[str]:
+        """
+        Claim the next URL from the shared frontier
+        
+        Returns:
+            Normalized URL, leased to this shard, or None when no host is
+            ready (see frontier.ready_in()), the frontier is empty or the
+            page budget is spent
+        """
+        if self.exhausted or not self.joined:
+            return None
+        return await self.frontier.claim()
+    
+    async def admit(self, url: str) -> bool:
+        """
+        Check a claimed URL against the crawl rules and robots.txt
+        
+        Returns:
+            Whether to crawl it; a rejected URL is acked without using the page budget
+        """
+        if not await self._should_crawl(url):
+            await self.frontier.ack(url, counted=False)
+            return False
+        
+        host = self.frontier.host(url)
+        if self.respect_robots_txt and host not in self.delay_hosts:
+            self.delay_hosts.add(host)
+            await self.frontier.set_crawl_delay(host, self.robots_parser.crawl_delay(url))
+        
+        self.discovered_count += 1
+        return True
+    
+    async def _process_sitemaps(self):
+        """Queue the sitemap URLs with their sitemap priority"""
+        entries = await self._sitemap_entries()
+        await self.frontier.push([(normalized, 0, score) for normalized, score in entries])
+    
+    async def page_done(self, url: str, links: Optional[List[str]]):
+        """Queue a crawled page's links and release its lease"""
+        try:
+            if links and self.sitemap_mode != "only":
+                depth = await self.frontier.depth(url)
+                if depth < self.max_depth:
+                    normalized_urls = {self.normalizer.normalize(link, self.ignore_query_params): None for link in links}
+                    await self.frontier.push([
+                        (normalized, depth + 1, self.scorer.score(normalized, depth + 1))
+                        for normalized in normalized_urls
+                    ])
+        finally:
+            await self.frontier.ack(url)
+    
+    async def finish(self) -> Optional[Dict[str, int]]:
+        """
+        Leave the crawl
+        
+        Returns:
+            The crawl's counters when this was the last shard running (its
+            keys are then deleted), otherwise None; also None when the shard
+            never joined the crawl
+        """
+        if self._keepalive:
+            self._keepalive.cancel()
+            self._keepalive = None
+        try:
+            if not self.joined:
+                return None
+            self.joined = False
+            if not await self.frontier.leave():
+                return None
+            stats = await self.frontier.stats()
+            if not stats:
+                logger.warning(f"Crawl {self.frontier.prefix} has no counters left; not completing it again")
+                return None
+            await self.frontier.delete()
+            return stats
+        finally:
+            await self.frontier.disconnect()
+    
+    def close(self):
+        """Nothing is held locally; see finish()"""
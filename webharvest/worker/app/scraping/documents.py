@@ -0,0 +1,318 @@
+"""
+Content extraction for non-HTML documents
+Converts PDFs, plain text, JSON and XML feeds directly, without a browser or HTML extraction
+"""
+
+import io
+import os
+import re
+import json
+import html as html_lib
+import time
+import logging
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin, urlparse
+
+from lxml import etree
+
+from app.scraping.extractor import ContentExtractor
+from app.scraping.format_plan import METADATA_FIELDS
+from app.scraping.near_duplicates import minhash
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_PDF = "pdf"
+DOCUMENT_TEXT = "text"
+DOCUMENT_JSON = "json"
+DOCUMENT_XML = "xml"
+
+# Content types with a direct handler
+CONTENT_TYPES = {
+    "application/pdf": DOCUMENT_PDF,
+    "application/x-pdf": DOCUMENT_PDF,
+    "text/plain": DOCUMENT_TEXT,
+    "text/markdown": DOCUMENT_TEXT,
+    "text/x-markdown": DOCUMENT_TEXT,
+    "text/csv": DOCUMENT_TEXT,
+    "application/json": DOCUMENT_JSON,
+    "text/json": DOCUMENT_JSON,
+    "application/xml": DOCUMENT_XML,
+    "text/xml": DOCUMENT_XML,
+}
+
+# Used when the server sends no content type, or a generic binary one
+EXTENSIONS = {
+    ".pdf": DOCUMENT_PDF,
+    ".txt": DOCUMENT_TEXT,
+    ".md": DOCUMENT_TEXT,
+    ".csv": DOCUMENT_TEXT,
+    ".json": DOCUMENT_JSON,
+    ".xml": DOCUMENT_XML,
+    ".rss": DOCUMENT_XML,
+    ".atom": DOCUMENT_XML,
+}
+GENERIC_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream", "application/download"}
+
+_XML_PARSER_OPTIONS = {"resolve_entities": False, "no_network": True, "remove_comments": True}
+_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def document_kind(content_type: Optional[str], url: Optional[str] = None) -> Optional[str]:
+    """
+    Pick the document handler for a response
+    
+    Args:
+        content_type: Response Content-Type header (None before fetching)
+        url: URL, consulted when the content type is missing or generic
+        
+    Returns:
+        pdf, text, json or xml, or None for HTML and types without a handler
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if "html" in mime:
+        return None
+    if mime in CONTENT_TYPES:
+        return CONTENT_TYPES[mime]
+    if mime.endswith("+json"):
+        return DOCUMENT_JSON
+    # application/rss+xml, application/atom+xml, ...
+    if mime.endswith("+xml"):
+        return DOCUMENT_XML
+    if mime in GENERIC_CONTENT_TYPES and url:
+        path = urlparse(url).path.lower()
+        return EXTENSIONS.get(os.path.splitext(path)[1])
+    return None
+
+
+def _decode(body: bytes, encoding: Optional[str]) -> str:
+    try:
+        return body.decode(encoding or "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def _plain(text: Optional[str]) -> str:
+    """Collapse markup and whitespace in a feed field"""
+    if not text:
+        return ""
+    return _WHITESPACE_RE.sub(' ', html_lib.unescape(_TAG_RE.sub(' ', text))).strip()
+
+
+def _pdf_date(info, attribute: str) -> Optional[str]:
+    try:
+        value = getattr(info, attribute)
+    except Exception:
+        # Malformed date strings are common in the wild
+        return None
+    return value.isoformat() if value else None
+
+
+def _extract_pdf(body: bytes, max_pages: int) -> Dict[str, Any]:
+    """Text of a PDF, one page at a time"""
+    from PyPDF2 import PdfReader
+    
+    reader = PdfReader(io.BytesIO(body))
+    if reader.is_encrypted:
+        # Many PDFs are encrypted with an empty user password
+        reader.decrypt("")
+    
+    page_count = len(reader.pages)
+    pages = []
+    for number in range(min(page_count, max_pages)):
+        try:
+            text = reader.pages[number].extract_text() or ""
+        except Exception as e:
+            logger.debug(f"Could not extract PDF page {number + 1}: {e}")
+            text = ""
+        pages.append(text.strip())
+    
+    metadata = {"pages": page_count, "truncated": page_count > max_pages}
+    info = reader.metadata
+    if info:
+        metadata.update({
+            "title": info.title,
+            "author": info.author,
+            "description": info.subject,
+            "publishedDate": _pdf_date(info, "creation_date"),
+            "modifiedDate": _pdf_date(info, "modification_date"),
+        })
+    return {"text": "\n\n".join(page for page in pages if page), "metadata": metadata, "links": []}
+
+
+def _local_name(element) -> str:
+    return etree.QName(element).localname if isinstance(element.tag, str) else ""
+
+
+def _child(element, name: str):
+    for child in element:
+        if _local_name(child) == name:
+            return child
+    return None
+
+
+def _child_text(element, name: str) -> str:
+    child = _child(element, name)
+    return (child.text or "").strip() if child is not None else ""
+
+
+def _atom_link(entry) -> str:
+    for child in entry:
+        if _local_name(child) == "link" and child.get("rel", "alternate") == "alternate":
+            return child.get("href", "")
+    return ""
+
+
+def _extract_feed(root, url: str) -> Optional[Dict[str, Any]]:
+    """Titles, links and summaries of an RSS or Atom feed, or None if root is not a feed"""
+    kind = _local_name(root)
+    if kind == "feed":
+        channel = items = root
+        item_name = "entry"
+        language = root.get("{http://www.w3.org/XML/1998/namespace}lang")
+    elif kind in ("rss", "RDF"):
+        channel = _child(root, "channel")
+        if channel is None:
+            return None
+        item_name = "item"
+        language = _child_text(channel, "language")
+        # RSS 1.0 keeps items beside the channel, not in it
+        items = root if kind == "RDF" else channel
+    else:
+        return None
+    
+    lines = []
+    links = []
+    title = _plain(_child_text(channel, "title"))
+    description = _plain(_child_text(channel, "description") or _child_text(channel, "subtitle"))
+    if title:
+        lines.append(f"# {title}")
+    if description:
+        lines.append(description)
+    
+    for item in items:
+        if _local_name(item) != item_name:
+            continue
+        link = _atom_link(item) if kind == "feed" else _child_text(item, "link")
+        link = urljoin(url, link) if link else ""
+        item_title = _plain(_child_text(item, "title")) or link
+        if link:
+            links.append(link)
+            lines.append(f"## [{item_title}]({link})")
+        elif item_title:
+            lines.append(f"## {item_title}")
+        
+        date = _child_text(item, "pubDate") or _child_text(item, "published") or _child_text(item, "updated")
+        if date:
+            lines.append(f"*{date}*")
+        summary = _plain(_child_text(item, "description") or _child_text(item, "summary"))
+        if summary:
+            lines.append(summary)
+    
+    return {
+        "text": "\n\n".join(lines),
+        "metadata": {"title": title or None, "description": description or None, "language": language or None},
+        "links": list(dict.fromkeys(links)),
+    }
+
+
+def _extract_xml(body: bytes, encoding: Optional[str], url: str) -> Dict[str, Any]:
+    """An RSS or Atom feed as a list of entries, any other XML as a code block"""
+    try:
+        root = etree.fromstring(body, etree.XMLParser(**_XML_PARSER_OPTIONS))
+    except (etree.XMLSyntaxError, ValueError):
+        root = None
+    
+    if root is not None:
+        feed = _extract_feed(root, url)
+        if feed:
+            feed["metadata"]["feed"] = True
+            return feed
+    
+    return {"text": _decode(body, encoding).strip(), "code": "xml", "metadata": {}, "links": []}
+
+
+def _extract_json(body: bytes, encoding: Optional[str]) -> Dict[str, Any]:
+    """JSON pretty-printed in a code block; invalid JSON is kept as text"""
+    text = _decode(body, encoding)
+    try:
+        text = json.dumps(json.loads(text), indent=2, ensure_ascii=False)
+    except ValueError:
+        return {"text": text.strip(), "metadata": {}, "links": []}
+    return {"text": text, "code": "json", "metadata": {}, "links": []}
+
+
+def extract_document(
+    body: bytes,
+    kind: str,
+    url: str,
+    formats: List[str],
+    encoding: Optional[str] = None,
+    metadata_fields: Optional[List[str]] = None,
+    signature: bool = False,
+    max_pages: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Convert a non-HTML document into the scrape output formats
+    
+    Module-level and free of shared state, so it can run in an extraction
+    worker process like extract_content.
+    
+    Args:
+        body: Response body
+        kind: document_kind() of the response
+        url: Source URL
+        formats: Requested output formats
+        encoding: Response text encoding (text, JSON and XML)
+        metadata_fields: Metadata fields to return (all when None)
+        signature: Return the markdown's minhash signature
+        max_pages: PDF pages to extract (defaults to PDF_MAX_PAGES)
+        
+    Returns:
+        Dictionary shaped like extract_content's: metadata (with documentType),
+        the html, markdown and links formats, and stageTimings in ms
+    """
+    started = time.perf_counter()
+    if max_pages is None:
+        max_pages = int(os.getenv("PDF_MAX_PAGES", "500"))
+    
+    if kind == DOCUMENT_PDF:
+        document = _extract_pdf(body, max_pages)
+    elif kind == DOCUMENT_JSON:
+        document = _extract_json(body, encoding)
+    elif kind == DOCUMENT_XML:
+        document = _extract_xml(body, encoding, url)
+    else:
+        document = {"text": _decode(body, encoding).strip(), "metadata": {}, "links": []}
+    timings = {kind: round((time.perf_counter() - started) * 1000)}
+    
+    text = document["text"]
+    fields = METADATA_FIELDS if metadata_fields is None else [f for f in METADATA_FIELDS if f in metadata_fields]
+    data = {"metadata": {"sourceURL": url, "documentType": kind}}
+    for field in fields:
+        data["metadata"][field] = document["metadata"].get(field)
+    for key in ("pages", "truncated", "feed"):
+        if key in document["metadata"]:
+            data["metadata"][key] = document["metadata"][key]
+    
+    # JSON and XML other than feeds are returned as code blocks
+    code = document.get("code")
+    if "markdown" in formats:
+        markdown = f"```{code}\n{text}\n```" if code else text
+        data["markdown"] = markdown
+        data["contentHash"] = ContentExtractor.calculate_content_hash(markdown)
+        if signature:
+            data["minhash"] = minhash(text)
+    
+    if "html" in formats:
+        language = f' class="language-{code}"' if code else ""
+        data["html"] = f"<pre><code{language}>{html_lib.escape(text)}</code></pre>"
+    
+    if "links" in formats:
+        data["links"] = document["links"]
+    
+    if "images" in formats:
+        data["images"] = []
+    
+    data["stageTimings"] = timings
+    return data
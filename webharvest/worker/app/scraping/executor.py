@@ -0,0 +1,147 @@
+"""
+Process pool for CPU-bound extraction
+Keeps readability and markdown conversion off the event loop so renders and extraction overlap
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.utils.metrics import extraction_cpu_seconds, extraction_pending, extraction_queue_seconds
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict, clock: Callable[[], float] = time.process_time) -> Tuple[Any, float, float]:
+    """Run fn in the worker, reporting when it started and the CPU time it used (by clock)"""
+    started = time.time()
+    cpu_started = clock()
+    result = fn(*args, **kwargs)
+    return result, started, clock() - cpu_started
+
+
+def _default_workers() -> int:
+    """Cores divided between the Celery processes on this host"""
+    celery_processes = max(1, int(os.getenv("WORKER_CONCURRENCY", "1")))
+    return max(1, (os.cpu_count() or 1) // celery_processes)
+
+
+class ExtractionExecutor:
+    """
+    Run extraction jobs in a process pool with bounded queueing
+    
+    At most workers + max_queue jobs are in flight; further callers wait
+    for a slot, which pushes back on the scrapes feeding the pool. With
+    workers=0 jobs run in a thread instead.
+    """
+    
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.workers = workers if workers is not None else int(
+            os.getenv("EXTRACTION_WORKERS", str(_default_workers()))
+        )
+        self.max_queue = max_queue or int(os.getenv("EXTRACTION_MAX_QUEUE", str(max(1, self.workers) * 4)))
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _start(self):
+        """Create the slot semaphore for this loop and the process pool"""
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots = asyncio.Semaphore(max(1, self.workers) + self.max_queue)
+            self._loop = loop
+        
+        if self._pool is None and self.workers > 0:
+            # A fresh interpreter per worker; forking a process that runs
+            # Playwright and an event loop is not safe
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            try:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(method)
+                )
+            except (OSError, ValueError, AssertionError) as e:
+                logger.warning(f"Extraction process pool unavailable, extracting in threads: {e}")
+                self.workers = 0
+    
+    async def run(self, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict[str, int]]:
+        """
+        Run a picklable function in the pool
+        
+        Args:
+            fn: Module-level function to call
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+            
+        Returns:
+            Tuple of the function's result and queue/CPU timings in ms
+        """
+        self._start()
+        submitted = time.time()
+        
+        async with self._slots:
+            self.pending += 1
+            extraction_pending.inc()
+            try:
+                if self._pool:
+                    try:
+                        # A pool worker runs one job at a time, so its process CPU time is the job's
+                        result, started, cpu = await self._loop.run_in_executor(
+                            self._pool, functools.partial(_timed_call, fn, args, kwargs)
+                        )
+                    except BrokenProcessPool:
+                        # A worker died (e.g. out of memory on a huge page); start over next time
+                        logger.error("Extraction worker died, restarting process pool")
+                        self._pool.shutdown(wait=False, cancel_futures=True)
+                        self._pool = None
+                        raise
+                else:
+                    # Other threads share the process; count only this one's CPU time
+                    result, started, cpu = await asyncio.to_thread(
+                        _timed_call, fn, args, kwargs, time.thread_time
+                    )
+            finally:
+                self.pending -= 1
+                extraction_pending.dec()
+        
+        queue_wait = max(0.0, started - submitted)
+        extraction_queue_seconds.observe(queue_wait)
+        extraction_cpu_seconds.observe(cpu)
+        
+        return result, {
+            "extractionQueue": round(queue_wait * 1000),
+            "extractionCpu": round(cpu * 1000)
+        }
+    
+    async def warm(self):
+        """Start the worker processes ahead of the first extraction"""
+        self._start()
+        if self._pool:
+            await asyncio.gather(*[
+                self._loop.run_in_executor(self._pool, int) for _ in range(self.workers)
+            ])
+    
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._pool:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+# Global instance
+_extraction_executor = None
+
+
+def get_extraction_executor() -> ExtractionExecutor:
+    """Get the process extraction executor"""
+    global _extraction_executor
+    if _extraction_executor is None:
+        _extraction_executor = ExtractionExecutor()
+    return _extraction_executor
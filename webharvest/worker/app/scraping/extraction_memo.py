@@ -0,0 +1,200 @@
+"""
+Memoized extraction results
+Byte-identical pages skip readability and markdown conversion entirely
+"""
+
+import hashlib
+import json
+import os
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import redis.asyncio as redis
+
+from app.scraping.format_plan import EXTRACTED_FORMATS
+from app.utils.metrics import extraction_memo_requests, extraction_memo_size_bytes
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction output changes so stale results aren't served
+MEMO_VERSION = 3
+
+
+class ExtractionMemo:
+    """
+    Extraction results keyed by a hash of the raw HTML and extraction options
+    
+    Results are kept compressed in a local LRU bounded by size and, if
+    enabled, in Redis so every worker shares them. Redis errors never fail a
+    scrape; lookups fall back to the local LRU until Redis is reachable again.
+    """
+    
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[int] = None
+    ):
+        self.enabled = os.getenv("EXTRACTION_MEMO", "true").lower() == "true"
+        self.use_redis = os.getenv("EXTRACTION_MEMO_REDIS", "false").lower() == "true"
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = None
+        self.max_bytes = max_bytes or int(os.getenv("EXTRACTION_MEMO_MAX_MB", "64")) * 1024 * 1024
+        self.ttl = ttl or int(os.getenv("EXTRACTION_MEMO_TTL", "86400"))
+        self.local: "OrderedDict[str, bytes]" = OrderedDict()
+        self.local_bytes = 0
+        self.retry_after = 0.0
+    
+    @staticmethod
+    def key(
+        html: str,
+        url: str,
+        formats: List[str],
+        only_main_content: bool = True,
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None,
+        boilerplate: Optional[FrozenSet[str]] = None,
+        metadata_fields: Optional[List[str]] = None,
+        signature: bool = False
+    ) -> str:
+        """
+        Build the memo key for an extraction
+        
+        The URL is part of the key because relative links resolve against it.
+        
+        Args:
+            html: Raw HTML content
+            url: Source URL
+            formats: Requested output formats
+            only_main_content: Extract only main content
+            include_tags: HTML tags to include
+            exclude_tags: HTML tags to exclude
+            boilerplate: Crawl boilerplate template passed to extraction
+            metadata_fields: Metadata fields requested (all when None)
+            signature: Whether the minhash signature is requested
+            
+        Returns:
+            Memo key
+        """
+        options = json.dumps([
+            url,
+            # Formats produced elsewhere don't affect extraction output
+            sorted(set(EXTRACTED_FORMATS).intersection(formats)),
+            only_main_content,
+            include_tags or [],
+            exclude_tags or [],
+            sorted(boilerplate) if boilerplate is not None else None,
+            sorted(metadata_fields) if metadata_fields is not None else None,
+            signature
+        ])
+        digest = hashlib.blake2b(html.encode("utf-8", "surrogatepass"), digest_size=16)
+        digest.update(options.encode("utf-8"))
+        return f"extraction:{MEMO_VERSION}:{digest.hexdigest()}"
+    
+    async def _redis(self):
+        """Redis client, or None when disabled or unavailable"""
+        if not self.use_redis or time.time() < self.retry_after:
+            return None
+        try:
+            if not self.redis_client:
+                self.redis_client = await redis.from_url(self.redis_url)
+            return self.redis_client
+        except Exception as e:
+            logger.debug(f"Extraction memo Redis unavailable: {e}")
+            self.retry_after = time.time() + 60
+            return None
+    
+    async def disconnect(self):
+        """Disconnect from Redis"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+    
+    def _remember(self, key: str, blob: bytes):
+        previous = self.local.pop(key, None)
+        if previous is not None:
+            self.local_bytes -= len(previous)
+        
+        if len(blob) > self.max_bytes:
+            return
+        
+        self.local[key] = blob
+        self.local_bytes += len(blob)
+        while self.local_bytes > self.max_bytes:
+            _, evicted = self.local.popitem(last=False)
+            self.local_bytes -= len(evicted)
+        extraction_memo_size_bytes.set(self.local_bytes)
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a memoized extraction result
+        
+        Args:
+            key: Key from key()
+            
+        Returns:
+            A fresh copy of the stored result, or None
+        """
+        if not self.enabled:
+            return None
+        
+        blob = self.local.get(key)
+        if blob is not None:
+            self.local.move_to_end(key)
+            extraction_memo_requests.labels(result="local_hit").inc()
+            return json.loads(zlib.decompress(blob))
+        
+        client = await self._redis()
+        if client:
+            try:
+                blob = await client.get(key)
+            except Exception as e:
+                logger.debug(f"Extraction memo lookup failed: {e}")
+                self.retry_after = time.time() + 60
+                blob = None
+            
+            if blob is not None:
+                self._remember(key, blob)
+                extraction_memo_requests.labels(result="redis_hit").inc()
+                return json.loads(zlib.decompress(blob))
+        
+        extraction_memo_requests.labels(result="miss").inc()
+        return None
+    
+    async def set(self, key: str, result: Dict[str, Any]):
+        """
+        Store an extraction result
+        
+        Args:
+            key: Key from key()
+            result: Output of extract_content
+        """
+        if not self.enabled:
+            return
+        
+        # Serialized before any await, so the caller may modify result afterwards
+        blob = zlib.compress(json.dumps(result).encode("utf-8"), 1)
+        self._remember(key, blob)
+        
+        client = await self._redis()
+        if client:
+            try:
+                await client.setex(key, self.ttl, blob)
+            except Exception as e:
+                logger.debug(f"Extraction memo store failed: {e}")
+                self.retry_after = time.time() + 60
+
+
+# Global instance
+_extraction_memo = None
+
+
+def get_extraction_memo() -> ExtractionMemo:
+    """Get the process extraction memo"""
+    global _extraction_memo
+    if _extraction_memo is None:
+        _extraction_memo = ExtractionMemo()
+    return _extraction_memo
@@ -3,38 +3,398 @@ Content extraction module for web pages
 Handles HTML parsing, main content extraction, and conversion to various formats
 """
 
+import os
 import re
+import copy
 import hashlib
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, FrozenSet, List, Optional, Union
 from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
 from readability import Document
+from readability.cleaners import html_cleaner
 import markdownify
 import logging
 
+from app.scraping.boilerplate import block_fingerprints, strip_blocks, strip_unlikely_candidates
+from app.scraping.format_plan import FormatPlan
+from app.scraping.markdown_stream import stream_html_to_markdown
+from app.scraping.near_duplicates import minhash
+
 logger = logging.getLogger(__name__)
 
+# Same parser setup as readability, so both see an identical tree
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+ICON_REL = re.compile(r'icon', re.I)
+
+# Where the document head ends; everything metadata needs comes before it
+HEAD_END = re.compile(r'</head\s*>|<body[\s>]', re.I)
+
+# Documents at least this large are converted to Markdown in a single streaming pass
+STREAMING_MARKDOWN_MIN_CHARS = int(os.getenv("STREAMING_MARKDOWN_MIN_KB", "256")) * 1024
+
+# Template extraction leaving less text than this falls back to Readability
+MIN_TEMPLATE_CONTENT_CHARS = 200
+
+
+class _TreeReadability(Document):
+    """Readability over an already-parsed tree; retries copy the tree instead of re-parsing"""
+    
+    def _parse(self, input):
+        # The cleaner works on a copy, leaving the shared tree untouched
+        doc = html_cleaner.clean_html(input)
+        if self.url:
+            doc.make_links_absolute(self.url, resolve_base_href=True, handle_failures=self.handle_failures)
+        else:
+            doc.resolve_base_href(handle_failures=self.handle_failures)
+        return doc
+
+
+def _detach(element):
+    """Remove an element from its parent, leaving its tail text in place"""
+    parent = element.getparent()
+    if parent is None:
+        return
+    
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + element.tail
+        else:
+            parent.text = (parent.text or '') + element.tail
+        element.tail = None
+    parent.remove(element)
+
+
+class _MetadataCollector:
+    """Page metadata from <title>, <meta> and icon <link> elements, fed one element at a time"""
+    
+    def __init__(self, url: str = ""):
+        self.url = url
+        self.metadata = {
+            "sourceURL": url,
+            "title": None,
+            "description": None,
+            "keywords": None,
+            "author": None,
+            "language": None,
+            "publishedDate": None,
+            "modifiedDate": None,
+            "favicon": None
+        }
+        self.title = None
+        self.og_title = None
+        self.favicon_link = None
+    
+    def add(self, element):
+        tag = element.tag
+        metadata = self.metadata
+        
+        if tag == 'link':
+            if self.favicon_link is None and ICON_REL.search(element.get('rel', '')):
+                self.favicon_link = element
+        
+        elif tag == 'meta':
+            name = element.get('name', '').lower()
+            property = element.get('property', '').lower()
+            content = element.get('content', '')
+            
+            if not content:
+                return
+            
+            if name == 'description' or property == 'og:description':
+                metadata["description"] = content
+            elif name == 'keywords':
+                metadata["keywords"] = content
+            elif name == 'author' or property == 'article:author':
+                metadata["author"] = content
+            elif name == 'language' or property == 'og:locale':
+                metadata["language"] = content[:2]
+            elif property == 'article:published_time':
+                metadata["publishedDate"] = content
+            elif property == 'article:modified_time':
+                metadata["modifiedDate"] = content
+            elif property == 'og:title' and self.og_title is None:
+                self.og_title = content
+        
+        elif tag == 'title' and self.title is None:
+            self.title = element.text_content().strip()
+    
+    def result(self, root) -> Dict[str, Any]:
+        metadata = self.metadata
+        
+        # <title> wins, OpenGraph title is the fallback
+        metadata["title"] = self.title or self.og_title
+        
+        if not metadata["language"]:
+            lang = root.get('lang', '').lower()
+            if lang:
+                metadata["language"] = lang[:2]
+        
+        if self.favicon_link is not None:
+            favicon_url = self.favicon_link.get('href')
+            if favicon_url and self.url:
+                metadata["favicon"] = urljoin(self.url, favicon_url)
+        
+        return metadata
+
+
+class ParsedDocument:
+    """
+    HTML parsed once with lxml and shared by every extraction step
+    
+    Metadata, links and images are collected in a single walk over the tree
+    the first time any of them is needed.
+    """
+    
+    def __init__(self, html: str, url: str = ""):
+        self.html = html
+        self.url = url
+        self.tree = self._parse(html)
+        self._metadata: Optional[Dict[str, Any]] = None
+        self._links: Optional[List[str]] = None
+        self._images: Optional[List[str]] = None
+    
+    @classmethod
+    def from_head(cls, html: str, url: str = "") -> "ParsedDocument":
+        """Document parsed only up to the end of its head, which is all metadata needs"""
+        match = HEAD_END.search(html)
+        return cls(html[:match.start()] if match else html, url)
+    
+    @staticmethod
+    def _parse(html: str):
+        try:
+            return lxml.html.document_fromstring(html.encode('utf-8', 'replace'), parser=HTML_PARSER)
+        except etree.ParserError:
+            # Empty or whitespace-only document
+            return lxml.html.document_fromstring(b'<html></html>', parser=HTML_PARSER)
+    
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self._metadata is None:
+            self._walk()
+        return dict(self._metadata)
+    
+    @property
+    def links(self) -> List[str]:
+        if self._links is None:
+            self._walk()
+        return list(self._links)
+    
+    @property
+    def images(self) -> List[str]:
+        if self._images is None:
+            self._walk()
+        return list(self._images)
+    
+    def _walk(self):
+        """Collect metadata, links and images in one pass over the tree"""
+        url = self.url
+        collector = _MetadataCollector(url)
+        links = []
+        images = []
+        
+        for element in self.tree.iter():
+            tag = element.tag
+            if not isinstance(tag, str):
+                # Comments and processing instructions
+                continue
+            
+            if tag == 'a' or tag == 'link':
+                href = element.get('href')
+                if href:
+                    if url:
+                        href = urljoin(url, href)
+                    if href.startswith(('http://', 'https://')):
+                        links.append(href)
+                
+                if tag == 'link':
+                    collector.add(element)
+            
+            elif tag == 'img' or tag == 'picture':
+                src = element.get('src') or element.get('data-src') or element.get('data-lazy-src')
+                if src:
+                    if url:
+                        src = urljoin(url, src)
+                    if src.startswith(('http://', 'https://', 'data:')):
+                        images.append(src)
+                
+                # Also check srcset for responsive images
+                srcset = element.get('srcset')
+                if srcset:
+                    for part in srcset.split(','):
+                        src = part.strip().split(' ')[0]
+                        if url:
+                            src = urljoin(url, src)
+                        if src.startswith(('http://', 'https://')):
+                            images.append(src)
+            
+            elif tag == 'meta' or tag == 'title':
+                collector.add(element)
+        
+        self._metadata = collector.result(self.tree)
+        self._links = list(dict.fromkeys(links))
+        self._images = list(dict.fromkeys(images))
+    
+    def head_metadata(self) -> Dict[str, Any]:
+        """Metadata from the document head only, without walking the body"""
+        collector = _MetadataCollector(self.url)
+        head = self.tree.find('head')
+        if head is not None:
+            for element in head.iter('title', 'meta', 'link'):
+                collector.add(element)
+        return collector.result(self.tree)
+    
+    def filter(
+        self,
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None
+    ):
+        """
+        Copy of the tree with tag filters applied
+        
+        Args:
+            include_tags: Tags to keep (if specified, only these are kept, in a div)
+            exclude_tags: Tags to remove
+            
+        Returns:
+            lxml element
+        """
+        tree = copy.deepcopy(self.tree)
+        
+        if exclude_tags:
+            for element in list(tree.iter(*exclude_tags)):
+                if element.getparent() is not None:
+                    element.drop_tree()
+        
+        if include_tags:
+            container = lxml.html.Element('div')
+            for tag_name in include_tags:
+                for element in list(tree.iter(tag_name)):
+                    _detach(element)
+                    container.append(element)
+            return container
+        
+        return tree
+    
+    def filtered_html(
+        self,
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None
+    ) -> str:
+        """Serialized HTML with tag filters applied"""
+        return lxml.html.tostring(self.filter(include_tags, exclude_tags), encoding='unicode')
+    
+    def main_content(
+        self,
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None
+    ) -> str:
+        """
+        Main content via Readability, run on the parsed tree
+        
+        Args:
+            include_tags: Tags to keep before extraction
+            exclude_tags: Tags to remove before extraction
+            
+        Returns:
+            Cleaned HTML of main content
+        """
+        tree = self.tree
+        if include_tags or exclude_tags:
+            tree = self.filter(include_tags, exclude_tags)
+        if include_tags:
+            # Included tags come back in a bare div; give Readability a full document
+            document = lxml.html.document_fromstring(b'<html><body></body></html>', parser=HTML_PARSER)
+            document.find('body').append(tree)
+            tree = document
+        return _TreeReadability(tree, url=self.url).summary()
+    
+    def template_content(
+        self,
+        boilerplate: FrozenSet[str],
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """
+        Main content by removing a site's learned boilerplate blocks
+        
+        Args:
+            boilerplate: Block fingerprints learned for the site
+            include_tags: Tags to keep before extraction
+            exclude_tags: Tags to remove before extraction
+            
+        Returns:
+            Cleaned HTML of main content, or None if the page doesn't match the
+            template or too little text is left
+        """
+        tree = self.filter(include_tags, exclude_tags)
+        if not strip_blocks(tree, boilerplate):
+            return None
+        
+        # The same clean-up Readability applies before scoring
+        strip_unlikely_candidates(tree)
+        html_cleaner(tree)
+        head = tree.find('head')
+        if head is not None:
+            head.drop_tree()
+        
+        if len(' '.join(tree.text_content().split())) < MIN_TEMPLATE_CONTENT_CHARS:
+            return None
+        
+        if self.url:
+            tree.make_links_absolute(self.url, resolve_base_href=True, handle_failures='discard')
+        return lxml.html.tostring(tree, encoding='unicode')
+
+
 class ContentExtractor:
     """Extract and process content from web pages"""
     
     @staticmethod
-    def extract_main_content(html: str, url: str = "") -> str:
+    def parse(html: Union[str, ParsedDocument], url: str = "") -> ParsedDocument:
+        """
+        Parse HTML once for use by several extraction steps
+        
+        Args:
+            html: Raw HTML content, or an already parsed document
+            url: Source URL for relative link resolution
+            
+        Returns:
+            ParsedDocument
+        """
+        if isinstance(html, ParsedDocument):
+            return html
+        return ParsedDocument(html, url)
+    
+    @staticmethod
+    def extract_main_content(
+        html: Union[str, ParsedDocument],
+        url: str = "",
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None
+    ) -> str:
         """
         Extract main content from HTML using Readability algorithm
         
         Args:
-            html: Raw HTML content
+            html: Raw HTML content or ParsedDocument
             url: Source URL for relative link resolution
+            include_tags: Tags to keep before extraction
+            exclude_tags: Tags to remove before extraction
             
         Returns:
             Cleaned HTML of main content
         """
         try:
-            doc = Document(html, url=url)
-            result = doc.summary()
-            return result
+            return ContentExtractor.parse(html, url).main_content(include_tags, exclude_tags)
         except Exception as e:
             logger.error(f"Readability extraction failed: {e}")
+            if isinstance(html, ParsedDocument):
+                html = html.html
+            if include_tags or exclude_tags:
+                html = ContentExtractor.filter_by_tags(html, include_tags, exclude_tags)
             # Fallback to basic extraction
             soup = BeautifulSoup(html, 'lxml')
             
@@ -69,6 +429,9 @@ class ContentExtractor:
             Markdown formatted text
         """
         try:
+            if len(html) >= STREAMING_MARKDOWN_MIN_CHARS:
+                return stream_html_to_markdown(html, base_url)
+            
             # Configure markdownify options
             markdown = markdownify.markdownify(
                 html,
@@ -89,7 +452,7 @@ class ContentExtractor:
                 markdown = ContentExtractor._fix_relative_links(markdown, base_url)
             
             return markdown.strip()
-            
+        
         except Exception as e:
             logger.error(f"Markdown conversion failed: {e}")
             # Fallback to simple text extraction
@@ -97,167 +460,50 @@ class ContentExtractor:
             return soup.get_text(separator='\n', strip=True)
     
     @staticmethod
-    def extract_links(html: str, base_url: str = "") -> List[str]:
+    def extract_links(html: Union[str, ParsedDocument], base_url: str = "") -> List[str]:
         """
         Extract all links from HTML
         
         Args:
-            html: HTML content
+            html: HTML content or ParsedDocument
             base_url: Base URL for resolving relative links
             
         Returns:
-            List of absolute URLs
+            List of unique absolute URLs, in document order
         """
-        links = []
-        soup = BeautifulSoup(html, 'lxml')
-        
-        for link in soup.find_all(['a', 'link']):
-            href = link.get('href')
-            if href:
-                # Make absolute URL
-                if base_url:
-                    href = urljoin(base_url, href)
-                
-                # Filter out non-HTTP(S) links
-                if href.startswith(('http://', 'https://')):
-                    links.append(href)
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_links = []
-        for link in links:
-            if link not in seen:
-                seen.add(link)
-                unique_links.append(link)
-        
-        return unique_links
+        return ContentExtractor.parse(html, base_url).links
     
     @staticmethod
-    def extract_images(html: str, base_url: str = "") -> List[str]:
+    def extract_images(html: Union[str, ParsedDocument], base_url: str = "") -> List[str]:
         """
         Extract all image URLs from HTML
         
         Args:
-            html: HTML content
+            html: HTML content or ParsedDocument
             base_url: Base URL for resolving relative links
             
         Returns:
-            List of absolute image URLs
+            List of unique absolute image URLs
         """
-        images = []
-        soup = BeautifulSoup(html, 'lxml')
-        
-        for img in soup.find_all(['img', 'picture']):
-            # Try different attributes
-            src = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
-            
-            if src:
-                # Make absolute URL
-                if base_url:
-                    src = urljoin(base_url, src)
-                
-                # Filter valid image URLs
-                if src.startswith(('http://', 'https://', 'data:')):
-                    images.append(src)
-            
-            # Also check srcset for responsive images
-            srcset = img.get('srcset')
-            if srcset:
-                for part in srcset.split(','):
-                    url = part.strip().split(' ')[0]
-                    if base_url:
-                        url = urljoin(base_url, url)
-                    if url.startswith(('http://', 'https://')):
-                        images.append(url)
-        
-        # Remove duplicates
-        return list(dict.fromkeys(images))
+        return ContentExtractor.parse(html, base_url).images
     
     @staticmethod
-    def extract_metadata(html: str, url: str = "") -> Dict[str, Any]:
+    def extract_metadata(html: Union[str, ParsedDocument], url: str = "") -> Dict[str, Any]:
         """
         Extract metadata from HTML
         
         Args:
-            html: HTML content
+            html: HTML content or ParsedDocument
             url: Source URL
             
         Returns:
             Dictionary of metadata
         """
-        soup = BeautifulSoup(html, 'lxml')
-        metadata = {
-            "sourceURL": url,
-            "title": None,
-            "description": None,
-            "keywords": None,
-            "author": None,
-            "language": None,
-            "publishedDate": None,
-            "modifiedDate": None,
-            "favicon": None
-        }
-        
-        # Extract title
-        title_tag = soup.find('title')
-        if title_tag:
-            metadata["title"] = title_tag.get_text(strip=True)
-        
-        # Extract meta tags
-        for meta in soup.find_all('meta'):
-            name = meta.get('name', '').lower()
-            property = meta.get('property', '').lower()
-            content = meta.get('content', '')
-            
-            if not content:
-                continue
-            
-            # Description
-            if name == 'description' or property == 'og:description':
-                metadata["description"] = content
-            
-            # Keywords
-            elif name == 'keywords':
-                metadata["keywords"] = content
-            
-            # Author
-            elif name == 'author' or property == 'article:author':
-                metadata["author"] = content
-            
-            # Language
-            elif name == 'language' or property == 'og:locale':
-                metadata["language"] = content[:2] if content else None
-            
-            # Dates
-            elif property == 'article:published_time':
-                metadata["publishedDate"] = content
-            elif property == 'article:modified_time':
-                metadata["modifiedDate"] = content
-            
-            # OpenGraph title (fallback)
-            elif property == 'og:title' and not metadata["title"]:
-                metadata["title"] = content
-        
-        # Extract language from html tag
-        if not metadata["language"]:
-            html_tag = soup.find('html')
-            if html_tag:
-                lang = html_tag.get('lang', '').lower()
-                if lang:
-                    metadata["language"] = lang[:2]
-        
-        # Extract favicon
-        favicon_link = soup.find('link', rel=re.compile(r'icon', re.I))
-        if favicon_link:
-            favicon_url = favicon_link.get('href')
-            if favicon_url and url:
-                metadata["favicon"] = urljoin(url, favicon_url)
-        
-        return metadata
+        return ContentExtractor.parse(html, url).metadata
     
     @staticmethod
     def filter_by_tags(
-        html: str,
+        html: Union[str, ParsedDocument],
         include_tags: Optional[List[str]] = None,
         exclude_tags: Optional[List[str]] = None
     ) -> str:
@@ -265,34 +511,14 @@ class ContentExtractor:
         Filter HTML content by including/excluding specific tags
         
         Args:
-            html: HTML content to filter
+            html: HTML content or ParsedDocument to filter
             include_tags: List of tags to include (if specified, only these are kept)
             exclude_tags: List of tags to exclude
             
         Returns:
             Filtered HTML
         """
-        soup = BeautifulSoup(html, 'lxml')
-        
-        # Remove excluded tags
-        if exclude_tags:
-            for tag_name in exclude_tags:
-                for tag in soup.find_all(tag_name):
-                    tag.decompose()
-        
-        # Keep only included tags
-        if include_tags:
-            # Create a new soup with only included content
-            new_soup = BeautifulSoup('<div></div>', 'lxml')
-            container = new_soup.div
-            
-            for tag_name in include_tags:
-                for tag in soup.find_all(tag_name):
-                    container.append(tag)
-            
-            return str(container)
-        
-        return str(soup)
+        return ContentExtractor.parse(html).filtered_html(include_tags, exclude_tags)
     
     @staticmethod
     def calculate_content_hash(content: str) -> str:
@@ -354,4 +580,116 @@ class ContentExtractor:
         # Remove control characters
         text = ''.join(char for char in text if ord(char) >= 32 or char in '\n\r\t')
         
-        return text.strip()
\ No newline at end of file
+        return text.strip()
+
+
+def extract_content(
+    html: str,
+    url: str,
+    formats: List[str],
+    only_main_content: bool = True,
+    include_tags: Optional[List[str]] = None,
+    exclude_tags: Optional[List[str]] = None,
+    boilerplate: Optional[FrozenSet[str]] = None,
+    metadata_fields: Optional[List[str]] = None,
+    signature: bool = False
+) -> Dict[str, Any]:
+    """
+    Run the extraction pipeline for one page
+    
+    Module-level and free of shared state, so it can run in an extraction
+    worker process. Only the stages the requested outputs need are run (see
+    FormatPlan).
+    
+    Args:
+        html: Raw HTML content
+        url: Source URL
+        formats: Requested output formats
+        only_main_content: Extract only main content using readability
+        include_tags: HTML tags to include
+        exclude_tags: HTML tags to exclude
+        boilerplate: Block fingerprints a crawl learned for the site. When
+            given (even empty), the page's own fingerprints are returned for
+            learning, and matching blocks are stripped instead of running
+            readability
+        metadata_fields: Metadata fields to return (all when None); a subset
+            that needs nothing else is read from the document head alone
+        signature: Return the markdown's minhash signature
+        
+    Returns:
+        Dictionary with metadata, the html, markdown, links and images formats,
+        stageTimings in ms, and when asked for, the markdown's minhash and the
+        page's blockFingerprints
+    """
+    plan = FormatPlan(
+        formats, only_main_content, include_tags, exclude_tags,
+        metadata_fields, boilerplate is not None, signature
+    )
+    timings = {}
+    
+    def timed(stage, fn, *args):
+        started = time.perf_counter()
+        value = fn(*args)
+        timings[stage] = round((time.perf_counter() - started) * 1000)
+        return value
+    
+    data = {"metadata": {"sourceURL": url}}
+    
+    # Parse once; every extraction step below shares the tree
+    document = None
+    if plan.needs("parse"):
+        document = timed("parse", ContentExtractor.parse, html, url)
+    
+    if plan.needs("walk"):
+        # Metadata, links and images are collected together
+        timed("walk", lambda: document.links)
+    
+    if plan.metadata_fields:
+        if plan.needs("walk"):
+            metadata = document.metadata
+        elif document is not None:
+            metadata = timed("head", document.head_metadata)
+        else:
+            metadata = timed("head", lambda: ParsedDocument.from_head(html, url).head_metadata())
+        for field in plan.metadata_fields:
+            data["metadata"][field] = metadata[field]
+    
+    if plan.needs("content"):
+        started = time.perf_counter()
+        processed_html = html
+        
+        # Extract main content if requested, after tag filters
+        if only_main_content:
+            processed_html = None
+            if boilerplate:
+                processed_html = document.template_content(boilerplate, include_tags, exclude_tags)
+            if boilerplate is not None:
+                data["metadata"]["contentExtraction"] = "template" if processed_html is not None else "readability"
+            if processed_html is None:
+                processed_html = ContentExtractor.extract_main_content(document, url, include_tags, exclude_tags)
+        elif include_tags or exclude_tags:
+            processed_html = document.filtered_html(include_tags, exclude_tags)
+        timings["content"] = round((time.perf_counter() - started) * 1000)
+        
+        if "html" in formats:
+            data["html"] = processed_html
+    
+    if plan.needs("markdown"):
+        markdown = timed("markdown", ContentExtractor.html_to_markdown, processed_html, url)
+        data["markdown"] = markdown
+        data["contentHash"] = timed("contentHash", ContentExtractor.calculate_content_hash, markdown)
+    
+    if plan.needs("minhash"):
+        data["minhash"] = timed("minhash", minhash, markdown)
+    
+    if "links" in formats:
+        data["links"] = document.links
+    
+    if "images" in formats:
+        data["images"] = document.images
+    
+    if plan.needs("blockFingerprints"):
+        data["blockFingerprints"] = timed("blockFingerprints", block_fingerprints, document.tree)
+    
+    data["stageTimings"] = timings
+    return data
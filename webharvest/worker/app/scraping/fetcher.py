@@ -0,0 +1,453 @@
+"""
+Fetch backends for retrieving page content
+Plain HTTP fast path, with heuristics for escalating to a browser render
+"""
+
+import asyncio
+import re
+import random
+import os
+import logging
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+import httpx
+from playwright.async_api import TimeoutError as PlaywrightTimeout
+
+from app.scraping.blocking import ResourceBlocker, select_profile
+from app.scraping.browser import BrowserManager, BrowserPool, is_browser_fault
+from app.scraping.documents import DOCUMENT_PDF, document_kind
+from app.scraping.preflight import ContentPreflight, SkippedContent
+from app.scraping.readiness import PageReadiness
+
+logger = logging.getLogger(__name__)
+
+# Patterns that indicate a page only renders its content with JavaScript
+NOSCRIPT_WALL = re.compile(
+    r'<noscript[^>]*>[^<]*(?:<[^>]+>[^<]*){0,5}?'
+    r'(?:enable|requires?|turn on|need)\s+javascript',
+    re.I
+)
+SPA_ROOT = re.compile(
+    r'<div[^>]+id=["\'](?:root|app|__next|__nuxt|___gatsby|svelte|main-app)["\'][^>]*>\s*</div>',
+    re.I
+)
+CHALLENGE_PAGE = re.compile(
+    r'cf-browser-verification|challenge-platform|<title>\s*just a moment',
+    re.I
+)
+SCRIPT_OR_STYLE = re.compile(r'<(script|style|noscript|template)[^>]*>.*?</\1>', re.I | re.S)
+HTML_TAG = re.compile(r'<[^>]+>')
+WHITESPACE = re.compile(r'\s+')
+
+# Status codes bot protection tends to answer plain HTTP clients with; other
+# errors (404, 429, 5xx) are returned as they are and left to the crawl's backoff
+ESCALATE_STATUS_CODES = {401, 403}
+
+# needs_browser reasons that say the page's content needs rendering, as
+# opposed to the response's status
+CONTENT_ESCALATIONS = {"spa_root", "noscript_wall", "empty_body", "challenge"}
+
+
+class DocumentTooLarge(ValueError):
+    """A non-HTML document is over the size cap; a browser would not do better"""
+
+
+class FetchResult:
+    """Content fetched by a backend"""
+    
+    def __init__(
+        self,
+        url: str,
+        html: str,
+        status_code: int,
+        backend: str,
+        content_type: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        self.url = url
+        self.html = html
+        self.status_code = status_code
+        self.backend = backend
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.screenshot: Optional[str] = None
+        self.timings: Dict[str, int] = {}
+        self.blocking: Optional[Dict[str, Any]] = None
+        # Non-HTML documents (PDF, text, JSON, XML) keep their raw body for extract_document
+        self.document: Optional[str] = None
+        self.body: Optional[bytes] = None
+        self.encoding: Optional[str] = None
+
+
+def needs_browser(
+    html: str,
+    status_code: int = 200,
+    content_type: Optional[str] = None,
+    min_text_length: Optional[int] = None
+) -> Optional[str]:
+    """
+    Decide whether an HTTP-fetched page has to be rendered in a browser
+    
+    Args:
+        html: Response body
+        status_code: HTTP status code
+        content_type: Response Content-Type header
+        min_text_length: Minimum visible text for a page to count as complete
+        
+    Returns:
+        Reason for escalating, or None if the HTTP response is usable
+    """
+    if min_text_length is None:
+        min_text_length = int(os.getenv("HTTP_FETCH_MIN_TEXT", "200"))
+    
+    if status_code in ESCALATE_STATUS_CODES:
+        return f"status_{status_code}"
+    
+    # A browser won't find content in a dead link or an overloaded host,
+    # only get past a challenge some protections answer with 429/503
+    if status_code >= 400:
+        return "challenge" if html and CHALLENGE_PAGE.search(html) else None
+    
+    if content_type and "html" not in content_type.lower():
+        return "non_html"
+    
+    if not html or not html.strip():
+        return "empty_body"
+    
+    if CHALLENGE_PAGE.search(html):
+        return "challenge"
+    
+    if NOSCRIPT_WALL.search(html):
+        return "noscript_wall"
+    
+    text = SCRIPT_OR_STYLE.sub(' ', html)
+    text = HTML_TAG.sub(' ', text)
+    text = WHITESPACE.sub(' ', text).strip()
+    
+    if SPA_ROOT.search(html) and len(text) < min_text_length * 5:
+        return "spa_root"
+    
+    if len(text) < min_text_length:
+        return "empty_body"
+    
+    return None
+
+
+class HttpFetcher:
+    """Fetch pages over a pooled HTTP client, without a browser"""
+    
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        document_max_bytes: Optional[int] = None
+    ):
+        self.max_connections = max_connections or int(os.getenv("HTTP_FETCH_MAX_CONNECTIONS", "100"))
+        self.max_bytes = max_bytes or int(os.getenv("HTTP_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.document_max_bytes = document_max_bytes or int(os.getenv("DOCUMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+        self.client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.user_agents = [
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        ]
+        self.mobile_user_agent = (
+            "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 "
+            "(KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1"
+        )
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+    
+    async def start(self):
+        """Create the pooled HTTP client"""
+        loop = asyncio.get_running_loop()
+        if self.client and self._loop is loop:
+            return
+        
+        # A client can't be shared across event loops
+        if self.client:
+            await self.stop()
+        
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            verify=False,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+            ),
+            headers={
+                "Accept-Language": "en-US,en;q=0.9",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8"
+            }
+        )
+        self._loop = loop
+    
+    async def stop(self):
+        """Close the HTTP client"""
+        if self.client:
+            try:
+                await self.client.aclose()
+            except Exception as e:
+                logger.debug(f"Error closing HTTP client: {e}")
+            self.client = None
+            self._loop = None
+    
+    async def fetch(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[List[Dict[str, Any]]] = None,
+        mobile: bool = False,
+        timeout: int = 30000,
+        preflight: Optional[ContentPreflight] = None
+    ) -> FetchResult:
+        """
+        Fetch a URL over HTTP
+        
+        Args:
+            url: URL to fetch
+            headers: Custom HTTP headers
+            cookies: Browser-style cookie dicts
+            mobile: Send a mobile user agent
+            timeout: Request timeout in milliseconds
+            preflight: Content policy checked against the response headers
+                before the body is read; SkippedContent is raised on failure
+                
+        Returns:
+            FetchResult with the decoded body, and for non-HTML documents
+            the raw body and document kind
+        """
+        await self.start()
+        started = time.monotonic()
+        
+        request_headers = {
+            "User-Agent": self.mobile_user_agent if mobile else random.choice(self.user_agents)
+        }
+        if headers:
+            request_headers.update(headers)
+        
+        request_cookies = None
+        if cookies:
+            request_cookies = {c["name"]: c["value"] for c in cookies if "name" in c and "value" in c}
+        
+        async with self.client.stream(
+            "GET",
+            url,
+            headers=request_headers,
+            cookies=request_cookies,
+            timeout=timeout / 1000
+        ) as response:
+            content_type = response.headers.get("content-type")
+            document = document_kind(content_type, str(response.url))
+            max_bytes = self.document_max_bytes if document else self.max_bytes
+            
+            # Refuse oversized bodies before downloading them when the server says how big they are
+            length = response.headers.get("content-length", "")
+            if preflight and response.status_code < 400:
+                reason = preflight.record(url, content_type, int(length) if length.isdigit() else None)
+                if reason:
+                    raise SkippedContent(url, reason, f"{content_type}, {length or 'unknown'} bytes")
+            
+            too_large = DocumentTooLarge if document else ValueError
+            if length.isdigit() and int(length) > max_bytes:
+                raise too_large(f"Response of {length} bytes exceeds {max_bytes} bytes")
+            
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    raise too_large(f"Response exceeds {max_bytes} bytes")
+            body = bytes(body)
+            
+            encoding = response.encoding or "utf-8"
+            html = ""
+            # A PDF has no text to decode; extract_document reads the raw body
+            if document != DOCUMENT_PDF:
+                try:
+                    html = body.decode(encoding, errors="replace")
+                except LookupError:
+                    html = body.decode("utf-8", errors="replace")
+            
+            result = FetchResult(
+                url=str(response.url),
+                html=html,
+                status_code=response.status_code,
+                backend="http",
+                content_type=content_type,
+                headers=dict(response.headers)
+            )
+            if document:
+                result.document = document
+                result.body = body
+                result.encoding = encoding
+            result.timings = {"fetch": round((time.monotonic() - started) * 1000)}
+            return result
+
+
+class BrowserFetcher:
+    """Render pages in a Playwright browser"""
+    
+    def __init__(self, browser_pool: Optional[BrowserPool] = None):
+        self.browser_pool = browser_pool
+        self.readiness = PageReadiness()
+    
+    async def fetch(
+        self,
+        url: str,
+        formats: List[str],
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[List[Dict[str, Any]]] = None,
+        wait_for: Optional[int] = None,
+        mobile: bool = False,
+        timeout: int = 30000,
+        actions: Optional[List[Dict[str, Any]]] = None,
+        block_resources: Optional[List[str]] = None,
+        proxy: Optional[Dict[str, str]] = None,
+        javascript_enabled: bool = True,
+        blocking_profile: Optional[str] = None
+    ) -> FetchResult:
+        """
+        Load a URL in the browser and return the rendered HTML
+        
+        Args:
+            url: URL to render
+            formats: Requested output formats (a screenshot is taken if listed)
+            headers: Custom HTTP headers
+            cookies: Browser cookies
+            wait_for: Maximum time in milliseconds to wait for the page to settle
+            mobile: Use mobile viewport
+            timeout: Page load timeout
+            actions: List of browser actions to execute
+            block_resources: Resource types to block, overriding the profile's
+            proxy: Proxy configuration
+            javascript_enabled: Run page scripts (False renders server HTML only)
+            blocking_profile: text-only, layout or full; picked from formats if omitted
+            
+        Returns:
+            FetchResult with the rendered DOM
+        """
+        browser = None
+        context = None
+        page = None
+        pooled = None
+        reusable = True
+        browser_fault = False
+        blocker = None
+        blocking = select_profile(formats, actions, blocking_profile, block_resources)
+        
+        try:
+            if self.browser_pool:
+                # Warm context from the pool, keeps DNS/TLS/cache per site
+                pooled = await self.browser_pool.acquire_context(
+                    mobile=mobile,
+                    headers=headers,
+                    cookies=cookies,
+                    proxy=proxy,
+                    blocking=blocking,
+                    javascript_enabled=javascript_enabled
+                )
+                browser = pooled.browser
+                page = pooled.page
+                blocker = pooled.blocker
+            else:
+                browser = BrowserManager()
+                await browser.start()
+                
+                # Create browser context
+                context = await browser.create_context(
+                    mobile=mobile,
+                    headers=headers,
+                    cookies=cookies,
+                    proxy=proxy,
+                    javascript_enabled=javascript_enabled
+                )
+                
+                # Create page
+                blocker = ResourceBlocker(blocking)
+                page = await browser.create_page(context, blocker=blocker)
+            
+            # Navigate to URL; without JavaScript there is nothing to settle
+            if javascript_enabled:
+                # waitFor is an upper bound on settling, not a fixed sleep
+                navigation = await self.readiness.goto(
+                    page,
+                    url,
+                    timeout=timeout,
+                    max_wait_ms=wait_for
+                )
+                response = navigation["response"]
+                timings = navigation["timings"]
+            else:
+                started = time.monotonic()
+                response = await page.goto(url, wait_until="load", timeout=timeout)
+                timings = {"navigation": round((time.monotonic() - started) * 1000)}
+            
+            # Get status code
+            status_code = response.status if response else 0
+            
+            # Execute actions if provided
+            if actions:
+                started = time.monotonic()
+                await browser.execute_actions(
+                    page,
+                    actions,
+                    max_actions=int(os.getenv("MAX_ACTIONS_PER_REQUEST", "25")),
+                    max_time=int(os.getenv("MAX_ACTION_TIME", "30000"))
+                )
+                timings["actions"] = round((time.monotonic() - started) * 1000)
+            
+            # Get page content
+            started = time.monotonic()
+            result = FetchResult(
+                url=page.url or url,
+                html=await page.content(),
+                status_code=status_code,
+                backend="browser" if javascript_enabled else "browser_nojs",
+                content_type=response.headers.get("content-type") if response else None,
+                headers=response.headers if response else None
+            )
+            timings["content"] = round((time.monotonic() - started) * 1000)
+            result.timings = timings
+            if blocker:
+                result.blocking = blocker.stats.to_dict()
+            
+            if "screenshot" in formats:
+                screenshot_dir = "/app/screenshots"
+                os.makedirs(screenshot_dir, exist_ok=True)
+                screenshot_path = f"{screenshot_dir}/{datetime.utcnow().timestamp()}.png"
+                await page.screenshot(path=screenshot_path, full_page=True)
+                result.screenshot = screenshot_path
+                logger.info(f"Screenshot saved: {screenshot_path}")
+            
+            return result
+        
+        except PlaywrightTimeout:
+            raise
+        
+        except Exception as e:
+            # Network errors are the site's fault; anything else may have
+            # broken the context, so don't hand it to the next scrape. Only
+            # browser and context failures count against the browser's health
+            if "net::" not in str(e):
+                reusable = False
+                browser_fault = is_browser_fault(e)
+            raise
+        
+        finally:
+            # Return context to pool, or clean up the one-off browser
+            if pooled:
+                await self.browser_pool.release_context(pooled, reusable=reusable, browser_fault=browser_fault)
+            elif browser:
+                if page:
+                    await page.close()
+                if context:
+                    await context.close()
+                await browser.stop()
@@ -0,0 +1,142 @@
+"""
+Extraction format planner
+Works out the stages requested outputs need, so shared stages run once and unrequested ones not at all
+"""
+
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# Metadata fields extraction can return, besides sourceURL
+METADATA_FIELDS = (
+    "title", "description", "keywords", "author", "language", "publishedDate", "modifiedDate", "favicon"
+)
+
+# Stage -> stages that must run first
+STAGE_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    "parse": (),
+    # Head-only parse; metadata without touching the body
+    "head": (),
+    # One pass over the tree for metadata, links and images
+    "walk": ("parse",),
+    # Main content or tag-filtered HTML
+    "content": ("parse",),
+    "markdown": ("content",),
+    "contentHash": ("markdown",),
+    "minhash": ("markdown",),
+    "blockFingerprints": ("parse",),
+}
+
+# Rough ms per 100KB of HTML, from benchmarks/bench_extraction.py
+STAGE_COST: Dict[str, float] = {
+    "parse": 15,
+    "head": 0.5,
+    "walk": 15,
+    "content": 150,
+    "markdown": 150,
+    "contentHash": 0.5,
+    "minhash": 5,
+    "blockFingerprints": 20,
+}
+
+# Output -> alternative stage sets that produce it
+OUTPUT_PROVIDERS: Dict[str, Tuple[Tuple[str, ...], ...]] = {
+    "metadata": (("walk",), ("head",)),
+    "links": (("walk",),),
+    "images": (("walk",),),
+    "html": (("content",),),
+    # Markdown always carries its content hash; hashing costs next to nothing
+    "markdown": (("markdown", "contentHash"),),
+    "minhash": (("minhash",),),
+    "blockFingerprints": (("blockFingerprints",),),
+}
+
+# Formats extraction produces; the rest come straight from the fetch
+EXTRACTED_FORMATS = ("html", "markdown", "links", "images")
+
+
+class FormatPlan:
+    """
+    Extraction stages for one request, in run order
+    
+    Each output picks the cheapest way to produce it given the stages other
+    outputs already need; metadata, for example, comes from the walk when
+    links or images are wanted and from a head-only parse otherwise.
+    """
+    
+    def __init__(
+        self,
+        formats: Iterable[str],
+        only_main_content: bool = True,
+        include_tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None,
+        metadata_fields: Optional[Iterable[str]] = None,
+        boilerplate: bool = False,
+        signature: bool = False
+    ):
+        """
+        Plan an extraction
+        
+        Args:
+            formats: Requested output formats
+            only_main_content: Extract only main content
+            include_tags: HTML tags to include
+            exclude_tags: HTML tags to exclude
+            metadata_fields: Metadata fields to return (all when None, none when empty)
+            boilerplate: Block fingerprints are needed for a crawl's boilerplate model
+            signature: A MinHash signature of the markdown is needed
+        """
+        formats = set(formats)
+        if metadata_fields is None:
+            self.metadata_fields = list(METADATA_FIELDS)
+        else:
+            metadata_fields = set(metadata_fields)
+            self.metadata_fields = [field for field in METADATA_FIELDS if field in metadata_fields]
+        
+        # Without main content or tag filters, the raw HTML is the content as is
+        self.raw_content = not only_main_content and not include_tags and not exclude_tags
+        
+        outputs = [output for output in EXTRACTED_FORMATS if output in formats]
+        if self.metadata_fields:
+            outputs.append("metadata")
+        if signature and "markdown" in formats:
+            outputs.append("minhash")
+        if boilerplate:
+            outputs.append("blockFingerprints")
+        self.outputs = outputs
+        
+        self.stages: Set[str] = set()
+        # Outputs with a single way to be produced go first, so choices can share their stages
+        for output in sorted(outputs, key=lambda output: len(OUTPUT_PROVIDERS[output])):
+            provider = min(OUTPUT_PROVIDERS[output], key=self._added_cost)
+            self.stages |= self._closure(provider)
+        
+        self.order = [stage for stage in STAGE_DEPENDENCIES if stage in self.stages]
+    
+    def _dependencies(self, stage: str) -> Tuple[str, ...]:
+        if stage == "content" and self.raw_content:
+            return ()
+        return STAGE_DEPENDENCIES[stage]
+    
+    def _closure(self, stages: Iterable[str]) -> FrozenSet[str]:
+        needed = set()
+        pending = list(stages)
+        while pending:
+            stage = pending.pop()
+            if stage not in needed:
+                needed.add(stage)
+                pending.extend(self._dependencies(stage))
+        return frozenset(needed)
+    
+    def _added_cost(self, stages: Iterable[str]) -> float:
+        return sum(STAGE_COST[stage] for stage in self._closure(stages) - self.stages)
+    
+    def needs(self, stage: str) -> bool:
+        """Whether the plan runs a stage"""
+        return stage in self.stages
+    
+    @property
+    def cost(self) -> float:
+        """Estimated ms per 100KB of HTML"""
+        return sum(STAGE_COST[stage] for stage in self.stages)
+    
+    def __repr__(self) -> str:
+        return f"FormatPlan({' -> '.join(self.order) or 'nothing'})"
@@ -0,0 +1,374 @@
+"""
+Host-aware crawl frontier
+Best-first queues per host, a heap of the times each host may next be fetched, and a SQLite spill for large crawls
+"""
+
+import heapq
+import itertools
+import os
+import sqlite3
+import tempfile
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.scraping.url_priority import INLINK_WEIGHT, MAX_INLINKS
+from app.utils.rate_limiter import BACKOFF_STATUS_CODES, backoff_for
+
+logger = logging.getLogger(__name__)
+
+# Longest robots.txt Crawl-delay honored, in seconds
+MAX_CRAWL_DELAY = 60.0
+
+
+class FrontierSpill:
+    """
+    Queued URLs that didn't fit in memory, in a temporary SQLite file
+    
+    The file lives only as long as the crawl; close() deletes it.
+    """
+    
+    def __init__(self, directory: Optional[str] = None):
+        fd, self.path = tempfile.mkstemp(prefix="frontier-", suffix=".sqlite", dir=directory)
+        os.close(fd)
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+        # Nothing here needs to survive a crash
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute(
+            "CREATE TABLE urls ("
+            "url TEXT PRIMARY KEY, host TEXT NOT NULL, score REAL NOT NULL, "
+            "seq INTEGER NOT NULL, inlinks INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX urls_best ON urls (host, score DESC, seq)")
+    
+    def put(self, rows: List[Tuple[str, str, float, int, int]]):
+        """Store (url, host, score, seq, inlinks) rows"""
+        self.db.execute("BEGIN")
+        self.db.executemany("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.execute("COMMIT")
+    
+    def take(self, host: str, limit: int) -> List[Tuple[str, float, int, int]]:
+        """Remove and return a host's best (url, score, seq, inlinks) rows"""
+        rows = self.db.execute(
+            "SELECT url, score, seq, inlinks FROM urls WHERE host = ? ORDER BY score DESC, seq LIMIT ?",
+            (host, limit)
+        ).fetchall()
+        self.db.execute("BEGIN")
+        self.db.executemany("DELETE FROM urls WHERE url = ?", [(row[0],) for row in rows])
+        self.db.execute("COMMIT")
+        return rows
+    
+    def best_score(self, host: str) -> Optional[float]:
+        """Highest score stored for a host"""
+        return self.db.execute("SELECT MAX(score) FROM urls WHERE host = ?", (host,)).fetchone()[0]
+    
+    def add_inlink(self, url: str) -> Optional[float]:
+        """Count a link to a stored URL; returns its new score, or None if it isn't stored"""
+        updated = self.db.execute(
+            "UPDATE urls SET score = score + CASE WHEN inlinks < ? THEN ? ELSE 0 END, inlinks = inlinks + 1 "
+            "WHERE url = ?",
+            (MAX_INLINKS, INLINK_WEIGHT, url)
+        ).rowcount
+        if not updated:
+            return None
+        return self.db.execute("SELECT score FROM urls WHERE url = ?", (url,)).fetchone()[0]
+    
+    def close(self):
+        """Close and delete the file"""
+        self.db.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class _HostQueue:
+    """One host's queued URLs: the best in memory, the rest spilled"""
+    
+    def __init__(self):
+        # (-score, seq, url); entries whose score changed since are skipped
+        self.heap: List[Tuple[float, int, str]] = []
+        self.in_memory = 0
+        self.spilled = 0
+        # No spilled URL scores higher than this
+        self.spilled_best = float("-inf")
+
+
+class HostFrontier:
+    """
+    URLs waiting to be crawled, grouped by host, best first
+    
+    Each host has a next-allowed fetch time: the last dispatch plus the
+    host's delay, which is the crawl's delay_ms or the site's robots.txt
+    Crawl-delay, whichever is longer, plus any backoff after 429/5xx
+    responses. pop() returns the highest-scored URL of the hosts that are
+    ready, so a slow or rate-limited host never holds up the others, and
+    hosts with equal scores take turns.
+    
+    At most memory_limit URLs are held in memory. Past that, each host's
+    lowest-scored URLs are spilled to SQLite and read back, best first,
+    when its in-memory URLs run out, so memory stays flat however many URLs
+    a crawl discovers.
+    """
+    
+    def __init__(
+        self,
+        delay_ms: int = 0,
+        memory_limit: Optional[int] = None,
+        spill_dir: Optional[str] = None
+    ):
+        self.delay = max(0, delay_ms) / 1000
+        self.memory_limit = memory_limit or int(os.getenv("CRAWL_FRONTIER_MEMORY_URLS", "200000"))
+        self.spill_dir = spill_dir or os.getenv("CRAWL_FRONTIER_SPILL_DIR") or None
+        self.spill: Optional[FrontierSpill] = None
+        self.queues: Dict[str, _HostQueue] = {}
+        # In-memory URL -> (score, in-links)
+        self.entries: Dict[str, Tuple[float, int]] = {}
+        self.next_allowed: Dict[str, float] = {}
+        self.crawl_delays: Dict[str, float] = {}
+        # Host -> backoff in ms
+        self.backoffs: Dict[str, float] = {}
+        # (ready time, tie-breaker, host) for hosts waiting out their delay
+        self.waiting: List[Tuple[float, int, str]] = []
+        # (-best score, tie-breaker, host) for hosts that may be fetched now
+        self.ready: List[Tuple[float, int, str]] = []
+        self.scheduled = set()
+        # Hosts with a popped URL not yet dispatched or released; none of their URLs are handed out meanwhile
+        self.held = set()
+        self.size = 0
+        self._order = itertools.count()
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).netloc.lower()
+    
+    def _schedule(self, host: str):
+        heapq.heappush(self.waiting, (self.next_allowed.get(host, 0.0), next(self._order), host))
+        self.scheduled.add(host)
+    
+    def _best(self, host: str) -> Optional[float]:
+        """Score of a host's best queued URL, reading spilled ones back when memory runs out"""
+        queue = self.queues.get(host)
+        if queue is None:
+            return None
+        heap = queue.heap
+        while True:
+            while heap and self.entries.get(heap[0][2], (None,))[0] != -heap[0][0]:
+                heapq.heappop(heap)
+            if heap:
+                return -heap[0][0]
+            if not queue.spilled:
+                return None
+            self._refill(host, queue)
+    
+    def _refill(self, host: str, queue: _HostQueue):
+        rows = self.spill.take(host, max(1, min(1000, self.memory_limit // 10)))
+        for url, score, seq, inlinks in rows:
+            self.entries[url] = (score, inlinks)
+            heapq.heappush(queue.heap, (-score, seq, url))
+        queue.in_memory += len(rows)
+        queue.spilled -= len(rows)
+        queue.spilled_best = self.spill.best_score(host) if queue.spilled else float("-inf")
+    
+    def _spill(self):
+        """Move the lowest-scored in-memory URLs of the largest hosts to disk"""
+        if self.spill is None:
+            self.spill = FrontierSpill(self.spill_dir)
+            logger.info(f"Crawl frontier over {self.memory_limit} URLs, spilling to {self.spill.path}")
+        
+        target = self.memory_limit * 3 // 4
+        for host, queue in sorted(self.queues.items(), key=lambda item: -item[1].in_memory):
+            if len(self.entries) <= target:
+                break
+            live = sorted(
+                (entry for entry in queue.heap if self.entries.get(entry[2], (None,))[0] == -entry[0])
+            )
+            keep = len(live) // 2
+            moved = live[keep:]
+            if not moved:
+                continue
+            self.spill.put([
+                (url, host, -negative, seq, self.entries.pop(url)[1])
+                for negative, seq, url in moved
+            ])
+            queue.heap = live[:keep]
+            heapq.heapify(queue.heap)
+            queue.in_memory = keep
+            queue.spilled += len(moved)
+            queue.spilled_best = max(queue.spilled_best, -moved[0][0])
+    
+    def push(self, url: str, score: float = 0.0):
+        """
+        Queue a URL
+        
+        Args:
+            url: Normalized URL, not already queued
+            score: Priority (see UrlScorer); higher is crawled first
+        """
+        host = self.host(url)
+        queue = self.queues.setdefault(host, _HostQueue())
+        self.size += 1
+        seq = next(self._order)
+        
+        # Below the host's spilled URLs, it would only be spilled later anyway
+        if queue.spilled and score <= queue.spilled_best:
+            self.spill.put([(url, host, score, seq, 0)])
+            queue.spilled += 1
+        else:
+            self.entries[url] = (score, 0)
+            heapq.heappush(queue.heap, (-score, seq, url))
+            queue.in_memory += 1
+            if len(self.entries) > self.memory_limit:
+                self._spill()
+        
+        if host not in self.scheduled and host not in self.held:
+            self._schedule(host)
+    
+    def add_inlink(self, url: str) -> bool:
+        """
+        Raise a queued URL's score for another page linking to it
+        
+        Returns:
+            Whether the URL is queued
+        """
+        entry = self.entries.get(url)
+        if entry is not None:
+            score, inlinks = entry
+            if inlinks < MAX_INLINKS:
+                score += INLINK_WEIGHT
+                heapq.heappush(self.queues[self.host(url)].heap, (-score, next(self._order), url))
+            self.entries[url] = (score, inlinks + 1)
+            return True
+        
+        if self.spill is None:
+            return False
+        score = self.spill.add_inlink(url)
+        if score is None:
+            return False
+        queue = self.queues[self.host(url)]
+        queue.spilled_best = max(queue.spilled_best, score)
+        return True
+    
+    def pop(self, now: Optional[float] = None) -> Optional[str]:
+        """
+        Take the best URL of the hosts that are ready
+        
+        The host is held until the URL is dispatched (see dispatched()) or
+        released (see release()), so checks such as robots.txt can run
+        while other URLs are popped without a second URL of the same host
+        going out early. The host's delay only starts once the URL is
+        dispatched, so URLs that turn out to be filtered cost no wait.
+        
+        Args:
+            now: Current monotonic time
+            
+        Returns:
+            URL, or None when no host is ready yet
+        """
+        now = time.monotonic() if now is None else now
+        while self.waiting and self.waiting[0][0] <= now:
+            ready, _, host = heapq.heappop(self.waiting)
+            # A backoff or dispatch since this entry was pushed moved the host back
+            allowed = self.next_allowed.get(host, 0.0)
+            if allowed > ready:
+                heapq.heappush(self.waiting, (allowed, next(self._order), host))
+                continue
+            best = self._best(host)
+            if best is None:
+                self.scheduled.discard(host)
+            else:
+                heapq.heappush(self.ready, (-best, next(self._order), host))
+        
+        while self.ready:
+            negative, _, host = heapq.heappop(self.ready)
+            best = self._best(host)
+            if best is None:
+                self.scheduled.discard(host)
+                continue
+            if self.next_allowed.get(host, 0.0) > now:
+                heapq.heappush(self.waiting, (self.next_allowed[host], next(self._order), host))
+                continue
+            # Links found since scheduling raised the host's best; rank it again
+            if best != -negative:
+                heapq.heappush(self.ready, (-best, next(self._order), host))
+                continue
+            
+            queue = self.queues[host]
+            _, _, url = heapq.heappop(queue.heap)
+            del self.entries[url]
+            queue.in_memory -= 1
+            self.size -= 1
+            self.scheduled.discard(host)
+            self.held.add(host)
+            if self._best(host) is None:
+                del self.queues[host]
+            return url
+        return None
+    
+    def ready_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until some host is ready, or None when the frontier is empty"""
+        if self.ready:
+            return 0.0
+        if not self.waiting:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.waiting[0][0] - now)
+    
+    def host_delay(self, host: str) -> float:
+        """Seconds between request starts to a host"""
+        return max(self.delay, self.crawl_delays.get(host, 0.0)) + self.backoffs.get(host, 0.0) / 1000
+    
+    def dispatched(self, url: str, now: Optional[float] = None):
+        """Start the host's delay for a popped URL about to be fetched, and stop holding the host"""
+        now = time.monotonic() if now is None else now
+        host = self.host(url)
+        self.next_allowed[host] = now + self.host_delay(host)
+        self._unhold(host)
+    
+    def release(self, url: str):
+        """Stop holding the host of a popped URL that won't be fetched"""
+        self._unhold(self.host(url))
+    
+    def _unhold(self, host: str):
+        self.held.discard(host)
+        if host in self.queues and host not in self.scheduled:
+            self._schedule(host)
+    
+    def set_crawl_delay(self, host: str, seconds: float):
+        """Honor a robots.txt Crawl-delay for a host"""
+        if seconds > 0:
+            self.crawl_delays[host] = min(seconds, MAX_CRAWL_DELAY)
+    
+    def record_response(self, url: str, status_code: int, retry_after: Optional[int] = None):
+        """
+        Adjust a host's backoff to a response
+        
+        Args:
+            url: URL that was fetched
+            status_code: HTTP status code (0 when the fetch failed outright)
+            retry_after: Retry-After header value in seconds
+        """
+        host = self.host(url)
+        # DomainRateLimiter's rules, kept per crawl without a Redis round trip per dispatch
+        backoff_ms = backoff_for(status_code, self.backoffs.get(host, 0.0), retry_after)
+        if backoff_ms is None:
+            return
+        if backoff_ms == 0:
+            self.backoffs.pop(host, None)
+            return
+        if status_code in BACKOFF_STATUS_CODES:
+            logger.warning(f"Rate limited on {host}, backoff: {backoff_ms}ms")
+        
+        self.backoffs[host] = backoff_ms
+        self.next_allowed[host] = max(self.next_allowed.get(host, 0.0), time.monotonic() + backoff_ms / 1000)
+    
+    def close(self):
+        """Delete the spill file, if any"""
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
@@ -0,0 +1,481 @@
+"""
+Streaming HTML to Markdown conversion
+Converts large documents in one pass over lxml parser events, without building a document tree
+"""
+
+import re
+import logging
+from textwrap import fill
+from typing import List, Optional
+from urllib.parse import urljoin
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# The rules below reproduce markdownify with the options used by
+# ContentExtractor.html_to_markdown (ATX headings, "-" bullets, wrap at 80,
+# script/style/meta/link stripped)
+WRAP_WIDTH = 80
+FEED_CHARS = 65536
+
+INLINE_MARKUP = {
+    "b": "**", "strong": "**", "em": "*", "i": "*",
+    "del": "~~", "s": "~~", "sub": "", "sup": ""
+}
+CODE_TAGS = {"code", "kbd", "samp"}
+LIST_TAGS = {"ul", "ol"}
+CELL_TAGS = {"td", "th"}
+NESTED_TAGS = {"ol", "ul", "li", "table", "thead", "tbody", "tfoot", "tr", "td", "th"}
+CONVERTED_TAGS = (
+    set(INLINE_MARKUP) | CODE_TAGS | LIST_TAGS | CELL_TAGS
+    | {"a", "blockquote", "br", "hr", "img", "li", "p", "pre", "table", "tr"}
+)
+
+HEADING_RE = re.compile(r'h(\d+)')
+INLINE_HEADING_RE = re.compile(r'h[1-6]')
+WHITESPACE_RE = re.compile(r'[\t ]+')
+LINE_BEGINNING_RE = re.compile(r'^', re.MULTILINE)
+NEWLINE_RUN_RE = re.compile(r'\n{3,}')
+SPACE_RUN_RE = re.compile(r'[ \t]+')
+
+# BeautifulSoup collapses whitespace-only strings outside these tags
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+ASCII_SPACES = ' \n\t\x0c\r'
+
+
+def _chomp(text: str):
+    """Move a leading/trailing space outside inline markup"""
+    prefix = ' ' if text and text[0] == ' ' else ''
+    suffix = ' ' if text and text[-1] == ' ' else ''
+    return prefix, suffix, text.strip()
+
+
+class _Node:
+    """A child of an open element: a string, a comment or an element"""
+    
+    __slots__ = ("name", "text", "blank", "comment", "list_pending")
+    
+    def __init__(self, name: Optional[str], text: str = "", comment: bool = False):
+        self.name = name
+        self.text = text
+        self.comment = comment
+        self.blank = name is None and text.strip() == ''
+        self.list_pending = False
+
+
+class _Frame:
+    """State of an open element while its children are converted"""
+    
+    __slots__ = (
+        "name", "attrs", "parent", "node", "index", "inline", "children_inline",
+        "in_li", "converts", "streaming", "nested", "parts", "held", "skip_next",
+        "last", "kept", "cells", "all_th"
+    )
+    
+    def __init__(self, name: str, attrs: dict, parent: Optional["_Frame"], node: Optional[_Node]):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.node = node
+        # Position among the parent's kept children; this node was just added
+        self.index = parent.kept - 1 if parent else 0
+        self.inline = parent.children_inline if parent else False
+        
+        heading = parent is not None and INLINE_HEADING_RE.match(name) is not None
+        self.children_inline = self.inline or heading or name in CELL_TAGS
+        self.in_li = name == "li" or (parent is not None and parent.in_li)
+        
+        self.converts = name in CONVERTED_TAGS or (
+            parent is not None and HEADING_RE.match(name) is not None
+        )
+        # Elements without markup of their own pass their children's output
+        # straight up; under the root that means straight to the writer
+        self.streaming = not self.converts and (parent is None or parent.streaming)
+        self.nested = name in NESTED_TAGS
+        self.parts: List[str] = []
+        
+        # Whitespace-only string waiting for its next sibling before it is dropped or kept
+        self.held: Optional[_Node] = None
+        self.skip_next = False
+        # Last kept child, emitted once its next sibling is known
+        self.last: Optional[_Node] = None
+        self.kept = 0
+        
+        self.cells = 0
+        self.all_th = True
+
+
+class _MarkdownWriter:
+    """
+    Output buffer applying html_to_markdown's clean-up passes as text arrives
+    
+    Collapses newline and space runs and makes [text](url) links absolute.
+    Runs that may continue in the next chunk are carried over, so the result
+    matches running each pass over the whole document.
+    """
+    
+    FLUSH_CHARS = 65536
+    
+    def __init__(self, base_url: str = ""):
+        self.base_url = base_url
+        self.pending: List[str] = []
+        self.pending_chars = 0
+        self.newlines = ""
+        self.spaces = ""
+        self.held = ""
+        self.out: List[str] = []
+    
+    def write(self, text: str):
+        if text:
+            self.pending.append(text)
+            self.pending_chars += len(text)
+            if self.pending_chars >= self.FLUSH_CHARS:
+                self._flush(final=False)
+    
+    def _flush(self, final: bool):
+        text = self.newlines + ''.join(self.pending)
+        self.pending = []
+        self.pending_chars = 0
+        
+        self.newlines = ""
+        if not final:
+            body = text.rstrip('\n')
+            self.newlines = text[len(body):]
+            text = body
+        text = self.spaces + NEWLINE_RUN_RE.sub('\n\n', text)
+        
+        self.spaces = ""
+        if not final:
+            body = text.rstrip(' \t')
+            self.spaces = text[len(body):]
+            text = body
+        text = SPACE_RUN_RE.sub(' ', text)
+        
+        self._resolve_links(self.held + text, final)
+    
+    def _resolve_links(self, text: str, final: bool):
+        """Rewrite [text](url) like ContentExtractor._fix_relative_links, holding back unfinished links"""
+        self.held = ""
+        if not self.base_url:
+            self.out.append(text)
+            return
+        
+        length = len(text)
+        pos = start = 0
+        while True:
+            opening = text.find('[', pos)
+            if opening < 0:
+                break
+            
+            closing = text.find(']', opening + 1)
+            if closing < 0 or closing + 1 >= length:
+                if final:
+                    break
+                self.out.append(text[start:opening])
+                self.held = text[opening:]
+                return
+            if closing == opening + 1 or text[closing + 1] != '(':
+                pos = opening + 1
+                continue
+            
+            end = text.find(')', closing + 2)
+            if end < 0:
+                if final:
+                    break
+                self.out.append(text[start:opening])
+                self.held = text[opening:]
+                return
+            if end == closing + 2:
+                pos = opening + 1
+                continue
+            
+            self.out.append(text[start:opening])
+            self.out.append(
+                f"[{text[opening + 1:closing]}]({urljoin(self.base_url, text[closing + 2:end])})"
+            )
+            pos = start = end + 1
+        
+        self.out.append(text[start:])
+    
+    def getvalue(self) -> str:
+        self._flush(final=True)
+        return ''.join(self.out).strip()
+
+
+class StreamingMarkdownConverter:
+    """
+    lxml parser target that converts HTML to Markdown as the document is parsed
+    
+    Only the elements currently open are kept in memory, together with the
+    output of children whose markup depends on their siblings. Top-level
+    blocks are written out as soon as they close.
+    """
+    
+    def __init__(self, base_url: str = ""):
+        self.writer = _MarkdownWriter(base_url)
+        self.root = _Frame("[document]", {}, None, None)
+        self.current = self.root
+        self.text: List[str] = []
+        self.open_rows: List[_Frame] = []
+        self.preserve_whitespace = 0
+    
+    # Parser target interface
+    
+    def start(self, tag: str, attrib):
+        self._flush_text()
+        parent = self.current
+        node = _Node(tag)
+        self._add(parent, node)
+        
+        frame = _Frame(tag, dict(attrib), parent, node)
+        if tag == "tr":
+            self.open_rows.append(frame)
+        elif tag in CELL_TAGS:
+            for row in self.open_rows:
+                row.cells += 1
+                row.all_th = row.all_th and tag == "th"
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace += 1
+        self.current = frame
+    
+    def end(self, tag: str):
+        self._flush_text()
+        frame = self.current
+        if frame.parent is None:
+            return
+        
+        self._finish_children(frame)
+        if frame.name == "tr" and self.open_rows and self.open_rows[-1] is frame:
+            self.open_rows.pop()
+        if frame.name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace -= 1
+        
+        if frame.converts:
+            frame.node.text = self._convert(frame, ''.join(frame.parts))
+        elif not frame.streaming:
+            frame.node.text = ''.join(frame.parts)
+        self.current = frame.parent
+    
+    def data(self, data: str):
+        self.text.append(data)
+    
+    def comment(self, text: str):
+        self._flush_text()
+        self._add(self.current, _Node(None, text, comment=True))
+    
+    def close(self) -> str:
+        self._flush_text()
+        while self.current.parent is not None:
+            self.end(self.current.name)
+        self._finish_children(self.root)
+        return self.writer.getvalue()
+    
+    # Sibling bookkeeping
+    
+    def _flush_text(self):
+        if self.text:
+            text = ''.join(self.text)
+            self.text = []
+            if not self.preserve_whitespace and not text.strip(ASCII_SPACES):
+                text = '\n' if '\n' in text else ' '
+            self._add(self.current, _Node(None, text))
+    
+    def _add(self, frame: _Frame, node: _Node):
+        """Append a child, dropping whitespace-only strings the way markdownify does in nested elements"""
+        if not frame.nested:
+            self._keep(frame, node)
+            return
+        
+        held = frame.held
+        if held is not None:
+            frame.held = None
+            if frame.kept == 0 or self._is_nested(frame.last) or self._is_nested(node):
+                # markdownify removes while iterating, so it never checks the next child
+                frame.skip_next = True
+            else:
+                self._keep(frame, held)
+        
+        if frame.skip_next:
+            frame.skip_next = False
+            self._keep(frame, node)
+        elif node.blank:
+            frame.held = node
+        else:
+            self._keep(frame, node)
+    
+    @staticmethod
+    def _is_nested(node: Optional[_Node]) -> bool:
+        return node is not None and node.name in NESTED_TAGS
+    
+    def _keep(self, frame: _Frame, node: _Node):
+        if frame.last is not None:
+            self._emit(frame, frame.last, node)
+        frame.last = node
+        frame.kept += 1
+    
+    def _finish_children(self, frame: _Frame):
+        # A trailing whitespace-only string is always dropped from nested elements
+        frame.held = None
+        if frame.last is not None:
+            self._emit(frame, frame.last, None)
+            frame.last = None
+    
+    def _emit(self, frame: _Frame, node: _Node, next_node: Optional[_Node]):
+        """Write out a child now that its next sibling is known"""
+        if node.comment:
+            return
+        
+        if node.name is None:
+            text = self._process_text(frame, node.text, next_node)
+        elif node.list_pending:
+            text = node.text
+            if next_node is not None and next_node.name not in LIST_TAGS:
+                text += '\n'
+        else:
+            text = node.text
+        
+        if not text:
+            return
+        if frame.streaming:
+            self.writer.write(text)
+        else:
+            frame.parts.append(text)
+    
+    @staticmethod
+    def _process_text(frame: _Frame, text: str, next_node: Optional[_Node]) -> str:
+        name = frame.name
+        if not (name == "pre" or (name == "code" and frame.parent.name == "pre")):
+            text = WHITESPACE_RE.sub(' ', text)
+        
+        if name != "code" and name != "pre":
+            text = text.replace('*', r'\*').replace('_', r'\_')
+        
+        if name == "li" and (next_node is None or next_node.name in LIST_TAGS):
+            text = text.rstrip()
+        
+        return text
+    
+    # Markup
+    
+    def _convert(self, frame: _Frame, text: str) -> str:
+        name = frame.name
+        attrs = frame.attrs
+        inline = frame.inline
+        
+        if name in INLINE_MARKUP or (name in CODE_TAGS and frame.parent.name != "pre"):
+            markup = INLINE_MARKUP.get(name, '`')
+            prefix, suffix, text = _chomp(text)
+            if not text:
+                return ''
+            return f"{prefix}{markup}{text}{markup}{suffix}"
+        
+        if name in CODE_TAGS:
+            return text
+        
+        if name == "a":
+            prefix, suffix, text = _chomp(text)
+            if not text:
+                return ''
+            href = attrs.get("href")
+            title = attrs.get("title")
+            if text.replace(r'\_', '_') == href and not title:
+                return f"<{href}>"
+            title_part = ' "%s"' % title.replace('"', r'\"') if title else ''
+            return f"{prefix}[{text}]({href}{title_part}){suffix}" if href else text
+        
+        if name == "p":
+            if inline:
+                return text
+            text = fill(text, width=WRAP_WIDTH, break_long_words=False, break_on_hyphens=False)
+            return f"{text}\n\n" if text else ''
+        
+        if name == "br":
+            return '' if inline else '  \n'
+        
+        if name == "img":
+            alt = attrs.get("alt") or ''
+            if inline:
+                return alt
+            src = attrs.get("src") or ''
+            title = attrs.get("title") or ''
+            title_part = ' "%s"' % title.replace('"', r'\"') if title else ''
+            return f"![{alt}]({src}{title_part})"
+        
+        if name in LIST_TAGS:
+            if frame.parent.in_li:
+                return '\n' + (LINE_BEGINNING_RE.sub('\t', text) if text else '').rstrip()
+            # The trailing newline depends on the next sibling
+            frame.node.list_pending = True
+            return text
+        
+        if name == "li":
+            parent = frame.parent
+            if parent.name == "ol":
+                start = int(parent.attrs["start"]) if parent.attrs.get("start") else 1
+                bullet = f"{start + frame.index}."
+            else:
+                bullet = '-'
+            return f"{bullet} {text.strip()}\n"
+        
+        if name == "pre":
+            return f"\n```\n{text}\n```\n" if text else ''
+        
+        if name == "blockquote":
+            if inline:
+                return text
+            return '\n' + (LINE_BEGINNING_RE.sub('> ', text) + '\n\n') if text else ''
+        
+        if name == "hr":
+            return '\n\n---\n\n'
+        
+        if name == "table":
+            return '\n\n' + text + '\n'
+        
+        if name in CELL_TAGS:
+            return ' ' + text + ' |'
+        
+        if name == "tr":
+            return self._convert_row(frame, text)
+        
+        # Headings
+        if inline:
+            return text
+        hashes = '#' * int(HEADING_RE.match(name).group(1))
+        return f"{hashes} {text.rstrip()}\n\n"
+    
+    @staticmethod
+    def _convert_row(frame: _Frame, text: str) -> str:
+        cells = frame.cells
+        parent = frame.parent
+        first = frame.index == 0
+        overline = ''
+        underline = ''
+        if frame.all_th and first:
+            underline = '| ' + ' | '.join(['---'] * cells) + ' |' + '\n'
+        elif first and (parent.name == "table" or (parent.name == "tbody" and parent.index == 0)):
+            # First row without a header: print an empty header above it
+            overline = '| ' + ' | '.join([''] * cells) + ' |' + '\n'
+            overline += '| ' + ' | '.join(['---'] * cells) + ' |' + '\n'
+        return overline + '|' + text + '\n' + underline
+
+
+def stream_html_to_markdown(html: str, base_url: str = "") -> str:
+    """
+    Convert HTML to Markdown in a single streaming pass
+    
+    Produces the same output as ContentExtractor.html_to_markdown for
+    well-formed HTML. Malformed markup is repaired by libxml2 rather than
+    html.parser, so broken nesting may convert differently.
+    
+    Args:
+        html: HTML content to convert
+        base_url: Base URL for resolving relative links
+        
+    Returns:
+        Markdown formatted text
+    """
+    parser = etree.HTMLParser(target=StreamingMarkdownConverter(base_url))
+    for offset in range(0, len(html), FEED_CHARS):
+        parser.feed(html[offset:offset + FEED_CHARS])
+    return parser.close()
@@ -0,0 +1,212 @@
+"""
+Near-duplicate page detection
+MinHash signatures of page text, looked up by LSH banding per crawl and, with Redis, per project
+"""
+
+import hashlib
+import os
+import re
+import logging
+import struct
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Signature values; each shingle lands in one bin (one-permutation hashing)
+SIGNATURE_SIZE = 64
+
+# LSH bands of BAND_ROWS values; pages sharing any band are compared
+BAND_ROWS = 4
+BANDS = SIGNATURE_SIZE // BAND_ROWS
+
+# Words per shingle
+SHINGLE_WORDS = 3
+
+# Pages with fewer words than this are too short to compare reliably
+MIN_SIGNATURE_WORDS = 30
+
+_VALUE_MASK = 0xFFFFFFFF
+# Offset added per bin when an empty bin borrows its neighbour's value
+_ROTATION = 0x9E3779B1
+_PACK = struct.Struct(f"<{SIGNATURE_SIZE}I")
+
+# Link targets differ on tracking-parameter variants, so only link text is compared
+_LINK_TARGET_RE = re.compile(r'\]\([^)]*\)')
+_WORD_RE = re.compile(r'\w+')
+
+
+def minhash(text: str) -> Optional[List[int]]:
+    """
+    MinHash signature of a document's word shingles
+    
+    Args:
+        text: Page text or Markdown
+        
+    Returns:
+        SIGNATURE_SIZE 32-bit values, or None when the text is too short to compare
+    """
+    words = _WORD_RE.findall(_LINK_TARGET_RE.sub(']', text).lower())
+    if len(words) < MIN_SIGNATURE_WORDS:
+        return None
+    
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    bins = [None] * SIGNATURE_SIZE
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        index = value % SIGNATURE_SIZE
+        value = (value >> 8) & _VALUE_MASK
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    
+    # Empty bins take the next filled bin's value, offset by distance (rotation densification)
+    signature = []
+    for index in range(SIGNATURE_SIZE):
+        distance = 0
+        while bins[(index + distance) % SIGNATURE_SIZE] is None:
+            distance += 1
+        signature.append((bins[(index + distance) % SIGNATURE_SIZE] + distance * _ROTATION) & _VALUE_MASK)
+    return signature
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of two signatures' shingle sets"""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of the pages seen by one crawl
+    
+    Pages sharing any LSH band are candidates, and a candidate is a
+    near-duplicate when the estimated similarity of the two pages reaches
+    the threshold. With a project_id, signatures are also kept in Redis so
+    later crawls of the project see earlier ones. Redis errors never fail a
+    crawl; lookups fall back to this crawl's pages until Redis is reachable
+    again.
+    """
+    
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        threshold: Optional[float] = None,
+        redis_url: Optional[str] = None,
+        ttl: Optional[int] = None
+    ):
+        self.project_id = project_id
+        self.threshold = threshold if threshold is not None else float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = None
+        self.ttl = ttl or int(os.getenv("NEAR_DUPLICATE_TTL", "2592000"))
+        self.retry_after = 0.0
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+        # (band, band values) -> URLs
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+    
+    @staticmethod
+    def _bands(signature: Sequence[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(band, tuple(signature[band * BAND_ROWS:(band + 1) * BAND_ROWS])) for band in range(BANDS)]
+    
+    def _closest(self, signature: Sequence[int], candidates: Dict[str, Sequence[int]], url: str) -> Optional[str]:
+        best = None
+        best_similarity = self.threshold
+        for candidate_url, candidate in candidates.items():
+            # The same URL seen again (a recrawl) is an update, not a duplicate
+            if candidate_url == url:
+                continue
+            score = similarity(signature, candidate)
+            if score >= best_similarity:
+                best, best_similarity = candidate_url, score
+        return best
+    
+    async def _redis(self):
+        """Redis client, or None without a project or while Redis is unavailable"""
+        if not self.project_id or time.time() < self.retry_after:
+            return None
+        try:
+            if not self.redis_client:
+                self.redis_client = await redis.from_url(self.redis_url)
+            return self.redis_client
+        except Exception as e:
+            logger.debug(f"Near-duplicate index Redis unavailable: {e}")
+            self.retry_after = time.time() + 60
+            return None
+    
+    async def disconnect(self):
+        """Disconnect from Redis"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+    
+    async def _check_project(self, client, url: str, signature: Sequence[int], bands) -> Optional[str]:
+        """Look a page up in the project index, recording it if it is new"""
+        prefix = f"neardup:{self.project_id}"
+        band_keys = [f"{prefix}:{band}:" + "".join(f"{value:08x}" for value in values) for band, values in bands]
+        
+        pipe = client.pipeline()
+        for band_key in band_keys:
+            pipe.smembers(band_key)
+        candidate_urls = sorted({member for members in await pipe.execute() for member in members})
+        if candidate_urls:
+            packed = await client.hmget(f"{prefix}:signatures", candidate_urls)
+            candidates = {
+                candidate_url.decode('utf-8'): _PACK.unpack(blob)
+                for candidate_url, blob in zip(candidate_urls, packed)
+                if blob is not None
+            }
+            duplicate_of = self._closest(signature, candidates, url)
+            if duplicate_of:
+                return duplicate_of
+        
+        pipe = client.pipeline()
+        for band_key in band_keys:
+            pipe.sadd(band_key, url)
+            pipe.expire(band_key, self.ttl)
+        pipe.hset(f"{prefix}:signatures", url, _PACK.pack(*signature))
+        pipe.expire(f"{prefix}:signatures", self.ttl)
+        await pipe.execute()
+        return None
+    
+    async def check(self, url: str, signature: Optional[Sequence[int]]) -> Optional[str]:
+        """
+        Find an earlier near-duplicate of a page, or record the page
+        
+        Args:
+            url: Page URL
+            signature: minhash() of the page text
+            
+        Returns:
+            URL of the near-duplicate page, or None if the page is new
+        """
+        if not signature:
+            return None
+        
+        bands = self._bands(signature)
+        candidates = {
+            candidate_url: self.signatures[candidate_url]
+            for band in bands
+            for candidate_url in self.buckets.get(band, ())
+        }
+        duplicate_of = self._closest(signature, candidates, url)
+        if duplicate_of:
+            return duplicate_of
+        
+        client = await self._redis()
+        if client:
+            try:
+                duplicate_of = await self._check_project(client, url, signature, bands)
+            except Exception as e:
+                logger.debug(f"Near-duplicate project lookup failed: {e}")
+                self.retry_after = time.time() + 60
+            if duplicate_of:
+                logger.debug(f"{url} is a near-duplicate of {duplicate_of} elsewhere in the project")
+                return duplicate_of
+        
+        self.signatures[url] = tuple(signature)
+        for band in bands:
+            self.buckets.setdefault(band, []).append(url)
+        return None
@@ -0,0 +1,245 @@
+"""
+Content-type preflight for URLs about to be fetched
+Skips archives, media and oversized responses before they reach a browser, from a HEAD or ranged GET
+"""
+
+import os
+import random
+import time
+import logging
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.scraping.documents import document_kind
+
+logger = logging.getLogger(__name__)
+
+# Never worth a request: nothing to extract from these
+BINARY_EXTENSIONS = frozenset({
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".tar", ".zst",
+    ".exe", ".msi", ".dmg", ".pkg", ".deb", ".rpm", ".apk", ".appimage", ".iso", ".img", ".bin", ".jar",
+    ".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm", ".wmv", ".flv",
+    ".mp3", ".m4a", ".wav", ".flac", ".ogg", ".aac",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff", ".ico", ".avif", ".heic",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".odt", ".ods", ".odp",
+})
+
+# Extensions of server-generated pages; one script can serve pages and downloads alike
+DYNAMIC_EXTENSIONS = frozenset({"", ".html", ".htm", ".xhtml", ".php", ".asp", ".aspx", ".jsp", ".cgi", ".pl"})
+
+SKIP_EXTENSION = "extension"
+SKIP_CONTENT_TYPE = "content_type"
+SKIP_TOO_LARGE = "too_large"
+
+
+class SkippedContent(Exception):
+    """A URL was skipped by content-type policy instead of being fetched"""
+    
+    def __init__(self, url: str, reason: str, detail: Optional[str] = None):
+        super().__init__(f"Skipped {url}: {detail or reason}")
+        self.url = url
+        self.reason = reason
+
+
+def _extension(url: str) -> str:
+    return os.path.splitext(urlparse(url).path.lower())[1]
+
+
+def content_policy(
+    url: str,
+    content_type: Optional[str],
+    content_length: Optional[int],
+    max_bytes: int,
+    document_max_bytes: Optional[int] = None
+) -> Optional[str]:
+    """
+    Decide whether a response is worth fetching
+    
+    HTML and the documents with a direct handler (see documents.py) are
+    allowed; a missing content type gives the URL the benefit of the doubt.
+    
+    Args:
+        url: URL of the response
+        content_type: Content-Type header
+        content_length: Body size in bytes, if known
+        max_bytes: Largest page allowed
+        document_max_bytes: Largest non-HTML document allowed (max_bytes when omitted)
+        
+    Returns:
+        Skip reason (content_type or too_large), or None if the URL should be fetched
+    """
+    mime = (content_type or "").split(";")[0].strip().lower()
+    document = document_kind(content_type, url)
+    if mime and "html" not in mime and not document:
+        return SKIP_CONTENT_TYPE
+    
+    limit = (document_max_bytes or max_bytes) if document else max_bytes
+    if content_length is not None and content_length > limit:
+        return SKIP_TOO_LARGE
+    return None
+
+
+class ContentPreflight:
+    """
+    Content-type and size checks for URLs, before a browser is involved
+    
+    Verdicts are cached per URL, and per host and file extension: once
+    pattern_threshold URLs with the same extension on a host have been
+    skipped and none allowed, later ones are skipped without a request.
+    Probe errors never skip a URL; the fetch itself reports them.
+    """
+    
+    def __init__(
+        self,
+        http_fetcher,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[int] = None,
+        pattern_threshold: Optional[int] = None,
+        max_entries: int = 100000
+    ):
+        self.http_fetcher = http_fetcher
+        self.enabled = os.getenv("PREFLIGHT", "true").lower() == "true"
+        self.max_bytes = max_bytes or int(os.getenv("PREFLIGHT_MAX_BYTES", str(25 * 1024 * 1024)))
+        self.ttl = ttl or int(os.getenv("PREFLIGHT_CACHE_TTL", "3600"))
+        self.pattern_threshold = pattern_threshold or int(os.getenv("PREFLIGHT_PATTERN_THRESHOLD", "3"))
+        self.timeout = int(os.getenv("PREFLIGHT_TIMEOUT", "5000"))
+        self.max_entries = max_entries
+        # URL -> (skip reason or None, expiry)
+        self.urls: Dict[str, Tuple[Optional[str], float]] = {}
+        # (host, extension) -> [skipped, allowed]
+        self.patterns: Dict[Tuple[str, str], List[int]] = {}
+    
+    @staticmethod
+    def _pattern(url: str) -> Optional[Tuple[str, str]]:
+        extension = _extension(url)
+        if extension in DYNAMIC_EXTENSIONS:
+            return None
+        return urlparse(url).netloc.lower(), extension
+    
+    def cached(self, url: str) -> Optional[str]:
+        """
+        Skip reason known for a URL without a request
+        
+        Args:
+            url: URL about to be fetched
+            
+        Returns:
+            Skip reason, or None if the URL is allowed or not yet known
+        """
+        if not self.enabled:
+            return None
+        
+        if _extension(url) in BINARY_EXTENSIONS:
+            return SKIP_EXTENSION
+        
+        cached = self.urls.get(url)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        
+        pattern = self._pattern(url)
+        counts = self.patterns.get(pattern) if pattern else None
+        if counts and counts[0] >= self.pattern_threshold and counts[1] == 0:
+            return SKIP_EXTENSION
+        return None
+    
+    def record(self, url: str, content_type: Optional[str], content_length: Optional[int]) -> Optional[str]:
+        """
+        Judge a URL by its response headers and remember the verdict
+        
+        Args:
+            url: Requested URL
+            content_type: Content-Type header
+            content_length: Body size in bytes, if known
+            
+        Returns:
+            Skip reason, or None if the URL should be fetched
+        """
+        if not self.enabled:
+            return None
+        
+        reason = content_policy(
+            url, content_type, content_length, self.max_bytes,
+            getattr(self.http_fetcher, "document_max_bytes", None)
+        )
+        
+        if len(self.urls) >= self.max_entries:
+            # Oldest half first; dicts keep insertion order
+            for key in list(islice(self.urls, self.max_entries // 2)):
+                del self.urls[key]
+        self.urls[url] = (reason, time.monotonic() + self.ttl)
+        
+        # Size says nothing about the other files of a type
+        pattern = self._pattern(url)
+        if pattern and reason != SKIP_TOO_LARGE:
+            counts = self.patterns.setdefault(pattern, [0, 0])
+            counts[0 if reason else 1] += 1
+        return reason
+    
+    async def _probe(self, url: str, headers: Optional[Dict[str, str]]) -> Optional[Tuple[Optional[str], Optional[int]]]:
+        """Content type and length from a HEAD, or a one-byte ranged GET when HEAD is unhelpful"""
+        await self.http_fetcher.start()
+        client = self.http_fetcher.client
+        request_headers = {"User-Agent": random.choice(self.http_fetcher.user_agents)}
+        if headers:
+            request_headers.update(headers)
+        timeout = self.timeout / 1000
+        
+        response = await client.head(url, headers=request_headers, timeout=timeout)
+        content_type = response.headers.get("content-type")
+        if response.status_code < 400 and content_type:
+            length = response.headers.get("content-length", "")
+            return content_type, int(length) if length.isdigit() else None
+        
+        # Many servers refuse or mishandle HEAD; ask for the first byte instead
+        async with client.stream(
+            "GET",
+            url,
+            headers={**request_headers, "Range": "bytes=0-0"},
+            timeout=timeout
+        ) as response:
+            if response.status_code >= 400:
+                return None
+            content_type = response.headers.get("content-type")
+            length = None
+            content_range = response.headers.get("content-range", "")
+            if response.status_code == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                length = int(total) if total.isdigit() else None
+            elif response.headers.get("content-length", "").isdigit():
+                length = int(response.headers["content-length"])
+            return content_type, length
+    
+    async def check(self, url: str, headers: Optional[Dict[str, str]] = None, probe: bool = True) -> Optional[str]:
+        """
+        Decide whether a URL is worth fetching
+        
+        Args:
+            url: URL about to be fetched
+            headers: Custom HTTP headers for the probe
+            probe: Send a HEAD/ranged GET when the cache has no verdict
+            
+        Returns:
+            Skip reason (extension, content_type or too_large), or None to fetch
+        """
+        if not self.enabled:
+            return None
+        
+        reason = self.cached(url)
+        known = self.urls.get(url)
+        if reason or not probe or (known and known[1] > time.monotonic()):
+            return reason
+        
+        try:
+            probed = await self._probe(url, headers)
+        except Exception as e:
+            logger.debug(f"Preflight failed for {url}: {e}")
+            return None
+        if probed is None:
+            return None
+        
+        reason = self.record(url, *probed)
+        if reason:
+            logger.info(f"Preflight skipping {url}: {reason} ({probed[0]}, {probed[1]} bytes)")
+        return reason
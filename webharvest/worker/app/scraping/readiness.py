@@ -0,0 +1,174 @@
+"""
+Adaptive page readiness detection
+Waits until the DOM and the network have been quiet for a short window instead
+of relying on networkidle and fixed sleeps
+"""
+
+import asyncio
+import os
+import logging
+import time
+from typing import Dict, Any, Optional
+
+from playwright.async_api import Page, Request
+
+logger = logging.getLogger(__name__)
+
+# Injected into every context; records the time of the last DOM mutation
+READINESS_SCRIPT = """
+(() => {
+    if (window.__webharvestReadiness) return;
+    const state = { lastMutation: performance.now(), mutations: 0 };
+    window.__webharvestReadiness = state;
+    const observe = () => {
+        new MutationObserver(() => {
+            state.lastMutation = performance.now();
+            state.mutations++;
+        }).observe(document, { childList: true, subtree: true, characterData: true });
+    };
+    if (document.documentElement) {
+        observe();
+    } else {
+        document.addEventListener('readystatechange', observe, { once: true });
+    }
+})();
+"""
+
+READINESS_PROBE = """
+() => {
+    const state = window.__webharvestReadiness;
+    return {
+        readyState: document.readyState,
+        quietFor: state ? performance.now() - state.lastMutation : null
+    };
+}
+"""
+
+# Requests that never settle and shouldn't hold up readiness
+IGNORED_RESOURCE_TYPES = {"websocket", "eventsource", "manifest", "other"}
+BEACON_PATTERNS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "/collect?", "/beacon", "/track", "/pixel", "hotjar.com", "segment.io",
+    "facebook.com/tr", "clarity.ms"
+)
+
+
+class RequestTracker:
+    """Count in-flight requests on a page, ignoring beacons and long-polls"""
+    
+    def __init__(self, page: Page, long_request_ms: int):
+        self.page = page
+        self.long_request_ms = long_request_ms
+        self.inflight: Dict[Request, float] = {}
+    
+    def _on_request(self, request: Request):
+        if request.resource_type in IGNORED_RESOURCE_TYPES:
+            return
+        if any(pattern in request.url for pattern in BEACON_PATTERNS):
+            return
+        self.inflight[request] = time.monotonic()
+    
+    def _on_done(self, request: Request):
+        self.inflight.pop(request, None)
+    
+    def __enter__(self):
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_done)
+        self.page.on("requestfailed", self._on_done)
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_done)
+        self.page.remove_listener("requestfailed", self._on_done)
+    
+    def active(self) -> int:
+        """In-flight requests younger than the long-request cutoff"""
+        cutoff = time.monotonic() - self.long_request_ms / 1000
+        return sum(1 for started in self.inflight.values() if started >= cutoff)
+
+
+class PageReadiness:
+    """Decide when a rendered page's content has settled"""
+    
+    def __init__(
+        self,
+        quiet_ms: Optional[int] = None,
+        max_wait_ms: Optional[int] = None,
+        long_request_ms: Optional[int] = None,
+        poll_ms: int = 100
+    ):
+        self.quiet_ms = quiet_ms or int(os.getenv("READINESS_QUIET_MS", "500"))
+        self.max_wait_ms = max_wait_ms or int(os.getenv("READINESS_MAX_WAIT_MS", "10000"))
+        self.long_request_ms = long_request_ms or int(os.getenv("READINESS_LONG_REQUEST_MS", "3000"))
+        self.poll_ms = poll_ms
+    
+    async def goto(
+        self,
+        page: Page,
+        url: str,
+        timeout: int = 30000,
+        max_wait_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Navigate and wait until the page is ready
+        
+        Args:
+            page: Page to navigate
+            url: URL to load
+            timeout: Navigation timeout in milliseconds
+            max_wait_ms: Upper bound on the settle wait after DOMContentLoaded
+            
+        Returns:
+            Dictionary with the response, whether the page settled and stage timings in ms
+        """
+        max_wait_ms = max_wait_ms or self.max_wait_ms
+        
+        with RequestTracker(page, self.long_request_ms) as tracker:
+            start = time.monotonic()
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+            navigated = time.monotonic()
+            
+            settled = await self._wait_for_quiet(page, tracker, max_wait_ms)
+            ready = time.monotonic()
+        
+        return {
+            "response": response,
+            "settled": settled,
+            "timings": {
+                "navigation": round((navigated - start) * 1000),
+                "readiness": round((ready - navigated) * 1000)
+            }
+        }
+    
+    async def _wait_for_quiet(self, page: Page, tracker: RequestTracker, max_wait_ms: int) -> bool:
+        """Poll until DOM and network have been quiet for quiet_ms, up to max_wait_ms"""
+        deadline = time.monotonic() + max_wait_ms / 1000
+        network_quiet_since = None
+        
+        while time.monotonic() < deadline:
+            try:
+                probe = await page.evaluate(READINESS_PROBE)
+            except Exception as e:
+                # Page navigated (e.g. a client-side redirect); keep waiting
+                logger.debug(f"Readiness probe failed: {e}")
+                probe = None
+            
+            now = time.monotonic()
+            if tracker.active() == 0:
+                network_quiet_since = network_quiet_since or now
+            else:
+                network_quiet_since = None
+            
+            if probe and probe["readyState"] != "loading":
+                dom_quiet = probe["quietFor"] is None or probe["quietFor"] >= self.quiet_ms
+                network_quiet = (
+                    network_quiet_since is not None
+                    and (now - network_quiet_since) * 1000 >= self.quiet_ms
+                )
+                if dom_quiet and network_quiet:
+                    return True
+            
+            await asyncio.sleep(self.poll_ms / 1000)
+        
+        return False
@@ -0,0 +1,196 @@
+"""
+Learned render tiers per domain
+Remembers the cheapest fetch tier that produced complete content for a site
+"""
+
+import random
+import time
+import logging
+import os
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlparse
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Render tiers, cheapest first
+TIER_HTTP = "http"
+TIER_STATIC = "static"  # Browser with JavaScript disabled
+TIER_JS = "js"
+TIERS = [TIER_HTTP, TIER_STATIC, TIER_JS]
+
+
+def majority_tier(votes: Dict[str, int]) -> Optional[str]:
+    """
+    Tier most of a domain's recorded pages needed
+    
+    Args:
+        votes: Tier -> pages recorded with it
+        
+    Returns:
+        Tier name, the cheaper one on a tie since pages escalate from it
+        anyway, or None without votes
+    """
+    counted = [tier for tier in TIERS if votes.get(tier, 0) > 0]
+    if not counted:
+        return None
+    return max(counted, key=lambda tier: (votes[tier], -TIERS.index(tier)))
+
+
+class RenderTierCache:
+    """
+    Redis-backed cache of the render tier that works for a domain or path prefix
+    
+    Lookups go to a short-lived local copy first so a crawl doesn't pay a
+    Redis round trip per page. Redis errors never fail a scrape; the cache
+    just stays cold until Redis is reachable again.
+    """
+    
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        ttl: Optional[int] = None,
+        recheck_rate: Optional[float] = None
+    ):
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = None
+        self.enabled = os.getenv("RENDER_TIER_CACHE", "true").lower() == "true"
+        self.ttl = ttl or int(os.getenv("RENDER_TIER_TTL", "86400"))
+        self.recheck_rate = recheck_rate if recheck_rate is not None else float(
+            os.getenv("RENDER_TIER_RECHECK_RATE", "0.02")
+        )
+        self.local_ttl = 60.0
+        self.local_cache: Dict[str, Tuple[Optional[str], float]] = {}
+        self.retry_after = 0.0
+    
+    async def connect(self):
+        """Connect to Redis"""
+        if not self.redis_client:
+            self.redis_client = await redis.from_url(self.redis_url)
+    
+    async def disconnect(self):
+        """Disconnect from Redis"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+    
+    @staticmethod
+    def votes_key(domain_key: str) -> str:
+        """Redis key counting the tiers recorded for a domain"""
+        return f"{domain_key}:votes"
+    
+    @staticmethod
+    def scope_keys(url: str) -> Tuple[str, str]:
+        """Redis keys for the URL's path prefix and its domain"""
+        parsed = urlparse(url)
+        domain = parsed.netloc.lower()
+        segments = [s for s in parsed.path.split('/') if s]
+        prefix = segments[0] if len(segments) > 1 else ""
+        return (
+            f"render_tier:{domain}:/{prefix}",
+            f"render_tier:{domain}"
+        )
+    
+    async def _redis(self):
+        """Redis client, or None while Redis is unavailable"""
+        if not self.enabled or time.time() < self.retry_after:
+            return None
+        try:
+            await self.connect()
+            return self.redis_client
+        except Exception as e:
+            logger.debug(f"Render tier cache unavailable: {e}")
+            self.retry_after = time.time() + 60
+            return None
+    
+    async def get(self, url: str) -> Optional[str]:
+        """
+        Get the learned tier for a URL
+        
+        Args:
+            url: URL about to be scraped
+            
+        Returns:
+            Tier name, or None if nothing has been learned yet
+        """
+        prefix_key, domain_key = self.scope_keys(url)
+        
+        cached = self.local_cache.get(prefix_key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        
+        tier = None
+        client = await self._redis()
+        if client:
+            try:
+                prefix_tier, domain_tier = await client.mget(prefix_key, domain_key)
+                value = prefix_tier or domain_tier
+                tier = value.decode() if isinstance(value, bytes) else value
+            except Exception as e:
+                logger.debug(f"Render tier lookup failed for {url}: {e}")
+                self.retry_after = time.time() + 60
+        
+        if tier not in TIERS:
+            tier = None
+        
+        self.local_cache[prefix_key] = (tier, time.monotonic() + self.local_ttl)
+        return tier
+    
+    async def record(self, url: str, tier: str):
+        """
+        Store the cheapest tier that produced complete content
+        
+        The path prefix takes the latest tier; the domain takes the tier
+        most of its pages needed, so one odd page doesn't move the rest
+        of the site to another tier.
+        
+        Args:
+            url: Scraped URL
+            tier: Tier that succeeded
+        """
+        prefix_key, domain_key = self.scope_keys(url)
+        
+        cached = self.local_cache.get(prefix_key)
+        if cached and cached[0] == tier and cached[1] > time.monotonic():
+            return
+        self.local_cache[prefix_key] = (tier, time.monotonic() + self.local_ttl)
+        
+        client = await self._redis()
+        if not client:
+            return
+        
+        votes_key = self.votes_key(domain_key)
+        try:
+            pipe = client.pipeline()
+            pipe.setex(prefix_key, self.ttl, tier)
+            pipe.hincrby(votes_key, tier, 1)
+            pipe.expire(votes_key, self.ttl)
+            pipe.hgetall(votes_key)
+            votes = (await pipe.execute())[-1]
+            domain_tier = majority_tier({
+                (key.decode() if isinstance(key, bytes) else key): int(value)
+                for key, value in votes.items()
+            })
+            await client.setex(domain_key, self.ttl, domain_tier or tier)
+            logger.debug(f"Learned render tier {tier} for {prefix_key}, {domain_tier} for {domain_key}")
+        except Exception as e:
+            logger.debug(f"Render tier update failed for {url}: {e}")
+            self.retry_after = time.time() + 60
+    
+    def should_recheck(self, tier: Optional[str]) -> bool:
+        """Whether to sample a cheaper tier for a site that needed a more expensive one"""
+        if tier is None or tier == TIER_HTTP:
+            return False
+        return random.random() < self.recheck_rate
+
+
+# Singleton instance
+_tier_cache = None
+
+def get_render_tier_cache() -> RenderTierCache:
+    """Get singleton render tier cache"""
+    global _tier_cache
+    if _tier_cache is None:
+        _tier_cache = RenderTierCache()
+    return _tier_cache
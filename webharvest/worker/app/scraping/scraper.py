@@ -4,22 +4,203 @@ Main scraper module that orchestrates the scraping process
 
 import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 from datetime import datetime
 import os
+import time
 
 from playwright.async_api import TimeoutError as PlaywrightTimeout
-from app.scraping.browser import BrowserManager, BrowserPool
-from app.scraping.extractor import ContentExtractor
+from app.scraping.boilerplate import BoilerplateModel
+from app.scraping.documents import DOCUMENT_PDF, document_kind, extract_document
+from app.scraping.browser import BrowserPool
+from app.scraping.executor import ExtractionExecutor, get_extraction_executor
+from app.scraping.extraction_memo import ExtractionMemo, get_extraction_memo
+from app.scraping.extractor import ContentExtractor, extract_content
+from app.scraping.fetcher import (
+    HttpFetcher, BrowserFetcher, FetchResult, DocumentTooLarge, CONTENT_ESCALATIONS, needs_browser
+)
+from app.scraping.format_plan import FormatPlan
+from app.scraping.near_duplicates import NearDuplicateIndex
+from app.scraping.preflight import ContentPreflight, SkippedContent
+from app.scraping.render_tiers import (
+    RenderTierCache, get_render_tier_cache, TIERS, TIER_HTTP, TIER_JS
+)
+from app.utils.metrics import boilerplate_extractions, document_extractions, preflight_skipped
+from app.utils.rate_limiter import parse_retry_after
 
 logger = logging.getLogger(__name__)
 
 class WebScraper:
     """Main web scraper class"""
     
-    def __init__(self, browser_pool: Optional[BrowserPool] = None):
+    def __init__(
+        self,
+        browser_pool: Optional[BrowserPool] = None,
+        http_fetcher: Optional[HttpFetcher] = None,
+        tier_cache: Optional[RenderTierCache] = None,
+        extraction_executor: Optional[ExtractionExecutor] = None,
+        extraction_memo: Optional[ExtractionMemo] = None,
+        preflight: Optional[ContentPreflight] = None
+    ):
         self.browser_pool = browser_pool
         self.extractor = ContentExtractor()
+        self.extraction = extraction_executor or get_extraction_executor()
+        self.extraction_memo = extraction_memo or get_extraction_memo()
+        self.http_fetcher = http_fetcher or HttpFetcher()
+        self.preflight = preflight or ContentPreflight(self.http_fetcher)
+        self.browser_fetcher = BrowserFetcher(browser_pool)
+        self.tier_cache = tier_cache or get_render_tier_cache()
+        self.http_first = os.getenv("HTTP_FIRST_FETCH", "true").lower() == "true"
+        self._background_tasks: Set[asyncio.Task] = set()
+    
+    def _needs_browser_upfront(
+        self,
+        formats: List[str],
+        render_js: Optional[bool],
+        wait_for: Optional[int],
+        actions: Optional[List[Dict[str, Any]]],
+        proxy: Optional[Dict[str, str]]
+    ) -> Optional[str]:
+        """Reason this request must go straight to a full JS render, or None"""
+        if render_js:
+            return "requested"
+        if render_js is None and not self.http_first:
+            return "disabled"
+        if actions:
+            return "actions"
+        if "screenshot" in formats:
+            return "screenshot"
+        if wait_for:
+            return "wait_for"
+        if proxy:
+            return "proxy"
+        return None
+    
+    async def _fetch_tier(self, tier: str, url: str, options: Dict[str, Any]) -> FetchResult:
+        """Fetch a URL with one render tier"""
+        if tier == TIER_HTTP:
+            return await self.http_fetcher.fetch(
+                url,
+                headers=options.get("headers"),
+                cookies=options.get("cookies"),
+                mobile=options.get("mobile", False),
+                timeout=options.get("timeout", 30000),
+                preflight=self.preflight
+            )
+        
+        return await self.browser_fetcher.fetch(
+            url,
+            javascript_enabled=(tier == TIER_JS),
+            **options
+        )
+    
+    async def _fetch(
+        self,
+        url: str,
+        render_js: Optional[bool],
+        options: Dict[str, Any]
+    ) -> Tuple[FetchResult, str, Optional[str]]:
+        """
+        Fetch a URL, starting at the cheapest tier known to work for its site
+        
+        Args:
+            url: URL to fetch
+            render_js: True forces a JS render, False never leaves plain HTTP
+            options: Fetch options shared by all tiers
+            
+        Returns:
+            Tuple of fetch result, tier used and escalation reason
+        """
+        escalation = self._needs_browser_upfront(
+            options["formats"],
+            render_js,
+            options.get("wait_for"),
+            options.get("actions"),
+            options.get("proxy")
+        )
+        # PDFs, feeds and other documents never need a browser, whatever the site's pages do
+        is_document = document_kind(None, url) is not None
+        learned = None
+        if not escalation and render_js is None and not is_document:
+            learned = await self.tier_cache.get(url)
+        first_tier = TIER_JS if escalation else learned or TIER_HTTP
+        
+        # Archives, media and huge files are turned away before a browser sees them;
+        # the HTTP tier applies the same policy to its own response headers
+        reason = await self.preflight.check(url, options.get("headers"), probe=first_tier != TIER_HTTP)
+        if reason:
+            raise SkippedContent(url, reason)
+        
+        if escalation:
+            return await self._fetch_tier(TIER_JS, url, options), TIER_JS, escalation
+        
+        last_tier = TIER_HTTP if render_js is False else TIER_JS
+        tiers = TIERS[TIERS.index(first_tier):TIERS.index(last_tier) + 1]
+        
+        fetched = None
+        tier = first_tier
+        # A tier skipped because its fetch failed says nothing about the site's content
+        transport_error = False
+        for tier in tiers:
+            is_last = tier == tiers[-1]
+            try:
+                fetched = await self._fetch_tier(tier, url, options)
+            except (DocumentTooLarge, SkippedContent):
+                raise
+            except Exception as e:
+                if is_last:
+                    raise
+                logger.debug(f"{tier} fetch failed for {url}, escalating: {e}")
+                escalation = f"{tier}_error"
+                transport_error = True
+                continue
+            
+            if is_last:
+                break
+            
+            # Documents are converted directly; a browser would only wrap them in a viewer
+            if fetched.document:
+                break
+            
+            reason = needs_browser(fetched.html, fetched.status_code, fetched.content_type)
+            if reason is None:
+                break
+            escalation = reason
+        
+        # Only a page that loaded, and needed the tier for its content, teaches the site's tier
+        learnable = (
+            not transport_error
+            and 200 <= fetched.status_code < 400
+            and (escalation is None or escalation in CONTENT_ESCALATIONS)
+        )
+        if render_js is None and learnable and not (is_document or fetched.document):
+            await self.tier_cache.record(url, tier)
+            if tier == learned and self.tier_cache.should_recheck(learned):
+                self._schedule_recheck(url, learned, options)
+        
+        return fetched, tier, escalation
+    
+    def _schedule_recheck(self, url: str, learned: str, options: Dict[str, Any]):
+        """Sample cheaper tiers in the background for a site learned as expensive"""
+        task = asyncio.create_task(self._recheck_tier(url, learned, options))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _recheck_tier(self, url: str, learned: str, options: Dict[str, Any]):
+        """Try tiers cheaper than the learned one and remember the first that works"""
+        for tier in TIERS[:TIERS.index(learned)]:
+            try:
+                fetched = await self._fetch_tier(tier, url, options)
+            except Exception as e:
+                logger.debug(f"Render tier recheck failed at {tier} for {url}: {e}")
+                continue
+            
+            if not 200 <= fetched.status_code < 400:
+                return
+            if needs_browser(fetched.html, fetched.status_code, fetched.content_type) is None:
+                logger.info(f"Render tier for {url} lowered from {learned} to {tier}")
+                await self.tier_cache.record(url, tier)
+                return
     
     async def scrape(
         self,
@@ -35,11 +216,22 @@ class WebScraper:
         timeout: int = 30000,
         actions: Optional[List[Dict[str, Any]]] = None,
         block_resources: Optional[List[str]] = None,
-        proxy: Optional[Dict[str, str]] = None
+        proxy: Optional[Dict[str, str]] = None,
+        render_js: Optional[bool] = None,
+        blocking_profile: Optional[str] = None,
+        metadata_fields: Optional[List[str]] = None,
+        boilerplate: Optional[BoilerplateModel] = None,
+        near_duplicates: Optional[NearDuplicateIndex] = None
     ) -> Dict[str, Any]:
         """
         Scrape a web page and extract content in requested formats
         
+        Pages start at the cheapest render tier learned for their site (plain
+        HTTP when nothing is known) and escalate to a browser without
+        JavaScript, then a full render, while the content looks incomplete.
+        PDFs, plain text, JSON and XML feeds fetched over HTTP are converted
+        directly and never reach a browser.
+        
         Args:
             url: URL to scrape
             formats: List of output formats (markdown, html, rawHtml, links, images, screenshot)
@@ -54,61 +246,43 @@ class WebScraper:
             actions: List of browser actions to execute
             block_resources: Resource types to block (image, media, font, etc.)
             proxy: Proxy configuration
-            
+            render_js: True to always render in the browser, False to never
+                escalate from HTTP, None to decide automatically
+            blocking_profile: Browser resource blocking (text-only, layout, full);
+                chosen from the formats when omitted
+            metadata_fields: Metadata fields to extract (all when omitted); an
+                empty list with only rawHtml or screenshot skips extraction
+            boilerplate: Crawl-scoped boilerplate model; main content is
+                extracted with the site's learned template when possible and
+                the page's blocks are added to the model
+            near_duplicates: Crawl-scoped near-duplicate index; the page is
+                looked up and recorded, and metadata nearDuplicateOf names the
+                earlier page it duplicates
+                
         Returns:
             Dictionary with scraped content and metadata
         """
         
-        browser = None
-        context = None
-        page = None
         start_time = datetime.utcnow()
         
         try:
-            # Get browser from pool or create new one
-            if self.browser_pool:
-                browser = await self.browser_pool.acquire()
-            else:
-                browser = BrowserManager()
-                await browser.start()
-            
-            # Create browser context
-            context = await browser.create_context(
-                mobile=mobile,
-                headers=headers,
-                cookies=cookies,
-                proxy=proxy
-            )
-            
-            # Create page
-            page = await browser.create_page(context, block_resources)
-            
-            # Navigate to URL
             logger.info(f"Scraping URL: {url}")
-            response = await page.goto(
-                url,
-                wait_until="networkidle" if not actions else "domcontentloaded",
-                timeout=timeout
-            )
+            fetched, tier, escalation = await self._fetch(url, render_js, {
+                "formats": formats,
+                "headers": headers,
+                "cookies": cookies,
+                "wait_for": wait_for,
+                "mobile": mobile,
+                "timeout": timeout,
+                "actions": actions,
+                "block_resources": block_resources,
+                "proxy": proxy,
+                "blocking_profile": blocking_profile
+            })
             
-            # Get status code
-            status_code = response.status if response else 0
-            
-            # Wait if specified
-            if wait_for:
-                await asyncio.sleep(wait_for / 1000)
-            
-            # Execute actions if provided
-            if actions:
-                await browser.execute_actions(
-                    page,
-                    actions,
-                    max_actions=int(os.getenv("MAX_ACTIONS_PER_REQUEST", "25")),
-                    max_time=int(os.getenv("MAX_ACTION_TIME", "30000"))
-                )
-            
-            # Get page content
-            raw_html = await page.content()
+            raw_html = fetched.html
+            timings = dict(fetched.timings)
+            extraction_started = time.monotonic()
             
             # Initialize result
             result = {
@@ -116,64 +290,128 @@ class WebScraper:
                 "data": {
                     "metadata": {
                         "sourceURL": url,
-                        "statusCode": status_code,
-                        "error": None
+                        "statusCode": fetched.status_code,
+                        "error": None,
+                        "fetchBackend": fetched.backend,
+                        "renderTier": tier,
+                        "escalationReason": escalation
                     }
                 }
             }
+            if fetched.blocking:
+                result["data"]["metadata"]["blocking"] = fetched.blocking
+            # Lets a crawl back off a rate-limited host for as long as it asked
+            retry_after = parse_retry_after(fetched.headers.get("retry-after"))
+            if retry_after is not None:
+                result["data"]["metadata"]["retryAfter"] = retry_after
             
-            # Extract metadata
-            metadata = self.extractor.extract_metadata(raw_html, url)
-            result["data"]["metadata"].update(metadata)
+            # Blocks this crawl has already seen repeated across the site
+            template = None
+            if boilerplate is not None and only_main_content and not fetched.document:
+                template = boilerplate.template(url)
             
-            # Process requested formats
-            processed_html = raw_html
+            # Only the extraction stages the requested outputs need are run
+            plan = FormatPlan(
+                formats, only_main_content, include_tags, exclude_tags,
+                metadata_fields, template is not None, near_duplicates is not None
+            )
             
-            # Apply tag filters if specified
-            if include_tags or exclude_tags:
-                processed_html = self.extractor.filter_by_tags(
+            # Identical HTML with identical options extracts to the same result
+            extracted = None
+            memo = self.extraction_memo.enabled and bool(plan.stages) and not fetched.document
+            if memo:
+                memo_key = self.extraction_memo.key(
+                    raw_html, url, formats, only_main_content, include_tags, exclude_tags, template,
+                    metadata_fields, near_duplicates is not None
+                )
+                extracted = await self.extraction_memo.get(memo_key)
+            result["data"]["metadata"]["extractionCached"] = extracted is not None
+            
+            if fetched.document:
+                # PDF, text, JSON or XML; converted directly instead of through HTML extraction
+                extracted, extraction_timings = await self.extraction.run(
+                    extract_document,
+                    fetched.body,
+                    fetched.document,
+                    url,
+                    formats,
+                    fetched.encoding,
+                    metadata_fields,
+                    near_duplicates is not None
+                )
+                timings.update(extraction_timings)
+                timings["stages"] = extracted.pop("stageTimings")
+                document_extractions.labels(type=fetched.document).inc()
+            elif extracted is None and not plan.stages:
+                extracted = {"metadata": {}}
+            elif extracted is None:
+                # CPU-bound; runs in the extraction pool so other scrapes keep going
+                extracted, extraction_timings = await self.extraction.run(
+                    extract_content,
                     raw_html,
+                    url,
+                    formats,
+                    only_main_content,
                     include_tags,
-                    exclude_tags
+                    exclude_tags,
+                    template,
+                    metadata_fields,
+                    near_duplicates is not None
                 )
+                timings.update(extraction_timings)
+                timings["stages"] = extracted.pop("stageTimings")
+                if memo:
+                    await self.extraction_memo.set(memo_key, extracted)
             
-            # Extract main content if requested
-            if only_main_content:
-                processed_html = self.extractor.extract_main_content(processed_html, url)
-            
-            # Generate requested formats
-            if "rawHtml" in formats:
-                result["data"]["rawHtml"] = raw_html
-            
-            if "html" in formats:
-                result["data"]["html"] = processed_html
+            fingerprints = extracted.pop("blockFingerprints", None)
+            if template is not None:
+                boilerplate.observe(url, fingerprints or [])
+                # Absent when no format needed the main content
+                method = extracted["metadata"].get("contentExtraction")
+                if method:
+                    boilerplate_extractions.labels(method=method).inc()
             
-            if "markdown" in formats:
-                markdown = self.extractor.html_to_markdown(processed_html, url)
-                result["data"]["markdown"] = markdown
-                result["data"]["contentHash"] = self.extractor.calculate_content_hash(markdown)
+            signature = extracted.pop("minhash", None)
+            if near_duplicates is not None:
+                duplicate_of = await near_duplicates.check(url, signature)
+                if duplicate_of:
+                    result["data"]["metadata"]["nearDuplicateOf"] = duplicate_of
             
-            if "links" in formats:
-                result["data"]["links"] = self.extractor.extract_links(raw_html, url)
+            result["data"]["metadata"].update(extracted.pop("metadata"))
+            result["data"].update(extracted)
             
-            if "images" in formats:
-                result["data"]["images"] = self.extractor.extract_images(raw_html, url)
+            # A PDF has no markup to return
+            if "rawHtml" in formats and fetched.document != DOCUMENT_PDF:
+                result["data"]["rawHtml"] = raw_html
             
-            if "screenshot" in formats:
-                screenshot_dir = "/app/screenshots"
-                os.makedirs(screenshot_dir, exist_ok=True)
-                screenshot_path = f"{screenshot_dir}/{datetime.utcnow().timestamp()}.png"
-                await page.screenshot(path=screenshot_path, full_page=True)
-                result["data"]["screenshot"] = screenshot_path
-                logger.info(f"Screenshot saved: {screenshot_path}")
+            if "screenshot" in formats and fetched.screenshot:
+                result["data"]["screenshot"] = fetched.screenshot
             
             # Calculate processing time
+            timings["extraction"] = round((time.monotonic() - extraction_started) * 1000)
             processing_time = (datetime.utcnow() - start_time).total_seconds()
             result["data"]["metadata"]["processingTime"] = f"{processing_time:.2f}s"
+            result["data"]["metadata"]["timings"] = timings
             
-            logger.info(f"Successfully scraped {url} in {processing_time:.2f}s")
+            logger.info(f"Successfully scraped {url} via {fetched.backend} in {processing_time:.2f}s")
             return result
-            
+        
+        except SkippedContent as e:
+            preflight_skipped.labels(reason=e.reason).inc()
+            logger.info(str(e))
+            return {
+                "success": False,
+                "error": str(e),
+                "data": {
+                    "metadata": {
+                        "sourceURL": url,
+                        "statusCode": 0,
+                        "error": str(e),
+                        "skipped": e.reason
+                    }
+                }
+            }
+        
         except PlaywrightTimeout:
             logger.error(f"Timeout while scraping {url}")
             return {
@@ -187,7 +425,7 @@ class WebScraper:
                     }
                 }
             }
-            
+        
         except Exception as e:
             logger.error(f"Error scraping {url}: {str(e)}", exc_info=True)
             return {
@@ -201,19 +439,10 @@ class WebScraper:
                     }
                 }
             }
-            
-        finally:
-            # Cleanup
-            if page:
-                await page.close()
-            if context:
-                await context.close()
-            
-            # Return browser to pool or stop it
-            if self.browser_pool and browser:
-                await self.browser_pool.release(browser)
-            elif browser and not self.browser_pool:
-                await browser.stop()
+    
+    async def close(self):
+        """Release the HTTP client held by the fast path"""
+        await self.http_fetcher.stop()
 
 
 class ScraperPool:
@@ -221,7 +450,9 @@ class ScraperPool:
     
     def __init__(self, size: int = 5):
         self.browser_pool = BrowserPool(size=size)
-        self.semaphore = asyncio.Semaphore(size)
+        self.http_fetcher = HttpFetcher()
+        self.preflight = ContentPreflight(self.http_fetcher)
+        self.semaphore = asyncio.Semaphore(self.browser_pool.slots_total)
     
     async def __aenter__(self):
         await self.browser_pool.start()
@@ -229,11 +460,12 @@ class ScraperPool:
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.browser_pool.stop()
+        await self.http_fetcher.stop()
     
     async def scrape(self, **kwargs) -> Dict[str, Any]:
         """Scrape with concurrency control"""
         async with self.semaphore:
-            scraper = WebScraper(self.browser_pool)
+            scraper = WebScraper(self.browser_pool, self.http_fetcher, preflight=self.preflight)
             return await scraper.scrape(**kwargs)
     
     async def scrape_batch(
@@ -0,0 +1,145 @@
+"""
+Compact crawl URL state
+Seen/visited flags and link depth for every URL a crawl has found, in 9 bytes per table slot
+"""
+
+import hashlib
+from array import array
+from typing import Optional
+
+# Depths above this are stored as this; crawls never go that deep
+MAX_DEPTH = 127
+
+_VISITED = 0x80
+_DEPTH_MASK = 0x7F
+_EMPTY = 0
+
+# Grow when more than this share of slots is in use
+_MAX_LOAD = 0.7
+
+
+def fingerprint(url: str) -> int:
+    """
+    64-bit fingerprint of a normalized URL
+    
+    Two different URLs share a fingerprint with probability about
+    n^2 / 2^65 for n URLs: roughly one in ten million for a 2M-URL crawl.
+    """
+    value = int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+    # 0 marks an empty slot
+    return value or 1
+
+
+class UrlStateStore:
+    """
+    Set of URL fingerprints with a packed depth and visited flag per URL
+    
+    An open-addressing hash table over two flat arrays: 8-byte fingerprints
+    and one byte holding depth (7 bits) and the visited flag. Replaces a
+    set of visited URL strings plus a dict of URL -> depth, which hold every
+    URL twice at well over 100 bytes each. URLs themselves aren't kept, so
+    the store can't be iterated.
+    """
+    
+    def __init__(self, capacity: int = 1024):
+        """
+        Set up an empty store
+        
+        Args:
+            capacity: Initial slots, rounded up to a power of two; the table doubles as it fills
+        """
+        size = 16
+        while size < capacity:
+            size *= 2
+        self._allocate(size)
+        self.count = 0
+        self.visited_count = 0
+    
+    def _allocate(self, size: int):
+        self.mask = size - 1
+        self.keys = array("Q", bytes(8 * size))
+        self.states = bytearray(size)
+    
+    def _slot(self, key: int) -> int:
+        """Slot holding key, or the empty slot where it would go (linear probing)"""
+        keys = self.keys
+        mask = self.mask
+        slot = key & mask
+        while True:
+            current = keys[slot]
+            if current == key or current == _EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+    
+    def _grow(self):
+        keys, states = self.keys, self.states
+        self._allocate(len(keys) * 2)
+        for key, state in zip(keys, states):
+            if key != _EMPTY:
+                slot = self._slot(key)
+                self.keys[slot] = key
+                self.states[slot] = state
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __contains__(self, url: str) -> bool:
+        return self.keys[self._slot(fingerprint(url))] != _EMPTY
+    
+    def add(self, url: str, depth: int) -> bool:
+        """
+        Record a URL as seen at a link depth
+        
+        Args:
+            url: Normalized URL
+            depth: Link hops from the seed
+            
+        Returns:
+            Whether the URL is new; a known URL keeps its first depth
+        """
+        key = fingerprint(url)
+        slot = self._slot(key)
+        if self.keys[slot] != _EMPTY:
+            return False
+        self._insert(slot, key, min(max(depth, 0), MAX_DEPTH))
+        return True
+    
+    def _insert(self, slot: int, key: int, state: int):
+        self.keys[slot] = key
+        self.states[slot] = state
+        self.count += 1
+        if self.count > len(self.keys) * _MAX_LOAD:
+            self._grow()
+    
+    def depth(self, url: str, default: Optional[int] = None) -> Optional[int]:
+        """Link depth a URL was first seen at, or default if it's unknown"""
+        slot = self._slot(fingerprint(url))
+        if self.keys[slot] == _EMPTY:
+            return default
+        return self.states[slot] & _DEPTH_MASK
+    
+    def is_visited(self, url: str) -> bool:
+        """Whether a URL has been handed out for crawling"""
+        slot = self._slot(fingerprint(url))
+        return self.keys[slot] != _EMPTY and bool(self.states[slot] & _VISITED)
+    
+    def mark_visited(self, url: str, depth: int = 0):
+        """
+        Flag a URL as crawled, adding it at depth if it wasn't seen yet
+        
+        Args:
+            url: Normalized URL
+            depth: Depth for a URL not seen before
+        """
+        key = fingerprint(url)
+        slot = self._slot(key)
+        if self.keys[slot] == _EMPTY:
+            self._insert(slot, key, min(max(depth, 0), MAX_DEPTH) | _VISITED)
+            self.visited_count += 1
+        elif not self.states[slot] & _VISITED:
+            self.states[slot] |= _VISITED
+            self.visited_count += 1
+    
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the table"""
+        return self.keys.buffer_info()[1] * self.keys.itemsize + len(self.states)
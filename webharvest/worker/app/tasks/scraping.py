@@ -3,29 +3,35 @@ Celery tasks for web scraping operations
 """
 
 import asyncio
+import os
 import logging
-from typing import Dict, Any, List, Optional
+import time
+from typing import Awaitable, Callable, Dict, Any, List, Optional
 from datetime import datetime
 import json
 
 from celery import Task
 from app.main import app
+from app.scraping.boilerplate import BoilerplateModel
 from app.scraping.scraper import WebScraper
 from app.scraping.crawler import WebCrawler, URLNormalizer
+from app.scraping.crawl_engine import CrawlEngine
+from app.scraping.distributed_crawl import DistributedCrawler
 from app.scraping.extractor import ContentExtractor
+from app.scraping.near_duplicates import NearDuplicateIndex
 from app.utils.database import get_db_session, update_crawl_job, update_crawl_page, update_batch_job
+from app.utils.runtime import run_async, get_scraper
+from app.utils.metrics import near_duplicate_pages
 
 logger = logging.getLogger(__name__)
 
 class ScrapingTask(Task):
     """Base class for scraping tasks with shared resources"""
-    _scraper = None
     
     @property
-    def scraper(self):
-        if self._scraper is None:
-            self._scraper = WebScraper()
-        return self._scraper
+    def scraper(self) -> WebScraper:
+        # Process-wide scraper on the warm browser pool
+        return get_scraper()
 
 
 @app.task(base=ScrapingTask, bind=True, name='scraping.scrape_url')
@@ -41,6 +47,9 @@ def scrape_url_task(
     mobile: bool = False,
     timeout: int = 30000,
     actions: Optional[List[Dict[str, Any]]] = None,
+    render_js: Optional[bool] = None,
+    blocking_profile: Optional[str] = None,
+    metadata_fields: Optional[List[str]] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
@@ -57,18 +66,18 @@ def scrape_url_task(
         mobile: Use mobile viewport
         timeout: Page load timeout
         actions: Browser actions to execute
+        render_js: Force (True) or skip (False) browser rendering, None for auto
+        blocking_profile: Resource blocking profile (text-only, layout, full)
+        metadata_fields: Metadata fields to extract (all when omitted)
         
     Returns:
         Scraping result dictionary
     """
     logger.info(f"Starting scrape task for {url}")
     
-    # Run async scraper in sync context
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
     try:
-        result = loop.run_until_complete(
+        # Run on the process event loop, where the browser pool lives
+        result = run_async(
             self.scraper.scrape(
                 url=url,
                 formats=formats,
@@ -79,7 +88,10 @@ def scrape_url_task(
                 wait_for=wait_for,
                 mobile=mobile,
                 timeout=timeout,
-                actions=actions
+                actions=actions,
+                render_js=render_js,
+                blocking_profile=blocking_profile,
+                metadata_fields=metadata_fields
             )
         )
         
@@ -93,8 +105,159 @@ def scrape_url_task(
             "error": str(e),
             "url": url
         }
+
+
+def _store_job_progress(crawl_job_id: str, updates: Dict[str, Any]):
+    """Write crawl job fields; blocks, so the crawl runs it in a thread"""
+    with get_db_session() as db:
+        update_crawl_job(db, crawl_job_id, updates)
+
+
+def _store_crawl_page(page: Dict[str, Any]):
+    """Insert a crawled page; blocks, so the crawl runs it in a thread"""
+    with get_db_session() as db:
+        update_crawl_page(db, page)
+
+
+def _crawl_pages(
+    crawl_job_id: str,
+    crawler: WebCrawler,
+    scrape_options: Optional[Dict[str, Any]],
+    max_concurrency: int,
+    project_id: Optional[str],
+    count: Callable[[str], Awaitable[int]]
+):
+    """
+    Scrape and store a crawl's pages, up to max_concurrency at once
+    
+    Args:
+        crawl_job_id: Database job ID
+        crawler: Frontier, filters and limits of the crawl
+        scrape_options: Options for each page scrape
+        max_concurrency: Maximum pages scraped at once
+        project_id: Project the crawl belongs to
+        count: Coroutine that adds one to a counter (discovered, completed,
+            failed) and returns the crawl's new total
+    """
+    scraper = get_scraper()
+    scrape_options = scrape_options or {"formats": ["markdown"]}
+    
+    # Site templates learned from this crawl's pages replace most readability passes
+    boilerplate = None
+    if os.getenv("CRAWL_BOILERPLATE_TEMPLATES", "true").lower() == "true":
+        boilerplate = BoilerplateModel()
+    
+    # Near-duplicate pages are stored without content ("mark") or not at all
+    # ("skip"), and their links are not followed
+    near_duplicate_action = os.getenv("NEAR_DUPLICATE_ACTION", "mark").lower()
+    near_duplicates = None
+    if near_duplicate_action in ("mark", "skip"):
+        near_duplicates = NearDuplicateIndex(project_id=project_id)
+    
+    # Database writes run in threads so the loop keeps serving the other
+    # pages; the job's counters are written at most every progress_interval
+    # seconds, and in full when the crawl completes
+    progress_interval = float(os.getenv("CRAWL_PROGRESS_INTERVAL", "2"))
+    progress: Dict[str, int] = {}
+    last_progress = 0.0
+    
+    async def flush_progress():
+        updates = dict(progress)
+        progress.clear()
+        if updates:
+            await asyncio.to_thread(_store_job_progress, crawl_job_id, updates)
+    
+    async def report(field: str):
+        nonlocal last_progress
+        column = "total_discovered" if field == "discovered" else field
+        progress[column] = await count(field)
+        if time.monotonic() - last_progress >= progress_interval:
+            last_progress = time.monotonic()
+            await flush_progress()
+    
+    async def crawl_page(url: str) -> Optional[List[str]]:
+        """Scrape and store one page; returns the links to follow"""
+        # Update progress
+        await report("discovered")
+        
+        # Scrape the URL
+        links = None
+        outcome = None
+        try:
+            result = await scraper.scrape(
+                url=url, boilerplate=boilerplate, near_duplicates=near_duplicates, **scrape_options
+            )
+            # Rate-limited or failing hosts are backed off; the rest of the crawl goes on
+            metadata = result["data"]["metadata"]
+            crawler.frontier.record_response(url, metadata.get("statusCode", 0), metadata.get("retryAfter"))
+            
+            if result.get("success"):
+                outcome = "completed"
+                duplicate_of = result["data"]["metadata"].get("nearDuplicateOf")
+                if duplicate_of:
+                    near_duplicate_pages.labels(action=near_duplicate_action).inc()
+                    logger.info(f"{url} is a near-duplicate of {duplicate_of}")
+                else:
+                    # A near-duplicate's links were already followed from the page it duplicates
+                    links = result["data"].get("links")
+                
+                # Save page result; a marked near-duplicate keeps only its metadata
+                if not duplicate_of or near_duplicate_action == "mark":
+                    await asyncio.to_thread(_store_crawl_page, {
+                        "crawl_job_id": crawl_job_id,
+                        "url": url,
+                        "normalized_url": URLNormalizer.normalize(url),
+                        "status_code": result["data"]["metadata"].get("statusCode", 0),
+                        "markdown": None if duplicate_of else result["data"].get("markdown"),
+                        "html": None if duplicate_of else result["data"].get("html"),
+                        "metadata": result["data"].get("metadata", {}),
+                        "content_hash": result["data"].get("contentHash")
+                    })
+            elif result["data"]["metadata"].get("skipped"):
+                # Archives, media and oversized files linked from the site aren't failures
+                logger.info(f"Skipped {url}: {result['data']['metadata']['skipped']}")
+            else:
+                outcome = "failed"
+                logger.error(f"Failed to scrape {url}: {result.get('error')}")
+        
+        except Exception as e:
+            outcome = "failed"
+            logger.error(f"Error scraping {url}: {e}", exc_info=True)
+        
+        # Update progress
+        if outcome:
+            await report(outcome)
+        
+        return links
+    
+    # Up to max_concurrency pages in flight, delay_ms apart per host
+    engine = CrawlEngine(crawler, crawl_page, concurrency=max_concurrency)
+    
+    async def crawl():
+        try:
+            await engine.run()
+        finally:
+            await flush_progress()
+    
+    # Run the crawl
+    try:
+        run_async(crawl())
     finally:
-        loop.close()
+        crawler.close()
+        if near_duplicates is not None:
+            run_async(near_duplicates.disconnect())
+
+
+def _complete_crawl_job(crawl_job_id: str, totals: Dict[str, int]):
+    """Mark a crawl job completed with its final counters"""
+    with get_db_session() as db:
+        update_crawl_job(db, crawl_job_id, {
+            "status": "completed",
+            "finished_at": datetime.utcnow(),
+            "total_discovered": totals.get("discovered", 0),
+            "completed": totals.get("completed", 0),
+            "failed": totals.get("failed", 0)
+        })
 
 
 @app.task(bind=True, name='scraping.crawl_website')
@@ -112,6 +275,9 @@ def crawl_website_task(
     scrape_options: Optional[Dict[str, Any]] = None,
     delay_ms: int = 250,
     max_concurrency: int = 5,
+    priority_paths: Optional[Dict[str, float]] = None,
+    workers: int = 1,
+    project_id: Optional[str] = None,
     **kwargs
 ) -> Dict[str, Any]:
     """
@@ -128,30 +294,44 @@ def crawl_website_task(
         allow_subdomains: Allow subdomains
         ignore_query_params: Ignore query parameters
         scrape_options: Options for each page scrape
-        delay_ms: Delay between requests
-        max_concurrency: Maximum concurrent requests
+        delay_ms: Minimum delay between requests to the same host
+        max_concurrency: Maximum pages scraped at once
+        priority_paths: Path regex -> weight added to the crawl priority of matching URLs
+        workers: Shard tasks to spread the crawl over, at most CRAWL_MAX_WORKERS;
+            above 1, the frontier is kept in Redis and shared with crawl_shard tasks on any worker
+        project_id: Project the crawl belongs to; near-duplicates of pages
+            from the project's earlier crawls are detected too
         
     Returns:
         Crawl result summary
     """
     logger.info(f"Starting crawl task for {seed_url} (job: {crawl_job_id})")
     
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    crawler = WebCrawler(
-        seed_url=seed_url,
-        max_depth=max_depth,
-        max_pages=max_pages,
-        include_patterns=include_paths,
-        exclude_patterns=exclude_paths,
-        allow_external_links=allow_external_links,
-        allow_subdomains=allow_subdomains,
-        ignore_query_params=ignore_query_params
-    )
+    crawler_options = {
+        "seed_url": seed_url,
+        "max_depth": max_depth,
+        "max_pages": max_pages,
+        "include_patterns": include_paths,
+        "exclude_patterns": exclude_paths,
+        "allow_external_links": allow_external_links,
+        "allow_subdomains": allow_subdomains,
+        "ignore_query_params": ignore_query_params,
+        "delay_ms": delay_ms,
+        "priority_paths": priority_paths
+    }
     
-    scraper = WebScraper()
-    scrape_options = scrape_options or {"formats": ["markdown"]}
+    workers = max(1, min(workers, int(os.getenv("CRAWL_MAX_WORKERS", "32"))))
+    if workers > 1:
+        # This task is shard 0 and seeds the shared frontier
+        crawler = DistributedCrawler(crawl_job_id, "0", seed=True, **crawler_options)
+        count = crawler.frontier.count
+    else:
+        crawler = WebCrawler(**crawler_options)
+        totals = {"discovered": 0, "completed": 0, "failed": 0}
+        
+        async def count(field: str) -> int:
+            totals[field] += 1
+            return totals[field]
     
     # Update job status to scraping
     with get_db_session() as db:
@@ -160,89 +340,49 @@ def crawl_website_task(
             "started_at": datetime.utcnow()
         })
     
-    completed = 0
-    failed = 0
-    discovered = 0
-    
     try:
-        # Discover and scrape URLs
-        async def crawl():
-            nonlocal completed, failed, discovered
-            
-            async for url in crawler.discover_urls():
-                discovered += 1
-                
-                # Update progress
-                with get_db_session() as db:
-                    update_crawl_job(db, crawl_job_id, {
-                        "total_discovered": discovered
+        if workers > 1:
+            try:
+                # The other shards are registered up front and find the seed queued when they start
+                shards = [str(shard) for shard in range(1, workers)]
+                run_async(crawler.start(shards))
+                for shard in shards:
+                    crawl_shard_task.apply_async(kwargs={
+                        "crawl_job_id": crawl_job_id,
+                        "shard": shard,
+                        "crawler_options": crawler_options,
+                        "scrape_options": scrape_options,
+                        "max_concurrency": max_concurrency,
+                        "project_id": project_id
                     })
                 
-                # Scrape the URL
-                try:
-                    result = await scraper.scrape(url=url, **scrape_options)
-                    
-                    if result.get("success"):
-                        completed += 1
-                        
-                        # Save page result
-                        with get_db_session() as db:
-                            update_crawl_page(db, {
-                                "crawl_job_id": crawl_job_id,
-                                "url": url,
-                                "normalized_url": URLNormalizer.normalize(url),
-                                "status_code": result["data"]["metadata"].get("statusCode", 0),
-                                "markdown": result["data"].get("markdown"),
-                                "html": result["data"].get("html"),
-                                "metadata": result["data"].get("metadata", {}),
-                                "content_hash": result["data"].get("contentHash")
-                            })
-                    else:
-                        failed += 1
-                        logger.error(f"Failed to scrape {url}: {result.get('error')}")
-                    
-                except Exception as e:
-                    failed += 1
-                    logger.error(f"Error scraping {url}: {e}", exc_info=True)
-                
-                # Update progress
-                with get_db_session() as db:
-                    update_crawl_job(db, crawl_job_id, {
-                        "completed": completed,
-                        "failed": failed
-                    })
-                
-                # Add delay between requests
-                await asyncio.sleep(delay_ms / 1000.0)
-                
-                # Extract links from scraped page for crawling
-                if result.get("success") and result["data"].get("links"):
-                    crawler.add_discovered_urls(
-                        result["data"]["links"],
-                        crawler.depth_map.get(url, 0)
-                    )
-        
-        # Run the crawl
-        loop.run_until_complete(crawl())
+                _crawl_pages(crawl_job_id, crawler, scrape_options, max_concurrency, project_id, count)
+            finally:
+                # The last shard to finish completes the job
+                totals = run_async(crawler.finish())
+            if totals is None:
+                logger.info(f"Shard 0 of crawl {crawl_job_id} done; other shards still running")
+                return {"success": True, "crawl_job_id": crawl_job_id, "workers": workers}
+        else:
+            _crawl_pages(crawl_job_id, crawler, scrape_options, max_concurrency, project_id, count)
         
         # Update job as completed
-        with get_db_session() as db:
-            update_crawl_job(db, crawl_job_id, {
-                "status": "completed",
-                "finished_at": datetime.utcnow(),
-                "total_discovered": discovered,
-                "completed": completed,
-                "failed": failed
-            })
+        _complete_crawl_job(crawl_job_id, totals)
         
-        logger.info(f"Crawl completed for {seed_url}: {completed} pages scraped, {failed} failed")
+        if workers > 1:
+            logger.info(f"Crawl completed for {seed_url}: {totals.get('completed', 0)} pages scraped, {totals.get('failed', 0)} failed")
+        else:
+            logger.info(
+                f"Crawl completed for {seed_url}: {totals['completed']} pages scraped, {totals['failed']} failed, "
+                f"{len(crawler.urls)} URLs seen in {crawler.urls.memory_bytes() // 1024}KB"
+            )
         
         return {
             "success": True,
             "crawl_job_id": crawl_job_id,
-            "discovered": discovered,
-            "completed": completed,
-            "failed": failed
+            "discovered": totals.get("discovered", 0),
+            "completed": totals.get("completed", 0),
+            "failed": totals.get("failed", 0)
         }
         
     except Exception as e:
@@ -261,9 +401,68 @@ def crawl_website_task(
             "error": str(e),
             "crawl_job_id": crawl_job_id
         }
+
+
+@app.task(bind=True, name='scraping.crawl_shard')
+def crawl_shard_task(
+    self,
+    crawl_job_id: str,
+    shard: str,
+    crawler_options: Dict[str, Any],
+    scrape_options: Optional[Dict[str, Any]] = None,
+    max_concurrency: int = 5,
+    project_id: Optional[str] = None,
+    **kwargs
+) -> Dict[str, Any]:
+    """
+    Crawl pages of a distributed crawl alongside its other shards
     
+    Args:
+        crawl_job_id: Database job ID
+        shard: Name of this shard, unique within the crawl
+        crawler_options: WebCrawler options of the crawl
+        scrape_options: Options for each page scrape
+        max_concurrency: Maximum pages scraped at once by this shard
+        project_id: Project the crawl belongs to
+        
+    Returns:
+        Shard result summary
+    """
+    logger.info(f"Starting shard {shard} of crawl {crawl_job_id}")
+    
+    crawler = DistributedCrawler(crawl_job_id, shard, **crawler_options)
+    try:
+        run_async(crawler.start())
+    except Exception as e:
+        logger.error(f"Shard {shard} of crawl {crawl_job_id} could not join the crawl: {e}", exc_info=True)
+        run_async(crawler.finish())
+        with get_db_session() as db:
+            update_crawl_job(db, crawl_job_id, {
+                "status": "failed",
+                "finished_at": datetime.utcnow(),
+                "error": str(e)
+            })
+        return {"success": False, "error": str(e), "crawl_job_id": crawl_job_id, "shard": shard}
+    
+    if crawler.finished:
+        # Started after the other shards had finished the crawl
+        run_async(crawler.finish())
+        return {"success": True, "crawl_job_id": crawl_job_id, "shard": shard, "pages": 0}
+    
+    totals = None
+    try:
+        _crawl_pages(crawl_job_id, crawler, scrape_options, max_concurrency, project_id, crawler.frontier.count)
+    except Exception as e:
+        logger.error(f"Error in shard {shard} of crawl {crawl_job_id}: {e}", exc_info=True)
     finally:
-        loop.close()
+        # The last shard to finish completes the job
+        totals = run_async(crawler.finish())
+    
+    if totals is not None:
+        _complete_crawl_job(crawl_job_id, totals)
+        logger.info(f"Crawl {crawl_job_id} completed: {totals.get('completed', 0)} pages scraped, {totals.get('failed', 0)} failed")
+    
+    return {"success": True, "crawl_job_id": crawl_job_id, "shard": shard, "pages": crawler.discovered_count}
 
 
 @app.task(bind=True, name='scraping.batch_scrape')
@@ -298,10 +497,7 @@ def batch_scrape_task(
             "started_at": datetime.utcnow()
         })
     
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    scraper = WebScraper()
+    scraper = get_scraper()
     scrape_options = scrape_options or {"formats": ["markdown"]}
     
     completed = 0
@@ -362,7 +558,7 @@ def batch_scrape_task(
                         })
         
         # Run batch scrape
-        loop.run_until_complete(batch_scrape())
+        run_async(batch_scrape())
         
         # Update job as completed
         with get_db_session() as db:
@@ -399,7 +595,4 @@ def batch_scrape_task(
             "success": False,
             "error": str(e),
             "batch_job_id": batch_job_id
-        }
-    
-    finally:
-        loop.close()
\ No newline at end of file
+        }
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""
+Prometheus metrics for the worker
+Set PROMETHEUS_MULTIPROC_DIR to aggregate metrics across prefork worker processes
+"""
+
+import os
+import logging
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess, start_http_server
+)
+
+logger = logging.getLogger(__name__)
+
+# prometheus_client writes per-process files here, so it must exist before any metric is created
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# Subresource cache
+asset_cache_requests = Counter(
+    'webharvest_asset_cache_requests_total',
+    'Subresource cache lookups',
+    ['result']
+)
+
+asset_cache_served_bytes = Counter(
+    'webharvest_asset_cache_served_bytes_total',
+    'Bytes served from the subresource cache instead of the network'
+)
+
+asset_cache_size_bytes = Gauge(
+    'webharvest_asset_cache_size_bytes',
+    'Bytes stored in the subresource cache',
+    multiprocess_mode='max'
+)
+
+# Extraction executor
+extraction_queue_seconds = Histogram(
+    'webharvest_extraction_queue_seconds',
+    'Time extraction jobs wait for a free extraction worker',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+extraction_cpu_seconds = Histogram(
+    'webharvest_extraction_cpu_seconds',
+    'CPU time spent extracting one page',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+extraction_pending = Gauge(
+    'webharvest_extraction_pending',
+    'Extraction jobs queued or running',
+    multiprocess_mode='livesum'
+)
+
+# Extraction memo
+extraction_memo_requests = Counter(
+    'webharvest_extraction_memo_requests_total',
+    'Extraction memo lookups',
+    ['result']
+)
+
+extraction_memo_size_bytes = Gauge(
+    'webharvest_extraction_memo_size_bytes',
+    'Compressed bytes held in the local extraction memo',
+    multiprocess_mode='livesum'
+)
+
+# Crawl boilerplate templates
+boilerplate_extractions = Counter(
+    'webharvest_boilerplate_extractions_total',
+    'Crawled pages by main content method (template or readability)',
+    ['method']
+)
+
+# Near-duplicate detection
+near_duplicate_pages = Counter(
+    'webharvest_near_duplicate_pages_total',
+    'Crawled pages found to be near-duplicates of an earlier page, by action taken (mark or skip)',
+    ['action']
+)
+
+document_extractions = Counter(
+    'webharvest_document_extractions_total',
+    'Non-HTML documents converted without a browser, by type (pdf, text, json, xml)',
+    ['type']
+)
+
+preflight_skipped = Counter(
+    'webharvest_preflight_skipped_total',
+    'URLs skipped by content-type preflight, by reason (extension, content_type, too_large)',
+    ['reason']
+)
+
+
+def start_metrics_server(port: int = None):
+    """
+    Expose worker metrics over HTTP
+    
+    Args:
+        port: Port to listen on (defaults to WORKER_METRICS_PORT)
+    """
+    port = port or int(os.getenv("WORKER_METRICS_PORT", "9091"))
+    
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    
+    try:
+        start_http_server(port, registry=registry)
+        logger.info(f"Worker metrics listening on :{port}")
+    except OSError as e:
+        logger.warning(f"Could not start metrics server on :{port}: {e}")
+
+
+def mark_process_dead(pid: int):
+    """Drop a finished worker process from multiprocess metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
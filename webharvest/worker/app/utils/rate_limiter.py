@@ -6,6 +6,8 @@ Implements per-domain rate limiting with exponential backoff
 import asyncio
 import time
 import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Optional, Dict, Any
 from urllib.parse import urlparse
 import redis.asyncio as redis
@@ -13,6 +15,53 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# Backoff rules shared by DomainRateLimiter and the crawl frontiers
+BACKOFF_STATUS_CODES = {429, 503}
+GATEWAY_STATUS_CODES = {502, 504}
+BACKOFF_MULTIPLIER = 2.0
+MAX_BACKOFF_MS = 300000  # 5 minutes
+GATEWAY_BACKOFF_MS = 5000
+
+
+def backoff_for(status_code: int, previous_ms: float = 0.0, retry_after: Optional[int] = None) -> Optional[float]:
+    """
+    Backoff before a host's next request after one of its responses
+    
+    Args:
+        status_code: HTTP status code (0 when the fetch failed outright)
+        previous_ms: The host's current backoff
+        retry_after: Retry-After header value in seconds
+        
+    Returns:
+        Backoff in ms, 0 when the response clears the backoff, or None when
+        it leaves the backoff as it is
+    """
+    if status_code in BACKOFF_STATUS_CODES:
+        if retry_after:
+            return retry_after * 1000
+        return min((previous_ms + 1000) * BACKOFF_MULTIPLIER, MAX_BACKOFF_MS)
+    if status_code in GATEWAY_STATUS_CODES:
+        return GATEWAY_BACKOFF_MS
+    if 0 < status_code < 400:
+        return 0
+    return None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[int]:
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0, round((retry_at - datetime.now(timezone.utc)).total_seconds()))
+
 class RateLimitToken:
     """Token representing acquired rate limit permission"""
     
@@ -41,8 +90,6 @@ class DomainRateLimiter:
         self.redis_client = None
         self.default_max_concurrent = int(os.getenv("DEFAULT_RATE_LIMIT_PER_DOMAIN", "2"))
         self.default_delay_ms = int(os.getenv("DEFAULT_DELAY_MS", "500"))
-        self.backoff_multiplier = 2.0
-        self.max_backoff_ms = 300000  # 5 minutes
         self.retry_after_cache: Dict[str, float] = {}
     
     async def connect(self):
@@ -154,31 +201,19 @@ class DomainRateLimiter:
         backoff_key = f"rate_limit:{domain}:backoff"
         
         # Check if this is a rate limit error
-        if status_code in [429, 503]:
-            # Use Retry-After if provided
-            if retry_after:
-                backoff_ms = retry_after * 1000
-                logger.info(f"Rate limited on {domain}, Retry-After: {retry_after}s")
-            else:
-                # Calculate exponential backoff
-                current_backoff = await self.redis_client.get(backoff_key)
-                current_backoff_ms = int(current_backoff) if current_backoff else 0
-                
-                # Exponential backoff with jitter
-                new_backoff_ms = min(
-                    (current_backoff_ms + 1000) * self.backoff_multiplier,
-                    self.max_backoff_ms
-                )
-                backoff_ms = new_backoff_ms
-                logger.warning(f"Rate limited on {domain}, backoff: {backoff_ms}ms")
+        if status_code in BACKOFF_STATUS_CODES:
+            current_backoff = None if retry_after else await self.redis_client.get(backoff_key)
+            backoff_ms = backoff_for(status_code, int(current_backoff) if current_backoff else 0, retry_after)
+            logger.warning(f"Rate limited on {domain}, backoff: {backoff_ms}ms")
             
             # Set backoff
             await self.redis_client.setex(backoff_key, 3600, int(backoff_ms))
-            
-        elif status_code in [502, 504]:
+        
+        elif status_code in GATEWAY_STATUS_CODES:
             # Gateway errors - apply moderate backoff
-            await self.redis_client.setex(backoff_key, 300, 5000)  # 5 second backoff
-            logger.warning(f"Gateway error on {domain}, applying 5s backoff")
+            backoff_ms = backoff_for(status_code)
+            await self.redis_client.setex(backoff_key, 300, int(backoff_ms))
+            logger.warning(f"Gateway error on {domain}, applying {backoff_ms / 1000:.0f}s backoff")
     
     async def reset_backoff(self, url: str):
         """Reset backoff for a domain after successful request"""
@@ -0,0 +1,121 @@
+"""
+Per-process runtime for Celery tasks
+Keeps one event loop and a warm browser pool alive for the life of a worker process
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Optional
+
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+
+from app.scraping.browser import BrowserPool
+from app.scraping.executor import get_extraction_executor
+from app.scraping.fetcher import HttpFetcher
+from app.scraping.scraper import WebScraper
+from app.utils.metrics import mark_process_dead, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# Process-wide resources, created lazily or on worker_process_init
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_browser_pool: Optional[BrowserPool] = None
+_http_fetcher: Optional[HttpFetcher] = None
+_scraper: Optional[WebScraper] = None
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get the long-lived event loop of this process"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def run_async(coro: Awaitable[Any]) -> Any:
+    """
+    Run a coroutine to completion on the process event loop
+    
+    Browsers, contexts and HTTP connections are bound to this loop, so every
+    task must go through here instead of creating its own loop.
+    """
+    return get_event_loop().run_until_complete(coro)
+
+
+def get_browser_pool() -> BrowserPool:
+    """Get the process browser pool"""
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool(size=int(os.getenv("BROWSER_POOL_SIZE", "2")))
+    return _browser_pool
+
+
+def get_http_fetcher() -> HttpFetcher:
+    """Get the process HTTP client"""
+    global _http_fetcher
+    if _http_fetcher is None:
+        _http_fetcher = HttpFetcher()
+    return _http_fetcher
+
+
+def get_scraper() -> WebScraper:
+    """Get the process scraper, backed by the shared browser pool"""
+    global _scraper
+    if _scraper is None:
+        _scraper = WebScraper(get_browser_pool(), get_http_fetcher())
+    return _scraper
+
+
+@worker_init.connect
+def init_worker(**kwargs):
+    """Expose metrics from the main worker process"""
+    if os.getenv("ENABLE_METRICS", "true").lower() == "true":
+        start_metrics_server()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Start the event loop, extraction workers and browsers when a worker process forks"""
+    get_event_loop()
+    
+    try:
+        run_async(get_extraction_executor().warm())
+    except Exception as e:
+        logger.error(f"Failed to start extraction workers: {e}")
+    
+    if os.getenv("BROWSER_POOL_PREWARM", "true").lower() != "true":
+        return
+    
+    try:
+        run_async(get_browser_pool().start())
+    except Exception as e:
+        # Scrapes still start the pool lazily on first use
+        logger.error(f"Failed to pre-launch browser pool: {e}", exc_info=True)
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Stop browsers and close the event loop when a worker process exits"""
+    global _loop, _browser_pool, _http_fetcher, _scraper
+    
+    mark_process_dead(os.getpid())
+    
+    if _loop is None or _loop.is_closed():
+        return
+    
+    try:
+        if _browser_pool:
+            run_async(_browser_pool.stop())
+        if _http_fetcher:
+            run_async(_http_fetcher.stop())
+        get_extraction_executor().shutdown()
+    except Exception as e:
+        logger.error(f"Error shutting down worker runtime: {e}")
+    finally:
+        _loop.close()
+        _loop = None
+        _browser_pool = None
+        _http_fetcher = None
+        _scraper = None